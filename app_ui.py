@@ -28,10 +28,12 @@ from fastapi.staticfiles import StaticFiles
 from jinja2 import Template
 
 from src.duoke import DuokeBot
+from src.tenants import TenantPool
 from src.config import settings
-from src.classifier import decide_reply
+from src.classifier import decide_reply, ReplyStream
 from src.rules import load_rules, save_rules
 from src.cases import export_to_excel
+from src import metrics
 from playwright.async_api import TimeoutError as PWTimeoutError
 
 # ===== Estado global simples =====
@@ -511,6 +513,12 @@ async def health_check() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics_snapshot() -> dict:
+    """Contadores e latências do bot (roteador de modelos, ciclos, etc.)."""
+    return metrics.snapshot()
+
+
 @app.get("/export-cases")
 async def export_cases():
     p = Path("data/atendimentos.csv")
@@ -825,7 +833,8 @@ async def _run_cycle(run_once: bool):
     _bot = DuokeBot()
 
     # Hook para UI ver o que foi lido e a resposta sugerida
-    async def hook(pairs, buyer_only, order_info=None) -> tuple[bool, str]:
+    # ``scope``: loja do bot (session_user_id), para casar as respostas aprovadas nela
+    async def hook(pairs, buyer_only, order_info=None, scope="") -> tuple[bool, str]:
         ws_broadcast(
             {
                 "snapshot": {
@@ -835,7 +844,18 @@ async def _run_cycle(run_once: bool):
                 }
             }
         )
-        should, reply = decide_reply(pairs, buyer_only, order_info)
+        # fora do laço: a chamada ao Gemini não trava o espelho nem as outras abas
+        should, reply = await asyncio.to_thread(
+            decide_reply, pairs, buyer_only, order_info, scope
+        )
+        if isinstance(reply, ReplyStream):
+            # Streaming: atualiza a resposta sugerida a cada trecho digitado
+            reply.on_update(
+                lambda st: ws_broadcast(
+                    {"snapshot": {"proposed": str(st), "running": True}}
+                )
+            )
+            return should, reply
         ws_broadcast(
             {
                 "snapshot": {
@@ -904,6 +924,36 @@ async def status():
     return {"running": RUNNING, "last_error": LAST_ERR}
 
 
+# ===== Várias lojas (sessões do cofre), independente do bot único acima =====
+_pool: Optional[TenantPool] = None
+_pool_task: Optional[asyncio.Task] = None
+
+
+@app.post("/tenants/start")
+async def tenants_start():
+    global _pool, _pool_task
+    if _pool_task and not _pool_task.done():
+        return JSONResponse({"ok": True, "running": True})
+    _pool = TenantPool(decide_reply)
+    _pool_task = asyncio.create_task(_pool.run_forever())
+    log("[UI] pool de lojas iniciado.")
+    return JSONResponse({"ok": True, "running": True})
+
+
+@app.post("/tenants/stop")
+async def tenants_stop():
+    if _pool:
+        _pool.request_stop()
+        log("[UI] pool de lojas encerrando após as conversas em andamento.")
+    return JSONResponse({"ok": True})
+
+
+@app.get("/tenants/status")
+async def tenants_status():
+    running = bool(_pool_task and not _pool_task.done())
+    return {"running": running, "tenants": _pool.status() if _pool else []}
+
+
 # Ações manuais da UI (enviar/pular)
 @app.post("/action/send")
 async def action_send(req: Request):
@@ -914,6 +964,9 @@ async def action_send(req: Request):
     if page and bot and txt:
         try:
             await bot.send_reply(page, txt)
+            # resposta aprovada manualmente alimenta o índice de templates
+            buyer_only, order_info = bot.last_context
+            bot.remember_reply(buyer_only, txt, order_info)
             ws_broadcast({"snapshot": {"last_action": "sent"}})
             log("[UI] resposta enviada manualmente.")
         except Exception as e:
@@ -990,6 +1043,8 @@ async def action_take_control():
     bot = _bot
     if bot:
         bot.pause_event.clear()
+        # o operador decide os próprios modais (ex.: confirmar reembolso)
+        await bot.set_modal_guard(False)
     MANUAL = True
     log("[UI] controle manual ativado.")
     return JSONResponse({"ok": True})
@@ -1000,6 +1055,7 @@ async def action_release_control():
     global MANUAL
     bot = _bot
     if bot:
+        await bot.set_modal_guard(True)
         bot.pause_event.set()
     MANUAL = False
     log("[UI] controle manual desativado.")
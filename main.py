@@ -1,9 +1,7 @@
-import os
 import json
 import base64
 import uuid
 import asyncio
-from pathlib import Path
 from typing import Dict, Optional
 
 # Importações do FastAPI para criar o servidor web e definir as rotas
@@ -16,52 +14,13 @@ from playwright.async_api import async_playwright, TimeoutError as PWTimeoutErro
 # Configurações compartilhadas
 from src.config import settings
 
-# Importações de Criptografia para garantir a segurança da sessão
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+# Sessões cifradas (AES-GCM) ficam no cofre compartilhado com o bot
+from src.session_vault import delete_session, save_session, session_path
 
 # ===== Configurações da Aplicação =====
-SESS_DIR = Path("sessions")  # Diretório para armazenar os arquivos de sessão
-SESS_DIR.mkdir(exist_ok=True)
-SECRET = os.getenv(
-    "SESSION_ENC_SECRET", "troque-isto-no-render"
-)  # Chave secreta para criptografia
 LOGIN_WAIT_TIMEOUT = 180000  # Tempo máximo de espera para o login (em ms)
 
 
-# ===== Funções de Criptografia para salvar a sessão do Playwright de forma segura =====
-def _derive_key(secret: str, salt: bytes) -> bytes:
-    """Deriva uma chave segura a partir de uma senha e um sal usando PBKDF2."""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(), length=32, salt=salt, iterations=100_000
-    )
-    return kdf.derive(secret.encode("utf-8"))
-
-
-def encrypt_bytes(data: bytes, secret: str) -> bytes:
-    """Criptografa dados usando AES-GCM. Retorna o sal, IV e o texto cifrado."""
-    salt = os.urandom(16)
-    key = _derive_key(secret, salt)
-    aes = AESGCM(key)
-    iv = os.urandom(12)
-    ct = aes.encrypt(iv, data, None)
-    return salt + iv + ct
-
-
-def decrypt_bytes(packed: bytes, secret: str) -> bytes:
-    """Descriptografa dados empacotados pelo `encrypt_bytes`."""
-    salt, iv, ct = packed[:16], packed[16:28], packed[28:]
-    key = _derive_key(secret, salt)
-    aes = AESGCM(key)
-    return aes.decrypt(iv, ct, None)
-
-
-def session_path(user_id: str) -> Path:
-    """Gera o caminho do arquivo de sessão para um dado user_id."""
-    return SESS_DIR / f"{user_id}.bin"
-
-
 # ===== Estado de login pendente (em memória, com TTL) =====
 # Isso é usado para manter o estado entre as duas requisições (iniciar e enviar código)
 class Pending:
@@ -202,11 +161,7 @@ async def duoke_login_start(
         # Tenta detectar o dashboard imediatamente (se o 2FA não for necessário)
         try:
             await page.wait_for_load_state("networkidle", timeout=4000)
-            tmp = Path("storage_state.json")
-            await ctx.storage_state(path=str(tmp))
-            enc = encrypt_bytes(tmp.read_bytes(), SECRET)
-            session_path(user_id).write_bytes(enc)
-            tmp.unlink(missing_ok=True)
+            save_session(user_id, await ctx.storage_state())
             return JSONResponse(
                 {
                     "ok": True,
@@ -288,11 +243,7 @@ async def duoke_login_code(
 
         # Espera o dashboard carregar e salva a sessão
         await page.wait_for_load_state("networkidle", timeout=LOGIN_WAIT_TIMEOUT)
-        tmp = Path("storage_state.json")
-        await ctx.storage_state(path=str(tmp))
-        enc = encrypt_bytes(tmp.read_bytes(), SECRET)
-        session_path(user_id).write_bytes(enc)
-        tmp.unlink(missing_ok=True)
+        save_session(user_id, await ctx.storage_state())
 
         # Encerra o navegador e remove a tentativa pendente
         await browser.close()
@@ -318,7 +269,5 @@ def duoke_status(user_id: str):
 # Rota para fazer logout
 @app.post("/duoke/logout")
 def duoke_logout(user_id: str):
-    p = session_path(user_id)
-    if p.exists():
-        p.unlink()
+    delete_session(user_id)
     return {"ok": True}
@@ -0,0 +1,305 @@
+# src/bench.py
+"""
+Benchmarks locais (sem IA).
+
+    python -m src.bench refine    # gatilho e custo do manager_critic x single
+    python -m src.bench snapshot  # memória por conversa: dict antigo x OrderInfo
+    python -m src.bench pageload  # carga da página e CPU do Python por modo de bloqueio
+    python -m src.bench tabs      # vazão por nº de abas com decisão que bloqueia (LLM simulado)
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from .config import settings
+from .prompt_sections import parse_sections
+from .rules import load_rules
+
+
+def _known_good_replies() -> list[tuple[str, str]]:
+    """Respostas já aprovadas (catálogo do prompt + regras) com o estágio em que valem."""
+    out: list[tuple[str, str]] = []
+    for sec in parse_sections(settings.base_prompt):
+        if sec.reply:
+            stage = sorted(sec.stages)[0] if sec.stages else "desconhecido"
+            out.append((sec.reply, stage))
+    for rule in load_rules():
+        if isinstance(rule.get("reply"), str) and rule["reply"].strip():
+            out.append((rule["reply"], "desconhecido"))
+    return out
+
+
+# pedido da conversa simulada e um número de outro pedido (erro do modelo)
+BENCH_ORDER_ID = "240501ABCD1234"
+OTHER_ORDER_ID = "240417WXYZ9876"
+
+
+def _known_bad_replies(good: list[tuple[str, str]]) -> list[tuple[str, str, str]]:
+    """Rascunhos com defeitos conhecidos derivados dos bons: (categoria, texto, estágio)."""
+    from .refine import DEFAULT_MAX_CHARS
+
+    limit = settings.refine_max_chars or DEFAULT_MAX_CHARS
+    out: list[tuple[str, str, str]] = []
+    for text, stage in good:
+        out.append(("longo", " ".join([text] * (limit // max(1, len(text)) + 2)), stage))
+        out.append(("pedido_errado", f"{text} Seu pedido {OTHER_ORDER_ID} já foi separado.", stage))
+        out.append(("placeholder", f"Olá {{nome}}! {text}", stage))
+    return out
+
+
+def bench_refine(rounds: int, critic_ms: float, use_gemini: bool) -> None:
+    from .gemini_client import critique_reply
+    from .refine import local_issues
+
+    good = _known_good_replies()
+    samples = [("bom", text, stage) for text, stage in good] + _known_bad_replies(good)
+    flagged: dict[str, int] = {}
+    totals: dict[str, int] = {}
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for cat, text, stage in samples:
+            totals[cat] = totals.get(cat, 0) + 1
+            if local_issues(text, stage, BENCH_ORDER_ID):
+                flagged[cat] = flagged.get(cat, 0) + 1
+    dt = time.perf_counter() - t0
+    n = rounds * len(samples)
+    check_ms = 1000 * dt / max(1, n)
+    print(
+        f"[BENCH] refine: {len(good)} respostas boas + {len(samples) - len(good)} ruins "
+        f"x {rounds} rodadas"
+    )
+    print(f"[BENCH] checagens locais: {1000 * check_ms:.1f} µs/rascunho")
+    print("[BENCH] acionariam o crítico:")
+    for cat in totals:
+        print(f"  {cat:<14} {flagged.get(cat, 0) / totals[cat]:.1%}")
+    for cat, text, stage in samples:
+        if cat == "bom" and local_issues(text, stage, BENCH_ORDER_ID):
+            print(f"  - falso positivo {text[:60]!r}: {local_issues(text, stage, BENCH_ORDER_ID)}")
+        elif cat != "bom" and not local_issues(text, stage, BENCH_ORDER_ID):
+            print(f"  - {cat} passou direto: {text[:60]!r}")
+
+    # custo por rascunho: single = 1 chamada; manager_critic = 1 + crítico quando acionado
+    if use_gemini and settings.gemini_api_key:
+        hits = [(t, s) for c, t, s in samples if c != "bom"][:5]
+        t1 = time.perf_counter()
+        for text, stage in hits:
+            critique_reply(text, local_issues(text, stage, BENCH_ORDER_ID), "", stage)
+        critic_ms = 1000 * (time.perf_counter() - t1) / max(1, len(hits))
+        origem = f"medido no Gemini ({len(hits)} chamadas)"
+    else:
+        origem = "estimado (--critico-ms)"
+    for label, cats in (("respostas boas", ["bom"]), ("todas", list(totals))):
+        total = sum(totals[c] for c in cats)
+        rate = sum(flagged.get(c, 0) for c in cats) / max(1, total)
+        extra = check_ms + rate * critic_ms
+        print(
+            f"[BENCH] manager_critic x single ({label}): +{rate:.2f} chamadas/rascunho, "
+            f"+{extra:.1f} ms/rascunho (crítico {critic_ms:.0f} ms, {origem})"
+        )
+
+
+def _fake_scrape(i: int) -> dict:
+    """Dict no formato dos extratores, com o mapa ``fields`` de todo o painel."""
+    fields = {f"Rótulo {k}": f"valor {k} da conversa {i}" for k in range(80)}
+    fields.update({"Payment Time": "2024-05-01 10:00", "Logistics Status": "Shipped"})
+    return {
+        "status": "Shipped",
+        "orderId": f"2405{i:08d}ABC",
+        "buyer_name": f"comprador{i}",
+        "title": "Kit Painel Meia Lua + Cilindros",
+        "variation": "Rosa",
+        "sku": f"SKU-{i % 50}",
+        "products": [{"title": "Kit", "variation": "Rosa", "sku": f"SKU-{i % 50}"}],
+        "fields": fields,
+        "status_consolidado": "Shipped",
+        "logistics_latest_desc": "",
+    }
+
+
+def _measure(build, n: int) -> tuple[int, float]:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    keep = [build(i) for i in range(n)]
+    dt = time.perf_counter() - t0
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return retained, dt
+
+
+def bench_snapshot(n: int) -> None:
+    from .conversation import ConversationSnapshot, OrderInfo
+
+    pairs = [("buyer", f"mensagem {k} do comprador") for k in range(30)]
+    product = {"nome": "Kit", "sku": "SKU-1", "descricao": "x" * 200, "medidas": "1m"}
+
+    def old_style(i):
+        # dict solto + cópias em decide_reply/_build_prompt + visões montadas na hora
+        info = _fake_scrape(i)
+        all_pairs = list(pairs)
+        recent = all_pairs[-16:]
+        buyer_only = [t for r, t in recent if r == "buyer"][-8:]
+        info["history_block"] = "\n".join(f"Comprador: {t}" for _, t in recent)
+        info = dict(info)
+        info["product_info"] = product
+        info = dict(info)
+        return info, buyer_only
+
+    def new_style(i):
+        order = OrderInfo.from_scrape(_fake_scrape(i))
+        snap = ConversationSnapshot(i, order, list(pairs), 8)
+        snap.buyer_only
+        order["product_info"] = product
+        return snap
+
+    old_mem, old_dt = _measure(old_style, n)
+    new_mem, new_dt = _measure(new_style, n)
+    print(f"[BENCH] snapshot: {n} conversas (memória retida, tracemalloc)")
+    for label, mem, dt in (("dict antigo", old_mem, old_dt), ("OrderInfo", new_mem, new_dt)):
+        print(f"[BENCH] {label:<12} {mem / n / 1024:.1f} KiB/conversa, {1e6 * dt / n:.0f} µs")
+
+
+async def _legacy_route(ctx, counts: dict) -> None:
+    """Rota antiga: toda requisição passa pelo Python (continue_/abort)."""
+
+    async def handler(route):
+        counts["handler"] += 1
+        req = route.request
+        try:
+            if req.resource_type in {"media"} or "analytics" in req.url.lower():
+                await route.abort()
+            else:
+                await route.continue_()
+        except Exception:
+            pass
+
+    await ctx.route("**/*", handler)
+
+
+async def _pageload_run(browser, url: str, mode: str, storage_state) -> dict:
+    from . import blocking
+
+    counts = {"handler": 0, "requests": 0}
+    ctx = await browser.new_context(storage_state=storage_state)
+    try:
+        if mode == "antigo":
+            await _legacy_route(ctx, counts)
+        elif mode != "nenhum":
+            await blocking.install(ctx, mode)
+        page = await ctx.new_page()
+
+        def on_request(_req):
+            counts["requests"] += 1
+
+        page.on("request", on_request)
+        cpu0, t0 = time.process_time(), time.perf_counter()
+        await page.goto(url, wait_until="load", timeout=settings.goto_timeout_ms)
+        counts["wall"] = time.perf_counter() - t0
+        counts["cpu"] = time.process_time() - cpu0
+        return counts
+    finally:
+        await ctx.close()
+
+
+async def _bench_pageload(url: str, runs: int, modes: list) -> None:
+    from playwright.async_api import async_playwright
+
+    from .session_vault import load_storage_state
+
+    storage = load_storage_state(settings.session_user_id)
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            print(f"[BENCH] pageload: {url} ({runs} cargas por modo, sessão={'sim' if storage else 'não'})")
+            for mode in modes:
+                results = [await _pageload_run(browser, url, mode, storage) for _ in range(runs)]
+                wall = sorted(r["wall"] for r in results)[len(results) // 2]
+
+                def avg(key):
+                    return sum(r[key] for r in results) / len(results)
+
+                print(
+                    f"[BENCH] {mode:<7} carga p50 {1000 * wall:.0f} ms, "
+                    f"CPU Python {1000 * avg('cpu'):.0f} ms/carga, "
+                    f"{avg('requests'):.0f} requisições ({avg('handler'):.0f} pelo handler Python)"
+                )
+        finally:
+            await browser.close()
+
+
+def bench_pageload(url: str, runs: int, modes: list) -> None:
+    asyncio.run(_bench_pageload(url, runs, modes))
+
+
+async def _tabs_run(tabs: int, convs: int, page_ms: float, llm_ms: float, offload: bool) -> float:
+    """Varredura simulada: ``page_ms`` de espera assíncrona + decisão bloqueante."""
+
+    def decide(_i):
+        time.sleep(llm_ms / 1000)  # chamada síncrona ao Gemini
+        return True, "ok"
+
+    queue = iter(range(convs))
+
+    async def worker():
+        for i in queue:
+            await asyncio.sleep(page_ms / 1000)  # abrir conversa/ler painel
+            if offload:
+                await asyncio.to_thread(decide, i)
+            else:
+                decide(i)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(tabs)))
+    return time.perf_counter() - t0
+
+
+def bench_tabs(convs: int, page_ms: float, llm_ms: float, max_tabs: int) -> None:
+    print(
+        f"[BENCH] tabs: {convs} conversas, {page_ms:.0f} ms de página + "
+        f"{llm_ms:.0f} ms de decisão bloqueante (time.sleep)"
+    )
+    for tabs in range(1, max_tabs + 1):
+        inline = asyncio.run(_tabs_run(tabs, convs, page_ms, llm_ms, False))
+        thread = asyncio.run(_tabs_run(tabs, convs, page_ms, llm_ms, True))
+        print(
+            f"[BENCH] {tabs} aba(s): no laço {inline:.2f}s "
+            f"({60 * convs / inline:.0f}/min), em thread {thread:.2f}s "
+            f"({60 * convs / thread:.0f}/min)"
+        )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m src.bench")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_ref = sub.add_parser("refine", help="custo das checagens locais do refino")
+    p_ref.add_argument("--rounds", type=int, default=200)
+    p_ref.add_argument("--critico-ms", type=float, default=900.0, help="latência estimada do crítico")
+    p_ref.add_argument("--gemini", action="store_true", help="mede o crítico com chamadas reais")
+    p_snap = sub.add_parser("snapshot", help="memória por conversa (tracemalloc)")
+    p_snap.add_argument("--conversas", type=int, default=500)
+    p_load = sub.add_parser("pageload", help="carga da página por modo de bloqueio (Chromium)")
+    p_load.add_argument("--url", default=settings.douke_url)
+    p_load.add_argument("--cargas", type=int, default=5)
+    p_load.add_argument(
+        "--modos", default="antigo,rota,cdp,nenhum", help="antigo | rota | cdp | nenhum"
+    )
+    p_tabs = sub.add_parser("tabs", help="vazão por nº de abas com decisão bloqueante")
+    p_tabs.add_argument("--conversas", type=int, default=30)
+    p_tabs.add_argument("--pagina-ms", type=float, default=50.0)
+    p_tabs.add_argument("--llm-ms", type=float, default=200.0)
+    p_tabs.add_argument("--abas", type=int, default=4)
+    args = ap.parse_args()
+
+    if args.cmd == "refine":
+        bench_refine(args.rounds, args.critico_ms, args.gemini)
+    elif args.cmd == "snapshot":
+        bench_snapshot(args.conversas)
+    elif args.cmd == "pageload":
+        bench_pageload(args.url, args.cargas, [m.strip() for m in args.modos.split(",") if m.strip()])
+    elif args.cmd == "tabs":
+        bench_tabs(args.conversas, args.pagina_ms, args.llm_ms, args.abas)
+
+
+if __name__ == "__main__":
+    main()
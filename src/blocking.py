@@ -0,0 +1,77 @@
+# src/blocking.py
+"""
+Bloqueio declarativo de requisições do app.
+
+Só as URLs bloqueadas passam pelo Python; o resto carrega direto no
+navegador (sem ``ctx.route("**/*")`` devolvendo cada requisição com
+``continue_()``). Padrões em ``config/network.json`` (``block``), no formato
+curinga do CDP (``*``):
+
+- ``always``: analytics e mídia;
+- ``images`` / ``fonts``: só com ``block_images`` / ``block_fonts``.
+
+Modos (``block_mode``):
+
+- ``rota``: uma rota por regex só para os padrões bloqueados (aborta);
+- ``cdp``: ``Network.setBlockedURLs`` por aba, sem nenhuma rota. Só Chromium;
+  as primeiras requisições de uma aba nova podem escapar antes de aplicar.
+"""
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+import re
+from typing import List, Optional
+
+from . import metrics
+from .config import settings
+from .net_capture import NET_CONFIG
+
+
+def blocked_patterns(config: dict = NET_CONFIG) -> List[str]:
+    block = config.get("block") or {}
+    patterns = list(block.get("always") or ())
+    if settings.block_images:
+        patterns += block.get("images") or ()
+    if settings.block_fonts:
+        patterns += block.get("fonts") or ()
+    return patterns
+
+
+def patterns_regex(patterns: List[str]) -> Optional[re.Pattern]:
+    """Curingas do CDP -> uma regex (sem diferenciar maiúsculas)."""
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns), re.I)
+
+
+async def _abort(route) -> None:
+    metrics.incr("block.aborted")
+    try:
+        await route.abort()
+    except Exception:
+        pass
+
+
+async def _block_page(ctx, page, patterns: List[str]) -> None:
+    try:
+        cdp = await ctx.new_cdp_session(page)
+        await cdp.send("Network.enable")
+        await cdp.send("Network.setBlockedURLs", {"urls": patterns})
+    except Exception as e:
+        print(f"[DEBUG] bloqueio via CDP indisponível nesta aba: {e}")
+
+
+async def install(ctx, mode: Optional[str] = None) -> str:
+    """Instala o bloqueio no contexto; retorna o modo usado."""
+    patterns = blocked_patterns()
+    if not patterns:
+        return "nenhum"
+    mode = (mode or settings.block_mode).lower()
+    if mode == "cdp":
+        for page in ctx.pages:
+            await _block_page(ctx, page, patterns)
+        ctx.on("page", lambda page: asyncio.ensure_future(_block_page(ctx, page, patterns)))
+        return "cdp"
+    await ctx.route(patterns_regex(patterns), _abort)
+    return "rota"
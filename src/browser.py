@@ -0,0 +1,159 @@
+# src/browser.py
+"""
+Lançamento do Chromium.
+
+- ``persistente``: ``launch_persistent_context`` no perfil pw-user-data (um
+  contexto por processo). Os caches do perfil são podados quando ele passa de
+  ``settings.profile_max_mb``.
+- ``compartilhado``: um único ``chromium.launch()`` por processo e contextos
+  leves ``new_context(storage_state=...)``; nada é gravado em disco além da
+  sessão, e vários contextos podem rodar lado a lado no mesmo navegador.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from . import metrics
+from .config import settings
+
+PROFILE_DIR = Path(__file__).resolve().parents[1] / "pw-user-data"
+
+LAUNCH_ARGS = [
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+]
+VIEWPORT = {"width": 1366, "height": 768}
+
+# Subpastas do perfil que são só cache (cookies/localStorage ficam intactos)
+CACHE_DIRS = (
+    "Cache",
+    "Code Cache",
+    "GPUCache",
+    "GrShaderCache",
+    "ShaderCache",
+    "Service Worker/CacheStorage",
+    "Service Worker/ScriptCache",
+)
+
+
+def headless() -> bool:
+    # HEADLESS=1 (padrão) para servidores sem display; HEADLESS=0 no dev local
+    return os.getenv("HEADLESS", "1").lower() not in {"0", "false", "no"}
+
+
+def shared_mode(mode: Optional[str] = None) -> bool:
+    return (mode or settings.browser_mode) in {"compartilhado", "shared"}
+
+
+# ---------- poda do perfil persistente ----------
+
+
+def dir_size_mb(path: Path) -> float:
+    total = 0
+    for f in path.rglob("*"):
+        try:
+            if f.is_file():
+                total += f.stat().st_size
+        except OSError:
+            pass
+    return total / (1024 * 1024)
+
+
+def prune_profile(profile_dir: Path = PROFILE_DIR, max_mb: Optional[int] = None) -> float:
+    """Apaga os caches do perfil se ele passou de ``max_mb``. Retorna os MB liberados."""
+    limit = settings.profile_max_mb if max_mb is None else max_mb
+    if limit <= 0 or not profile_dir.exists():
+        return 0.0
+    size = dir_size_mb(profile_dir)
+    metrics.gauge("browser.profile_mb", round(size, 1))
+    if size <= limit:
+        return 0.0
+    # o cache fica em <perfil>/Default/... (e em outros perfis, se houver)
+    for base in [profile_dir, *(d for d in profile_dir.iterdir() if d.is_dir())]:
+        for name in CACHE_DIRS:
+            shutil.rmtree(base / name, ignore_errors=True)
+    freed = size - dir_size_mb(profile_dir)
+    metrics.incr("browser.profile_pruned")
+    metrics.gauge("browser.profile_mb", round(size - freed, 1))
+    print(f"[DEBUG] perfil podado: {size:.0f} MB -> {size - freed:.0f} MB")
+    return freed
+
+
+async def launch_persistent(p):
+    PROFILE_DIR.mkdir(exist_ok=True)
+    try:
+        prune_profile()
+    except Exception as e:
+        print(f"[DEBUG] falha ao podar perfil: {e}")
+    with metrics.timer("browser.launch"):
+        return await p.chromium.launch_persistent_context(
+            user_data_dir=str(PROFILE_DIR),
+            headless=headless(),
+            ignore_https_errors=True,
+            viewport=VIEWPORT,
+            args=LAUNCH_ARGS,
+        )
+
+
+# ---------- navegador compartilhado ----------
+
+
+class SharedBrowser:
+    """
+    Um ``chromium.launch()`` por instância do Playwright, reaberto se cair.
+
+    Cada dono tem a sua instância (``SHARED_BROWSER`` para o bot único, uma
+    por ``TenantPool``); ``close`` derruba todos os contextos dela.
+    """
+
+    def __init__(self):
+        self._browser = None
+        self._owner = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, p):
+        async with self._lock:
+            if self._browser is None or self._owner is not p or not self._browser.is_connected():
+                if self._browser is not None:
+                    # outro Playwright (execução anterior) ou navegador caído:
+                    # fecha antes de relançar, para não deixar Chromium órfão
+                    try:
+                        await self._browser.close()
+                    except Exception:
+                        pass
+                with metrics.timer("browser.launch"):
+                    self._browser = await p.chromium.launch(
+                        headless=headless(), args=LAUNCH_ARGS
+                    )
+                self._owner = p
+            return self._browser
+
+    async def new_context(self, p, storage_state: Optional[dict] = None):
+        browser = await self.get(p)
+        with metrics.timer("browser.context"):
+            ctx = await browser.new_context(
+                storage_state=storage_state,
+                ignore_https_errors=True,
+                viewport=VIEWPORT,
+            )
+        metrics.gauge("browser.contexts", len(browser.contexts))
+        return ctx
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception:
+                    pass
+            self._browser = None
+            self._owner = None
+
+
+# Instância do bot único (CLI/UI); o pool de lojas usa a sua
+SHARED_BROWSER = SharedBrowser()
@@ -6,6 +6,7 @@ from typing import Any, Dict, List
 from openpyxl import Workbook
 
 from .firebase_client import save_case_document
+from .textnorm import normalize
 
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
@@ -47,15 +48,11 @@ def _ensure_label_header():
             csv.writer(f).writerow(LABEL_HEADER)
 
 
+# Termos sem acento: a comparação usa ``textnorm.fold`` ("peça" casa "peca")
 TRIGGERS = {
     "reembolso parcial": ["reembolso parcial"],
-    "enviar nova peça": ["nova peça", "nova peca"],
-    "enviar peça faltante": [
-        "peça faltante",
-        "peca faltante",
-        "peça faltando",
-        "peca faltando",
-    ],
+    "enviar nova peça": ["nova peca"],
+    "enviar peça faltante": ["peca faltante", "peca faltando"],
 }
 
 
@@ -68,11 +65,10 @@ def infer_problema(buyer_msgs: List[str]) -> str:
     if not buyer_msgs:
         return ""
 
-    last = buyer_msgs[-1].strip().lower()
+    last = normalize(buyer_msgs[-1])
     for label, kws in TRIGGERS.items():
-        for kw in kws:
-            if kw in last:
-                return label
+        if last.has_any(kws):
+            return label
     return ""
 
 
@@ -1,12 +1,22 @@
 # classifier.py
 
 from __future__ import annotations
-from typing import List, Tuple
+from typing import AsyncIterator, Callable, List, Tuple
+import asyncio
 import re
+import time
 
-from .gemini_client import generate_reply
+from . import metrics
+from .gemini_client import clean_model_text, generate_reply, order_stage, stream_reply
 from .config import settings
+from .conversation import OrderInfo
 from .firebase_client import get_product_by_sku
+from .intent_model import FALLBACK, predict_intents
+from .refine import local_issues, refine_reply
+from .router import choose_route
+from .rules import rule_match_report
+from .template_index import TEMPLATE_INDEX
+from .textnorm import fold
 
 RESP_FALLBACK_CURTO = "Desculpe, não entendi muito bem sua mensagem. Você poderia explicar um pouco melhor para que eu consiga te ajudar?"
 
@@ -17,13 +27,8 @@ def _sanitize_reply(text: str) -> str:
     t = text.strip()
 
     # Se vier "Ação: skip (pular)" ou variações, devolve vazio
-    low = t.lower()
-    if (
-        low == "skip"
-        or "ação: skip" in low
-        or "acao: skip" in low
-        or "skip (pular)" in low
-    ):
+    low = fold(t)
+    if low == "skip" or "acao: skip" in low or "skip (pular)" in low:
         return ""
 
     # Remove rótulos tipo "ID:" e extrai só o conteúdo após "Resposta:"
@@ -38,19 +43,111 @@ def _sanitize_reply(text: str) -> str:
     return t
 
 
+# **negrito**, __negrito__ e *itálico* de templates.json (o chat não renderiza)
+MARKDOWN_RE = re.compile(r"(\*\*|__)(.+?)\1|(?<![\w*])\*(?!\s)([^*\n]+?)\*(?!\w)", re.S)
+
+
+def strip_markdown(text: str) -> str:
+    return MARKDOWN_RE.sub(lambda m: m.group(2) or m.group(3) or "", text or "")
+
+
+# Começos que podem virar "Ação: skip", "ID:" ou "Resposta:" — segura a digitação
+_HOLD_PREFIXES = ("ação", "acao", "skip", "id:", "resposta")
+
+
+def _streaming_safe_prefix(raw: str, hold_chars: int) -> str | None:
+    """Parte do texto parcial que já pode ser digitada (None = ainda ambíguo)."""
+    t = raw.lstrip().lstrip("\"'").lstrip()
+    if len(t) < hold_chars:
+        return None
+    low = t.lower()
+    if low.startswith(_HOLD_PREFIXES) or "skip" in low or "resposta:" in low:
+        return None
+    # não digita espaço/aspas finais: podem ser o fechamento da resposta
+    return t.rstrip().rstrip("\"'")
+
+
+class ReplyStream:
+    """
+    Resposta gerada em streaming.
+
+    ``deltas()`` entrega trechos já higienizados para digitar conforme chegam;
+    ao final ``text`` tem a resposta definitiva (após higienização/refino).
+    ``text`` vazio significa skip: quem digitou deve limpar a caixa e não enviar.
+    ``finalize`` (refino/crítico, síncrono) roda numa thread ao fim do stream.
+    ``metric``: duração da criação ao fim do refino (ex.: ``router.<tier>.latency``).
+    """
+
+    HOLD_CHARS = 24
+
+    def __init__(
+        self,
+        chunks: AsyncIterator[str],
+        finalize: Callable[[str], str],
+        metric: str = "",
+    ):
+        self._chunks = chunks
+        self._finalize = finalize
+        self._metric = metric
+        self._listeners: list[Callable[["ReplyStream"], None]] = []
+        self.raw = ""
+        self.typed = ""
+        self.text = ""
+        self.done = False
+        self.started_at = time.perf_counter()
+        self.first_delta_at: float | None = None
+
+    def __str__(self) -> str:
+        return self.text if self.done else self.typed
+
+    def on_update(self, cb: Callable[["ReplyStream"], None]) -> None:
+        self._listeners.append(cb)
+
+    def _notify(self) -> None:
+        for cb in self._listeners:
+            try:
+                cb(self)
+            except Exception:
+                pass
+
+    async def deltas(self):
+        async for chunk in self._chunks:
+            self.raw += chunk
+            safe = _streaming_safe_prefix(self.raw, self.HOLD_CHARS)
+            if not safe or len(safe) <= len(self.typed) or not safe.startswith(self.typed):
+                continue
+            delta = safe[len(self.typed) :]
+            self.typed = safe
+            if self.first_delta_at is None:
+                self.first_delta_at = time.perf_counter()
+                metrics.observe("stream.first_delta", self.first_delta_at - self.started_at)
+            self._notify()
+            yield delta
+
+        # o crítico chama o Gemini de forma síncrona: fora do laço das abas/lojas
+        final = await asyncio.to_thread(self._finalize, self.raw)
+        self.text = _sanitize_reply(final)
+        self.done = True
+        elapsed = time.perf_counter() - self.started_at
+        metrics.observe("stream.total", elapsed)
+        if self._metric:
+            metrics.observe(self._metric, elapsed)
+        self._notify()
+
+
+# Aplicadas sobre o texto normalizado (minúsculo, sem acento)
 ARCO = re.compile(
-    r"\b(arco|arcos|di[âa]metro do arco|tamanho do arco|montar menor|reduzir tamanho)\b",
-    re.I,
-)
-CIL = re.compile(
-    r"\b(cilindro|cilindros|trio compacto|cilindro pequeno|cilindro errado)\b", re.I
+    r"\b(arcos?|diametro do arco|tamanho do arco|montar menor|reduzir tamanho)\b"
 )
+CIL = re.compile(r"\b(cilindros?|trio compacto|cilindro pequeno|cilindro errado)\b")
 
 
 def intent_from_text(txt: str) -> str:
-    if ARCO.search(txt) and not CIL.search(txt):
+    t = fold(txt)
+    arco, cil = bool(ARCO.search(t)), bool(CIL.search(t))
+    if arco and not cil:
         return "arco_tamanho"
-    if CIL.search(txt) and not ARCO.search(txt):
+    if cil and not arco:
         return "cilindro_pequeno"
     return "fallback"
 
@@ -58,32 +155,120 @@ def intent_from_text(txt: str) -> str:
 def decide_reply(
     pairs: List[Tuple[str, str]],
     buyer_only: List[str],
-    order_info: dict | None = None,
-) -> Tuple[bool, str]:
-    """Decide se deve responder e retorna o rascunho (somente últimas N do comprador)."""
+    order_info: OrderInfo | dict | None = None,
+    scope: str = "",
+) -> Tuple[bool, "str | ReplyStream"]:
+    """Decide se deve responder e retorna o rascunho (somente últimas N do comprador).
+
+    Com ``settings.stream_replies`` a resposta volta como ``ReplyStream`` para
+    ser digitada enquanto é gerada; a decisão final (skip ou texto) sai ao fim do stream.
+    ``scope`` é a loja (``session_user_id``): só as respostas aprovadas nela
+    entram no índice de templates.
+    """
     depth = int(getattr(settings, "history_depth", 15) or 15)
 
     msgs = [m for m in (buyer_only or []) if m and m.strip()][-depth:]
     if not msgs:
         return False, ""
 
+    # Intenção (janela inteira + última mensagem, num só lote) + regras que casam
+    # orientam regras, templates, seções do prompt e o tier do modelo
+    buyer_text = " ".join(msgs)
+    with metrics.timer("intent.predict"):
+        predicted = predict_intents([buyer_text, msgs[-1]])
+    intents = {label for label, _ in predicted} | {intent_from_text(buyer_text)}
+    intents.discard(FALLBACK)
+    print(f"[DEBUG] intenção: {predicted}")
+    rule_hits, near_misses = rule_match_report(msgs, intents)
+    hints = {*(intents or {FALLBACK}), *rule_hits}
+
+    stage = order_stage(order_info)
+    order_id = (order_info.get("order_id") or "") if order_info else ""
+
+    # Pergunta comum com template de alta confiança: responde sem o LLM
+    if settings.template_index:
+        try:
+            hit = TEMPLATE_INDEX.match(msgs, stage, intents, scope=scope)
+        except Exception as e:
+            print(f"[DEBUG] índice de templates indisponível: {e}")
+            hit = None
+        if hit:
+            print(f"[DEBUG] template: {hit.key} score={hit.score:.3f} ('{hit.query}')")
+            # mesmas checagens locais de um rascunho do LLM; falhou, vai ao LLM
+            reply = _sanitize_reply(strip_markdown(hit.reply))
+            check = reply.replace("{ORDER_ID}", order_id) if order_id else reply
+            issues = local_issues(check, stage, order_id) if reply else ["resposta vazia"]
+            if not issues:
+                return True, reply
+            metrics.incr("templates.rejected")
+            print(f"[DEBUG] template descartado: {'; '.join(issues)}")
+
+    # Daqui em diante vai ao LLM: só agora monta histórico (resumo) e produto
     history = order_info.get("history_block") if order_info else None
     if not history:
         history = "\n".join(msgs)
 
-    # Busca dados do produto pelo SKU e injeta em order_info
+    # Busca dados do produto pelo SKU e injeta em order_info (mesmo objeto, sem cópia)
     sku = order_info.get("sku") if order_info else None
-    if sku:
+    if sku and not order_info.get("product_info"):
         prod = get_product_by_sku(sku)
         if prod:
-            order_info = dict(order_info or {})
             order_info["product_info"] = prod
 
-    # exemplo de uso do classificador regex (opcional)
-    _ = intent_from_text(" ".join(msgs))
+    # Roteia para o modelo leve ou forte conforme a complexidade
+    route = choose_route(
+        pairs,
+        msgs,
+        intents=hints,
+        stage=stage,
+        near_misses=near_misses,
+    )
+    print(f"[DEBUG] roteador: tier={route.tier} score={route.score} {route.reasons}")
+
+    if settings.stream_replies:
 
-    reply = generate_reply(history, order_info=order_info)
+        def _finalize(raw: str) -> str:
+            clean = _sanitize_reply(clean_model_text(raw))
+            if not clean:
+                return ""
+            return refine_reply(
+                clean,
+                stage=stage,
+                buyer_text=buyer_text,
+                model_name=route.model,
+                order_id=order_id,
+            )
+
+        chunks = stream_reply(
+            history,
+            order_info=order_info,
+            hints=hints,
+            buyer_text=buyer_text,
+            model_name=route.model,
+        )
+        # mesma métrica do caminho sem stream: stats por tier valem nos dois modos
+        return True, ReplyStream(chunks, _finalize, metric=f"router.{route.tier}.latency")
+
+    with metrics.timer(f"router.{route.tier}.latency"):
+        reply = generate_reply(
+            history,
+            order_info=order_info,
+            hints=hints,
+            buyer_text=buyer_text,
+            model_name=route.model,
+        )
     clean = _sanitize_reply(reply)
+    if clean:
+        # manager_critic: crítico só roda se o rascunho falhar nas checagens locais
+        clean = _sanitize_reply(
+            refine_reply(
+                clean,
+                stage=stage,
+                buyer_text=buyer_text,
+                model_name=route.model,
+                order_id=order_id,
+            )
+        )
     if clean:
         return True, clean
     return False, ""
@@ -27,6 +27,17 @@ class Settings(BaseModel):
     gemini_model: str = Field(
         default_factory=lambda: os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
     )
+    # modelo leve para conversas simples (vazio = sempre o modelo principal)
+    gemini_model_light: str = Field(
+        default_factory=lambda: os.getenv("GEMINI_MODEL_LIGHT", "gemini-1.5-flash-8b")
+    )
+    model_routing: bool = Field(
+        default_factory=lambda: os.getenv("MODEL_ROUTING", "sim").lower() in TRUE_SET
+    )
+    # score de complexidade a partir do qual usa o modelo principal
+    router_threshold: float = Field(
+        default_factory=lambda: float(os.getenv("ROUTER_THRESHOLD", "2"))
+    )
     gemini_temperature: float = Field(
         default_factory=lambda: float(os.getenv("GEMINI_TEMPERATURE", "0.2"))
     )
@@ -35,6 +46,59 @@ class Settings(BaseModel):
     )
     prompt_path: Path = Field(default_factory=_prompt_path)
     base_prompt: str = Field(default_factory=_prompt_text)
+    # envia só as seções do prompt relevantes (intenção + estágio do pedido)
+    prompt_sections: bool = Field(
+        default_factory=lambda: os.getenv("PROMPT_SECTIONS", "sim").lower()
+        in TRUE_SET
+    )
+    # gera em streaming e já digita na caixa do Duoke enquanto o texto chega
+    stream_replies: bool = Field(
+        default_factory=lambda: os.getenv("STREAM_REPLIES", "nao").lower()
+        in TRUE_SET
+    )
+    # índice vetorial de templates: responde perguntas comuns sem chamar o LLM
+    template_index: bool = Field(
+        default_factory=lambda: os.getenv("TEMPLATE_INDEX", "sim").lower()
+        in TRUE_SET
+    )
+    template_min_score: float = Field(
+        default_factory=lambda: float(os.getenv("TEMPLATE_MIN_SCORE", "0.8"))
+    )
+    template_max_approved: int = Field(
+        default_factory=lambda: int(os.getenv("TEMPLATE_MAX_APPROVED", "500"))
+    )
+    # classificador de intenção treinado (vazio = models/intent_vN.npz mais recente)
+    intent_model_path: str = Field(
+        default_factory=lambda: os.getenv("INTENT_MODEL_PATH", "")
+    )
+    intent_min_prob: float = Field(
+        default_factory=lambda: float(os.getenv("INTENT_MIN_PROB", "0.4"))
+    )
+    # estado por conversa (LRU + TTL, snapshot em SQLite)
+    state_max_conversations: int = Field(
+        default_factory=lambda: int(os.getenv("STATE_MAX_CONVERSATIONS", "5000"))
+    )
+    state_ttl_hours: float = Field(
+        default_factory=lambda: float(os.getenv("STATE_TTL_HOURS", "72"))
+    )
+    state_snapshot_seconds: float = Field(
+        default_factory=lambda: float(os.getenv("STATE_SNAPSHOT_SECONDS", "30"))
+    )
+    # relê só as mensagens novas de conversas já vistas (histórico em data/mensagens.sqlite3)
+    incremental_reads: bool = Field(
+        default_factory=lambda: os.getenv("INCREMENTAL_READS", "sim").lower()
+        in TRUE_SET
+    )
+    message_store_max_conversations: int = Field(
+        default_factory=lambda: int(os.getenv("MESSAGE_STORE_MAX_CONVERSATIONS", "2000"))
+    )
+    # linha que falha N vezes seguidas fica fora das varreduras por M minutos
+    quarantine_failures: int = Field(
+        default_factory=lambda: int(os.getenv("QUARANTINE_FAILURES", "3"))
+    )
+    quarantine_minutes: float = Field(
+        default_factory=lambda: float(os.getenv("QUARANTINE_MINUTES", "60"))
+    )
     # single | manager_critic
     refine_mode: str = Field(
         default_factory=lambda: os.getenv("REFINE_MODE", "manager_critic")
@@ -56,10 +120,28 @@ class Settings(BaseModel):
     history_depth: int = Field(
         default_factory=lambda: int(os.getenv("HISTORY_DEPTH", "20"))
     )
+    # varreduras rápidas só no filtro "Precisa responder"; a completa ("Todas",
+    # para os casos pendentes) roda a cada full_sweep_minutes
     apply_needs_reply_filter: bool = Field(
-        default_factory=lambda: os.getenv("APPLY_NEEDS_REPLY_FILTER", "nao").lower()
+        default_factory=lambda: os.getenv("APPLY_NEEDS_REPLY_FILTER", "sim").lower()
         in TRUE_SET
     )
+    full_sweep_minutes: float = Field(
+        default_factory=lambda: float(os.getenv("FULL_SWEEP_MINUTES", "10"))
+    )
+    # atende primeiro quem espera há mais tempo/urgente (senão, ordem da lista)
+    priority_queue: bool = Field(
+        default_factory=lambda: os.getenv("PRIORITY_QUEUE", "sim").lower() in TRUE_SET
+    )
+    # prazo de primeira resposta; estourado, a conversa vira "urgente"
+    sla_minutes: float = Field(
+        default_factory=lambda: float(os.getenv("SLA_MINUTES", "30"))
+    )
+    # prazo de cada varredura; esgotado, as conversas restantes ficam para a
+    # próxima (0 = sem prazo, só max_conversations)
+    sweep_budget_seconds: float = Field(
+        default_factory=lambda: float(os.getenv("SWEEP_BUDGET_SECONDS", "90"))
+    )
     loop_interval: int = Field(
         default_factory=lambda: int(os.getenv("LOOP_INTERVAL", "10"))
     )
@@ -73,6 +155,125 @@ class Settings(BaseModel):
         default_factory=lambda: int(os.getenv("GOTO_TIMEOUT_MS", "60000"))
     )
 
+    # --- Navegador ---
+    # persistente (perfil pw-user-data) | compartilhado (um chromium.launch() +
+    # contextos leves com storage_state)
+    browser_mode: str = Field(
+        default_factory=lambda: os.getenv("BROWSER_MODE", "persistente").lower()
+    )
+    # sessão cifrada (sessions/<id>.bin) usada no modo compartilhado; vazio = storage_state.json
+    session_user_id: str = Field(
+        default_factory=lambda: os.getenv("SESSION_USER_ID", "")
+    )
+    # perfil persistente acima disso tem os caches apagados antes de abrir (0 = nunca)
+    profile_max_mb: int = Field(
+        default_factory=lambda: int(os.getenv("PROFILE_MAX_MB", "300"))
+    )
+    # contexto efêmero (BROWSER_MODE=compartilhado) é recriado com a sessão
+    # regravada a cada N minutos (0 = nunca); o perfil persistente não é reciclado
+    context_recycle_minutes: float = Field(
+        default_factory=lambda: float(os.getenv("CONTEXT_RECYCLE_MINUTES", "60"))
+    )
+    # bloqueio de requisições: rota (só os padrões bloqueados) | cdp
+    # (Network.setBlockedURLs); imagens/fontes só se pedido
+    block_mode: str = Field(
+        default_factory=lambda: os.getenv("BLOCK_MODE", "rota").lower()
+    )
+    block_images: bool = Field(
+        default_factory=lambda: os.getenv("BLOCK_IMAGES", "nao").lower() in TRUE_SET
+    )
+    block_fonts: bool = Field(
+        default_factory=lambda: os.getenv("BLOCK_FONTS", "nao").lower() in TRUE_SET
+    )
+    # fecha avisos conhecidos (login expirado, anúncios) na própria página
+    # (init script) em vez de sondar com close_modal a cada navegação/login;
+    # desligado enquanto o operador está com o controle manual
+    modal_guard: bool = Field(
+        default_factory=lambda: os.getenv("MODAL_GUARD", "sim").lower() in TRUE_SET
+    )
+    # lê conversas/mensagens/pedido do JSON do app (DOM só como reserva);
+    # desligado até os padrões de config/network.json serem conferidos no
+    # tráfego real do Duoke
+    net_capture: bool = Field(
+        default_factory=lambda: os.getenv("NET_CAPTURE", "nao").lower() in TRUE_SET
+    )
+    # espera extra pelo JSON depois que a conversa abriu
+    net_capture_wait_ms: int = Field(
+        default_factory=lambda: int(os.getenv("NET_CAPTURE_WAIT_MS", "500"))
+    )
+    # MutationObserver na lista de conversas acorda o laço na hora; o
+    # intervalo fixo vira só uma varredura de segurança
+    event_wakeups: bool = Field(
+        default_factory=lambda: os.getenv("EVENT_WAKEUPS", "sim").lower() in TRUE_SET
+    )
+    safety_poll_seconds: float = Field(
+        default_factory=lambda: float(os.getenv("SAFETY_POLL_SECONDS", "60"))
+    )
+    wake_min_gap_seconds: float = Field(
+        default_factory=lambda: float(os.getenv("WAKE_MIN_GAP_SECONDS", "1"))
+    )
+    # vigia de memória entre ciclos: aba acima do heap/nós é recarregada;
+    # navegador acima da RSS (ou aba que não melhora) recria o contexto
+    watchdog: bool = Field(
+        default_factory=lambda: os.getenv("WATCHDOG", "sim").lower() in TRUE_SET
+    )
+    watchdog_heap_mb: float = Field(
+        default_factory=lambda: float(os.getenv("WATCHDOG_HEAP_MB", "400"))
+    )
+    watchdog_nodes: int = Field(
+        default_factory=lambda: int(os.getenv("WATCHDOG_NODES", "200000"))
+    )
+    watchdog_rss_mb: float = Field(
+        default_factory=lambda: float(os.getenv("WATCHDOG_RSS_MB", "2000"))
+    )
+    # abas paralelas no mesmo contexto logado (limitadas pela memória livre)
+    tabs: int = Field(default_factory=lambda: int(os.getenv("TABS", "1")))
+    # estimativa de memória por aba e folga mantida para o resto do processo
+    tab_memory_mb: float = Field(
+        default_factory=lambda: float(os.getenv("TAB_MEMORY_MB", "150"))
+    )
+    tab_memory_reserve_mb: float = Field(
+        default_factory=lambda: float(os.getenv("TAB_MEMORY_RESERVE_MB", "300"))
+    )
+    # validade da reserva de uma conversa por uma aba
+    tab_lease_seconds: float = Field(
+        default_factory=lambda: float(os.getenv("TAB_LEASE_SECONDS", "120"))
+    )
+
+    # --- Várias lojas num processo (python -m src.tenants) ---
+    # contextos abertos ao mesmo tempo (um por loja) e lojas varrendo em paralelo
+    tenant_max_contexts: int = Field(
+        default_factory=lambda: int(os.getenv("TENANT_MAX_CONTEXTS", "8"))
+    )
+    tenant_max_concurrent: int = Field(
+        default_factory=lambda: int(os.getenv("TENANT_MAX_CONCURRENT", "3"))
+    )
+    # intervalo entre varreduras da mesma loja e teto de conversas por varredura
+    tenant_interval_seconds: float = Field(
+        default_factory=lambda: float(os.getenv("TENANT_INTERVAL_SECONDS", "30"))
+    )
+    tenant_max_conversations: int = Field(
+        default_factory=lambda: int(os.getenv("TENANT_MAX_CONVERSATIONS", "20"))
+    )
+    # loja sem respostas há N minutos: contexto fechado e varredura espaçada
+    tenant_idle_minutes: float = Field(
+        default_factory=lambda: float(os.getenv("TENANT_IDLE_MINUTES", "15"))
+    )
+
+    # --- Resumo incremental de conversas longas ---
+    summary_enabled: bool = Field(
+        default_factory=lambda: os.getenv("SUMMARY_ENABLED", "sim").lower()
+        in TRUE_SET
+    )
+    # turnos mais recentes enviados literalmente ao modelo
+    summary_recent_turns: int = Field(
+        default_factory=lambda: int(os.getenv("SUMMARY_RECENT_TURNS", "8"))
+    )
+    # quantos turnos novos fora da janela disparam a atualização do resumo
+    summary_refresh_turns: int = Field(
+        default_factory=lambda: int(os.getenv("SUMMARY_REFRESH_TURNS", "6"))
+    )
+
 
     # --- Cloud Run / Servidor ---
     port: int = Field(default_factory=lambda: int(os.getenv("PORT", "8080")))
@@ -0,0 +1,228 @@
+# src/conversation.py
+"""
+Modelo compacto de uma conversa durante o ciclo.
+
+``OrderInfo`` substitui o dict solto de pedido: atributos em ``__slots__``,
+só os campos usados (o mapa ``fields`` do painel é reduzido aos rótulos
+conhecidos) e estágio calculado uma vez. Continua aceitando ``get``/``[]``/``in``
+com as chaves antigas (``orderId``, ``status_consolidado``…), então regras,
+prompt e registro de atendimentos recebem o mesmo objeto, sem cópias.
+
+``ConversationSnapshot`` agrupa pedido + mensagens e deriva sob demanda a
+visão só do comprador e o bloco de histórico.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+SHIPPED_TOKENS = (
+    "shipped",
+    "enviado",
+    "a caminho",
+    "in transit",
+    "out for delivery",
+    "despachado",
+)
+DELIVERED_TOKENS = ("delivered", "entregue", "completed", "finalizado", "concluído")
+
+# rótulos do painel (PT/EN) -> atributo; o resto do mapa ``fields`` é descartado
+FIELD_LABELS = {
+    "Payment Time": "payment_time",
+    "Hora do pagamento": "payment_time",
+    "Completed Time": "completed_time",
+    "Hora de conclusão": "completed_time",
+    "Logistics Status": "logistics_status",
+    "Status logístico": "logistics_status",
+    "Latest Logistics Description": "latest_desc",
+}
+
+# chaves antigas do dict -> atributo
+_ALIASES = {
+    "orderId": "order_id",
+    "latest_logistics_description": "latest_desc",
+    "logistics_latest_desc": "latest_desc",
+}
+
+Pairs = List[Tuple[str, str]]
+
+
+class OrderInfo:
+    __slots__ = (
+        "status",
+        "order_id",
+        "buyer_name",
+        "title",
+        "variation",
+        "sku",
+        "products",
+        "payment_time",
+        "completed_time",
+        "logistics_status",
+        "latest_desc",
+        "buyer_payment_amount",
+        "payment_method",
+        "shipping_provider",
+        "tracking_number",
+        "logistics_update_time",
+        "product_info",
+        "_history",
+        "_stage",
+    )
+
+    def __init__(self, **values: Any):
+        for name in self.__slots__:
+            object.__setattr__(self, name, None if name in _LAZY else "")
+        self.products = ()
+        for key, value in values.items():
+            self[key] = value
+
+    @classmethod
+    def from_scrape(cls, raw: Optional[Dict[str, Any]]) -> "OrderInfo":
+        """Converte o dict devolvido pelos extratores (uma vez por conversa)."""
+        info = cls()
+        for key, value in (raw or {}).items():
+            if key == "fields":
+                fields = value or {}
+                for label, attr in FIELD_LABELS.items():
+                    if fields.get(label) and not getattr(info, attr):
+                        setattr(info, attr, fields[label])
+            elif key == "products":
+                info.products = tuple(value or ())
+            elif _attr(key) in cls.__slots__:
+                info[key] = value
+        return info
+
+    # ---------- compatibilidade com o dict antigo ----------
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name != "_stage":
+            object.__setattr__(self, "_stage", None)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self[key] if key in self else None
+        return default if value in (None, "") else value
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "history_block":
+            return self.history_block
+        if key == "status_consolidado":
+            return self.status or self.logistics_status or "desconhecido"
+        attr = _attr(key)
+        if attr not in self.__slots__ or attr.startswith("_"):
+            raise KeyError(key)
+        return getattr(self, attr)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == "history_block":
+            self._history = value
+            return
+        attr = _attr(key)
+        if attr not in self.__slots__ or attr.startswith("_"):
+            raise KeyError(key)
+        setattr(self, attr, "" if value is None and attr not in _LAZY else value)
+
+    def __contains__(self, key: object) -> bool:
+        if key in ("history_block", "status_consolidado"):
+            return True
+        attr = _attr(str(key))
+        return attr in self.__slots__ and not attr.startswith("_")
+
+    def __bool__(self) -> bool:
+        return bool(self.order_id or self.status or self.buyer_name or self.sku or self.title)
+
+    def __repr__(self) -> str:
+        return (
+            f"OrderInfo(order_id={self.order_id!r}, status={self.status!r}, "
+            f"sku={self.sku!r}, stage={self.stage!r})"
+        )
+
+    # ---------- derivados ----------
+
+    @property
+    def history_block(self) -> str:
+        """Histórico para o prompt; calculado só quando alguém pede (ex.: o LLM)."""
+        if callable(self._history):
+            object.__setattr__(self, "_history", self._history() or "")
+        return self._history or ""
+
+    @property
+    def stage(self) -> str:
+        """pre_venda | pos_venda | enviado | entregue (cacheado até um campo mudar)."""
+        if self._stage is None:
+            object.__setattr__(self, "_stage", _compute_stage(self))
+        return self._stage
+
+
+_LAZY = {"product_info", "_history", "_stage"}
+
+
+def _attr(key: str) -> str:
+    return _ALIASES.get(key, key)
+
+
+def _compute_stage(info: OrderInfo) -> str:
+    st = (info.status or info.logistics_status or "").strip().lower()
+    if info.completed_time or any(tok in st for tok in DELIVERED_TOKENS):
+        return "entregue"
+    if any(tok in st for tok in SHIPPED_TOKENS) or "pedido entregue" in (
+        info.latest_desc or ""
+    ).lower():
+        return "enviado"
+    if (
+        info.order_id
+        or info.payment_time
+        or any(tok in st for tok in ("to ship", "ready to ship"))
+    ):
+        return "pos_venda"
+    return "pre_venda"
+
+
+def as_order_info(order_info: Union[OrderInfo, Dict[str, Any], None]) -> OrderInfo:
+    """Mesmo objeto se já for ``OrderInfo``; dicts antigos são convertidos."""
+    if isinstance(order_info, OrderInfo):
+        return order_info
+    return OrderInfo.from_scrape(order_info)
+
+
+class ConversationSnapshot:
+    """Uma conversa aberta: pedido + mensagens, com visões derivadas preguiçosas."""
+
+    __slots__ = ("index", "order", "all_pairs", "depth", "_pairs", "_buyer_only")
+
+    def __init__(self, index: int, order: OrderInfo, all_pairs: Pairs, depth: int):
+        self.index = index
+        self.order = order
+        self.all_pairs = all_pairs
+        self.depth = max(1, int(depth))
+        self._pairs: Optional[Pairs] = None
+        self._buyer_only: Optional[List[str]] = None
+
+    @property
+    def pairs(self) -> Pairs:
+        """Janela recente (``depth`` turnos de cada lado)."""
+        if self._pairs is None:
+            self._pairs = self.all_pairs[-self.depth * 2 :]
+        return self._pairs
+
+    @property
+    def buyer_only(self) -> List[str]:
+        if self._buyer_only is None:
+            self._buyer_only = [t for r, t in self.pairs if r == "buyer"][-self.depth :]
+        return self._buyer_only
+
+    @property
+    def stage(self) -> str:
+        return self.order.stage
+
+    @property
+    def conv_id(self) -> str:
+        return self.order.order_id or self.order.buyer_name or ""
+
+    def set_history(self, factory: Callable[[], str]) -> None:
+        """Registra como montar o histórico; só roda se alguém ler ``history_block``."""
+        self.order["history_block"] = factory
+
+    @property
+    def history_block(self) -> str:
+        return self.order.history_block
@@ -13,13 +13,27 @@ from playwright.async_api import (
     Error as PwError,
     TimeoutError as PWTimeoutError,
 )
+from . import blocking, metrics, waits
+from .browser import SHARED_BROWSER, SharedBrowser, launch_persistent, shared_mode
 from .config import settings
-from .classifier import RESP_FALLBACK_CURTO
+from .classifier import RESP_FALLBACK_CURTO, ReplyStream
+from .conversation import FIELD_LABELS, ConversationSnapshot, OrderInfo
 from .cases import (
     append_row as log_case,
     append_label as log_label,
     infer_problema,
 )
+from .gemini_client import order_stage
+from .message_store import MESSAGES
+from .net_capture import NetworkCapture, ident
+from .priority import Prioritizer, SweepBudget
+from .session_vault import load_storage_state, store_storage_state
+from .state_store import STATE, conversation_key
+from .tabs import LeaseTable, TabStats, tab_budget
+from .watchdog import MemoryWatchdog
+from .summaries import SUMMARIES, format_turns
+from .textnorm import fold
+from .template_index import TEMPLATE_INDEX
 
 # Carrega seletores configuráveis
 SEL = json.loads(
@@ -28,29 +42,15 @@ SEL = json.loads(
     )
 )
 
+# Aplicado sobre o texto já normalizado (sem acento): "peça"/"peca" e "peças"/"pecas"
 WANTS_PARTS_RE = re.compile(
-    r"(quero|prefiro|pode|manda|mandar|envia|enviar|me envia|me mandar).{0,25}(peça|peças|pecas|as peças|as pecas|a peça|a peca)",
-    re.I,
+    r"(quero|prefiro|pode|manda|mandar|envia|enviar|me envia|me mandar).{0,25}\bpecas?\b"
 )
 
 
 def buyer_wants_missing_parts(text: str) -> bool:
-    t = (text or "").strip().lower()
-    if not t:
-        return False
-    if WANTS_PARTS_RE.search(t):
-        return True
-    simples = [
-        "quero as peças",
-        "pode enviar as peças",
-        "prefiro as peças",
-        "pode mandar as peças",
-        "quero receber a peça",
-        "manda a peça",
-        "envia as peças",
-        "prefiro receber a peça",
-    ]
-    return any(s in t for s in simples)
+    t = fold(text)
+    return bool(t) and bool(WANTS_PARTS_RE.search(t))
 
 
 async def safe_text(locator):
@@ -166,6 +166,184 @@ CONFIRM_RE = re.compile(
 )
 
 
+CHAT_ITEM_SEL = SEL.get("chat_list_item", "ul.chat_list li")
+# Nome da conversa = 1ª linha de texto da linha (mesma chave dos avisos da página)
+ROW_KEYS_JS = "(els) => els.map(el => ((el.innerText || '').trim().split('\\n')[0] || '').trim())"
+MESSAGE_ITEM_SEL = "ul.message_main > li"
+
+# li -> [role, texto] (null para sistema/vazio)
+MESSAGE_PAIR_JS = """
+(li) => {
+  const cls = (li.className || '').toLowerCase();
+  const role = cls.includes('lt') ? 'buyer' : (cls.includes('rt') ? 'seller' : 'system');
+  const txtNode = li.querySelector('div.text_cont, .bubble .text, .record_item .content');
+  const txt = (txtNode?.innerText || '').trim();
+  return txt && role !== 'system' ? [role, txt] : null;
+}
+"""
+
+# Percorre as mensagens do fim para o começo até achar o cursor (sequência
+# dos últimos pares já lidos) e devolve só o que veio depois dele, em ordem.
+# Só os itens visitados têm o texto lido. null = cursor fora do DOM.
+MESSAGE_TAIL_JS = """
+(els, cursor) => {
+  const pair = %s;
+  const seen = [];
+  for (let i = els.length - 1; i >= 0; i--) {
+    const p = pair(els[i]);
+    if (!p) continue;
+    seen.push(p);
+    const n = seen.length;
+    if (n < cursor.length) continue;
+    let hit = true;
+    for (let k = 0; k < cursor.length && hit; k++) {
+      const s = seen[n - 1 - k];
+      hit = s[0] === cursor[k][0] && s[1] === cursor[k][1];
+    }
+    if (hit) return seen.slice(0, n - cursor.length).reverse();
+  }
+  return null;
+}
+"""
+# mensagens do Playwright quando a aba/contexto/navegador some no meio da ação
+TEARDOWN_ERRORS = (
+    "target closed",
+    "has been closed",
+    "browser has disconnected",
+    "connection closed",
+    "page crashed",
+)
+SELLER_TEXT_SEL = SEL.get("seller_bubbles_fallback", "ul.message_main li.rt .text_cont")
+
+# Observa a lista de conversas e avisa o Python (binding) quais linhas
+# ganharam selo de não lida (ou cujo número mudou). Só o selo visível conta:
+# o Element UI mantém ``.el-badge__content`` no DOM, escondido, com 0 não
+# lidas; cliques/envios do próprio bot e a troca de "há 1 min" para "há 2 min"
+# não acordam o laço.
+CHAT_WATCH_JS = """
+(() => {
+  const cfg = %s;
+  if (window.__dkWatch) return;
+  window.__dkWatch = true;
+  let root = null, obs = null, timer = null, prev = new Map();
+  const keyOf = (li) => ((li.innerText || '').trim().split('\\n')[0] || '').trim();
+  const badgeOf = (li) => {
+    const b = li.querySelector(cfg.unread);
+    if (!b || b.offsetParent === null) return '';
+    return (b.innerText || '').trim() || '*';
+  };
+  const scan = () => {
+    if (!root) return;
+    const next = new Map();
+    const changed = [];
+    root.querySelectorAll(cfg.item).forEach((li, index) => {
+      const key = keyOf(li);
+      const badge = badgeOf(li);
+      next.set(key, badge);
+      if (badge && prev.get(key) !== badge) changed.push({ key, index });
+    });
+    const first = prev.size === 0;
+    prev = next;
+    if (!first && changed.length && window.__dkChatChanged) window.__dkChatChanged(changed);
+  };
+  const attach = () => {
+    const r = document.querySelector(cfg.root);
+    if (!r || r === root) return;
+    if (obs) obs.disconnect();
+    root = r;
+    prev = new Map();
+    scan();
+    obs = new MutationObserver(() => { clearTimeout(timer); timer = setTimeout(scan, cfg.debounce); });
+    obs.observe(root, { childList: true, subtree: true, characterData: true });
+  };
+  setInterval(attach, 1000);
+})();
+"""
+
+
+# Avisos conhecidos e inofensivos (caixas de mensagem/diálogos do Element UI)
+# são fechados na própria página assim que aparecem: botão de confirmar, senão
+# o X. Só modal cujo texto casa com ``benign`` (login expirado, anúncios) e
+# sem campo; o resto (ex.: "Confirmar cancelamento/reembolso?") fica com o
+# close_modal ou com o operador. Nada é removido do DOM (os nós são do Vue).
+# Com o controle manual na UI o guarda fica desligado nesta aba
+# (sessionStorage, vale também após recarregar). Cada fechamento é avisado ao
+# Python pelo binding.
+MODAL_GUARD_JS = """
+(() => {
+  if (window.__dkModalGuard) return;
+  window.__dkModalGuard = true;
+  const cfg = %s;
+  const confirmRe = new RegExp(cfg.confirm, 'i');
+  const benignRe = new RegExp(cfg.benign, 'i');
+  const tries = new WeakMap();
+  const enabled = () => {
+    try { return sessionStorage.getItem(cfg.offKey) !== '1'; } catch (e) { return true; }
+  };
+  const visible = (el) => {
+    if (!el || !el.getClientRects().length) return false;
+    const st = getComputedStyle(el);
+    return st.display !== 'none' && st.visibility !== 'hidden';
+  };
+  const report = (method, text) => {
+    try { if (window[cfg.binding]) window[cfg.binding]({ method, text }); } catch (e) {}
+  };
+  const dismiss = (w) => {
+    if (w.querySelector("input:not([type='hidden']), textarea")) return;
+    const text = (w.innerText || '').trim();
+    if (!benignRe.test(text)) return;
+    const now = Date.now();
+    const t = tries.get(w) || { n: 0, at: 0 };
+    if (t.n >= 2 || now - t.at < 1000) return;
+    tries.set(w, { n: t.n + 1, at: now });
+    const buttons = [...w.querySelectorAll("button, .el-button, [role='button']")].filter(visible);
+    const ok = buttons.find((b) => confirmRe.test((b.innerText || '').trim()));
+    if (ok) { ok.click(); return report('confirm', text.slice(0, 120)); }
+    const close = w.querySelector(cfg.close);
+    if (close && visible(close)) { close.click(); return report('close', text.slice(0, 120)); }
+  };
+  const scan = () => {
+    if (!enabled()) return;
+    document.querySelectorAll(cfg.wrappers).forEach((w) => { if (visible(w)) dismiss(w); });
+  };
+  let timer = null;
+  const start = () => {
+    scan();
+    new MutationObserver(() => { if (!timer) timer = setTimeout(() => { timer = null; scan(); }, 50); })
+      .observe(document.documentElement, { childList: true, subtree: true, attributes: true, attributeFilter: ['style', 'class'] });
+  };
+  if (document.documentElement) start(); else document.addEventListener('DOMContentLoaded', start);
+})();
+"""
+MODAL_GUARD_OFF_KEY = "__dkModalGuardOff"
+MODAL_GUARD_SWITCH_JS = """
+([key, on]) => { try { on ? sessionStorage.removeItem(key) : sessionStorage.setItem(key, '1'); } catch (e) {} }
+"""
+# Textos de aviso que o guarda pode confirmar sozinho
+MODAL_BENIGN_TEXT = SEL.get(
+    "modal_benign_text",
+    r"login has expired|session (has )?expired|sess[aã]o expirou|login expirou"
+    r"|announcement|an[uú]ncio|comunicado|novidades|what'?s new|system notice",
+)
+
+# Wrappers de modal procurados por close_modal (o guarda usa ``modal_wrappers``)
+MODAL_WRAPPERS = [
+    ".el-message-box__wrapper",
+    ".el-dialog__wrapper",
+    ".ant-modal-root",
+    ".modal",
+    "[role='dialog']",
+    "[role='alert']",
+    "[class*='tooltip']",
+    "[class*='announcement']",
+]
+# Modais tratados pelo guarda; a checagem rápida inclui diálogos com campo
+MODAL_GUARD_WRAPPERS = SEL.get(
+    "modal_wrappers", ".el-message-box__wrapper, .el-dialog__wrapper, .ant-modal-root"
+)
+MODAL_VISIBLE_JS = "(sels) => [...document.querySelectorAll(sels)].some((el) => el.getClientRects().length > 0)"
+
+
 def _env_or_settings(name_env: str, name_settings: str, default: str = "") -> str:
     v = os.getenv(name_env)
     if v:
@@ -179,7 +357,14 @@ class DuokeBot:
     faz login (com fechamento de modal), tenta detectar 2FA e expõe método para submeter o código.
     """
 
-    def __init__(self, storage_state_path: str = "storage_state.json"):
+    def __init__(
+        self,
+        storage_state_path: str = "storage_state.json",
+        session_user_id: Optional[str] = None,
+        browser_mode: Optional[str] = None,
+        use_env_credentials: bool = True,
+        shared_browser: Optional[SharedBrowser] = None,
+    ):
         # Mantido por compat
         self.storage_state_path = storage_state_path
         # Página atual (usada pelo espelho da UI)
@@ -189,54 +374,83 @@ class DuokeBot:
         # Evento simples para pausar/retomar o ciclo via UI
         self.pause_event = asyncio.Event()
         self.pause_event.set()
-        # Registro de última resposta por conversa
-        self.last_replied_at: dict[str, float] = {}
-        # Armazena respostas já enviadas por conversa para evitar duplicatas
-        self.sent_replies: dict[str, set[str]] = {}
+        # Encerramento gracioso: termina a conversa atual e sai do laço
+        self.stop_event = asyncio.Event()
+        # Última resposta + respostas já enviadas por conversa (LRU/TTL, persistido)
+        self.state = STATE
+        # Mensagens do comprador/pedido da conversa aberta (envio manual pela UI)
+        self.last_context: tuple[list, dict] = ([], {})
+        # Sessão usada no modo de navegador compartilhado (sessions/<id>.bin)
+        self.session_user_id = (
+            settings.session_user_id if session_user_id is None else session_user_id
+        )
+        self.browser_mode = browser_mode or settings.browser_mode
+        # Navegador do modo compartilhado (o pool de lojas passa o dele)
+        self.shared_browser = shared_browser or SHARED_BROWSER
+        self.use_env_credentials = use_env_credentials
+        # Teto de conversas por varredura (None = settings.max_conversations)
+        self.max_conversations: Optional[int] = None
+        self._ephemeral = False
+        # Abas extras no mesmo contexto (a principal é current_page) e reservas
+        self.extra_pages: list = []
+        self.leases = LeaseTable()
+        self.tab_stats: Dict[str, TabStats] = {}
+        # Avisos da página (MutationObserver) sobre conversas com mensagem nova
+        self.wake_event = asyncio.Event()
+        self._changed_rows: set = set()
+        self._woke_at = 0.0
+        # Captura do JSON do app por aba (leitura do DOM fica de reserva)
+        self._captures: Dict[Any, NetworkCapture] = {}
+        # Modais fechados pela própria página (init script + binding)
+        self._modal_guard = False
+        self.modals_dismissed = 0
+        # Varredura em dois níveis: filtro aplicado por aba, início da última
+        # varredura de cada nível ("fast" = Precisa responder, "full" = Todas)
+        self._filters: Dict[Any, str] = {}
+        self._last_sweep: Dict[str, float] = {}
+        # Ordem de atendimento (não lidas, espera x SLA, urgência, estágio)
+        self.priority = Prioritizer()
+        # Prazo por varredura e limite de conversas pela latência medida
+        self.budget = SweepBudget()
+        # Heap/nós do DOM por aba (CDP) e RSS do navegador, vistos entre ciclos
+        self.watchdog = MemoryWatchdog(self.session_user_id)
 
     # ---------- infra de navegador ----------
 
     async def _new_context(self, p):
         """
-        Contexto persistente: mantém cookies/localStorage dentro de 'pw-user-data'.
+        Contexto do navegador conforme ``settings.browser_mode``:
+
+        - persistente: cookies/localStorage dentro de 'pw-user-data' (caches
+          podados quando o perfil cresce demais);
+        - compartilhado: contexto efêmero no navegador único do processo,
+          semeado pela sessão cifrada (``session_user_id``) ou storage_state.json.
+
         Em produção (Render), iniciamos em headless e sem sandbox.
         """
-        user_data_dir = Path(__file__).resolve().parents[1] / "pw-user-data"
-        user_data_dir.mkdir(exist_ok=True)
-
-        # HEADLESS=1 (padrão) para servidores sem display; HEADLESS=0 no dev local
-        headless = os.getenv("HEADLESS", "1").lower() not in {"0", "false", "no"}
-
-        ctx = await p.chromium.launch_persistent_context(
-            user_data_dir=str(user_data_dir),
-            headless=headless,
-            ignore_https_errors=True,
-            viewport={"width": 1366, "height": 768},
-            args=[
-                "--no-sandbox",
-                "--disable-dev-shm-usage",
-                "--disable-gpu",
-            ],
-        )
+        if shared_mode(self.browser_mode):
+            state = load_storage_state(self.session_user_id)
+            if state is None:
+                print("[DEBUG] nenhuma sessão salva; contexto efêmero começa deslogado")
+            ctx = await self.shared_browser.new_context(p, storage_state=state)
+            self._ephemeral = True
+        else:
+            ctx = await launch_persistent(p)
+            self._ephemeral = False
+        await self._prepare_context(ctx)
+        return ctx
 
-        # Bloqueia mídia/analytics e evita travas; resiliente a exceções
-        async def _route_handler(route):
-            req = route.request
-            try:
-                url = req.url.lower()
-                if req.resource_type in {"media"} or "analytics" in url:
-                    await route.abort()
-                else:
-                    await route.continue_()
-            except Exception:
-                # fallback defensivo para não quebrar o fluxo
-                try:
-                    await route.continue_()
-                except Exception:
-                    pass
+    async def _close_shared_browser(self) -> None:
+        """Fecha o navegador compartilhado só se este bot o usou (modo compartilhado)."""
+        if shared_mode(self.browser_mode):
+            await self.shared_browser.close()
 
-        # importante: no contexto assíncrono, route deve ser aguardado
-        await ctx.route("**/*", _route_handler)
+    async def _prepare_context(self, ctx) -> None:
+        """Rotas e scripts de página comuns aos dois modos."""
+
+        # Bloqueia analytics/mídia (e imagens/fontes, se pedido); o resto
+        # carrega direto no navegador, sem passar pelo Python
+        await blocking.install(ctx)
 
         # injeta CSS para não depender de animações/transitions que atrasam cliques
         await ctx.add_init_script(
@@ -249,14 +463,181 @@ class DuokeBot:
         """
         )
 
-        return ctx
+        if settings.event_wakeups:
+            await ctx.expose_binding("__dkChatChanged", self._on_chat_changed)
+            watch_cfg = {
+                "root": SEL.get("chat_list_root", "ul.chat_list"),
+                "item": SEL.get("chat_list_item", "ul.chat_list li"),
+                "unread": SEL.get("chat_list_unread", "[class*='unread']"),
+                "debounce": 150,
+            }
+            await ctx.add_init_script(CHAT_WATCH_JS % json.dumps(watch_cfg))
+
+        self._modal_guard = settings.modal_guard
+        if self._modal_guard:
+            await ctx.expose_binding("__dkModalDismissed", self._on_modal_dismissed)
+            guard_cfg = {
+                "wrappers": MODAL_GUARD_WRAPPERS,
+                "close": ".el-message-box__headerbtn, .el-dialog__headerbtn, .ant-modal-close, [aria-label='close' i]",
+                # texto inteiro do botão ("OK", "Confirmar"), não trecho
+                "confirm": rf"^\s*{CONFIRM_RE.pattern}\s*$",
+                "benign": MODAL_BENIGN_TEXT,
+                "offKey": MODAL_GUARD_OFF_KEY,
+                "binding": "__dkModalDismissed",
+            }
+            await ctx.add_init_script(MODAL_GUARD_JS % json.dumps(guard_cfg))
+
+    async def set_modal_guard(self, on: bool) -> None:
+        """Liga/desliga o guarda de modais nas abas abertas (controle manual na UI)."""
+        if not self._modal_guard:
+            return
+        for pg in [self.current_page, *self.extra_pages]:
+            if pg is None:
+                continue
+            try:
+                await pg.evaluate(MODAL_GUARD_SWITCH_JS, [MODAL_GUARD_OFF_KEY, on])
+            except Exception as e:
+                print(f"[DEBUG] falha ao {'ligar' if on else 'desligar'} guarda de modais: {e}")
+
+    def _on_modal_dismissed(self, source, info) -> None:
+        """Binding chamado pela página ao fechar um modal sozinha."""
+        method = (info or {}).get("method", "?")
+        self.modals_dismissed += 1
+        metrics.incr(f"modal.auto.{method}")
+        print(f"[DEBUG] modal fechado na página ({method}): {((info or {}).get('text') or '')[:60]!r}")
+
+    # ---------- acordar por evento ----------
+
+    def _on_chat_changed(self, source, rows) -> None:
+        """Binding chamado pela página: conversas com mensagem nova não lida."""
+        if source.get("page") is not self.current_page:
+            return  # abas extras observam a mesma lista
+        keys = {r.get("key") for r in rows or () if r.get("key")}
+        if not keys:
+            return
+        if not self._changed_rows:
+            self._woke_at = time.monotonic()
+        self._changed_rows |= keys
+        metrics.incr("wakeups.events")
+        self.wake_event.set()
+
+    def take_changed_rows(self) -> set:
+        """Linhas avisadas desde a última varredura (e zera o aviso)."""
+        rows, self._changed_rows = self._changed_rows, set()
+        self.wake_event.clear()
+        if rows and self._woke_at:
+            metrics.observe("wakeups.to_cycle", time.monotonic() - self._woke_at)
+        self._woke_at = 0.0
+        return rows
+
+    async def _wait_for_work(self, started: float, idle_seconds: float) -> bool:
+        """
+        Espera o próximo ciclo: acorda com aviso da página (respeitando
+        ``wake_min_gap_seconds``) ou, sem avisos, pela varredura de segurança.
+        Retorna True se foi acordado por evento.
+        """
+        if not settings.event_wakeups:
+            await self._sleep_until(started + idle_seconds)
+            return False
+        await self._sleep_until(started + settings.wake_min_gap_seconds)
+        deadline = started + max(idle_seconds, settings.safety_poll_seconds)
+        while not self.stop_event.is_set() and not self.wake_event.is_set():
+            delay = deadline - time.monotonic()
+            if delay <= 0:
+                return False
+            waiters = [
+                asyncio.ensure_future(self.stop_event.wait()),
+                asyncio.ensure_future(self.wake_event.wait()),
+            ]
+            try:
+                await asyncio.wait(waiters, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for w in waiters:
+                    w.cancel()
+        return self.wake_event.is_set()
+
+    async def _close_context(self, ctx) -> None:
+        """Fecha o contexto; o efêmero ainda logado devolve cookies renovados à sessão."""
+        if ctx is None:
+            return
+        try:
+            page = self.current_page
+            if self._ephemeral and page and await self._is_logged_ui(page):
+                store_storage_state(self.session_user_id, await ctx.storage_state())
+        except Exception as e:
+            print(f"[DEBUG] falha ao salvar sessão: {e}")
+        try:
+            await ctx.close()
+        except Exception:
+            pass
+        self._captures.clear()
+        self._filters.clear()
+        self.watchdog.forget()
+
+    async def _watchdog_point(self, page) -> bool:
+        """
+        Ponto seguro entre ciclos: aplica o veredito do vigia de memória
+        (abas pesadas são recarregadas). True = recriar o contexto.
+        """
+        action, heavy = await self.watchdog.check([page, *self.extra_pages])
+        if action == "recycle":
+            return True
+        for pg in heavy:
+            await self._soft_reload(pg)
+        return False
+
+    async def _soft_reload(self, page) -> None:
+        print("[DEBUG] watchdog: recarregando aba (heap/DOM acima do limite)")
+        try:
+            await page.reload(wait_until="domcontentloaded", timeout=settings.goto_timeout_ms)
+            if page is self.current_page:
+                await self.ensure_login(page)
+            await waits.stable(page, "chat_list", CHAT_ITEM_SEL, 10000)
+        except Exception as e:
+            print(f"[DEBUG] falha ao recarregar aba: {e}")
+        # o app volta com o filtro padrão
+        self._filters.pop(page, None)
+        self.watchdog.reset_trend(page)
 
     async def _get_page(self, ctx):
         page = ctx.pages[0] if ctx.pages else await ctx.new_page()
         self.current_page = page
         page.set_default_timeout(5000)
+        self._attach_capture(page)
         return page
 
+    def _attach_capture(self, page) -> None:
+        """Passa a ler o JSON de conversas/mensagens/pedido que a aba recebe."""
+        if settings.net_capture and page not in self._captures:
+            capture = NetworkCapture()
+            capture.attach(page)
+            self._captures[page] = capture
+
+    async def _open_tabs(self, ctx) -> None:
+        """Abre as abas extras (``settings.tabs`` - 1, limitado pela memória) já logadas."""
+        self.extra_pages = []
+        wanted = tab_budget(settings.tabs) - 1
+        chat_item = SEL.get("chat_list_item", "ul.chat_list li")
+        for _ in range(wanted):
+            try:
+                pg = await ctx.new_page()
+                pg.set_default_timeout(5000)
+                self._attach_capture(pg)
+                await pg.goto(
+                    settings.douke_url,
+                    wait_until="domcontentloaded",
+                    timeout=settings.goto_timeout_ms,
+                )
+                await self._try_close_modal(pg)
+                await pg.wait_for_selector(chat_item, timeout=30000)
+                self.extra_pages.append(pg)
+            except Exception as e:
+                print(f"[DEBUG] falha ao abrir aba extra: {e}")
+                break
+        metrics.gauge("tabs.open", 1 + len(self.extra_pages))
+        if self.extra_pages:
+            print(f"[DEBUG] {1 + len(self.extra_pages)} abas atendendo em paralelo")
+
     # ---------- utilitários de login / 2FA ----------
 
     async def _click_confirm_anywhere(self, target) -> Optional[str]:
@@ -319,11 +700,22 @@ class DuokeBot:
             return None
 
     async def _try_close_modal(self, page):
+        # com o guarda na página, só sonda se ainda houver modal visível
+        if self._modal_guard and not await self._modal_visible(page):
+            return
         try:
             await self.close_modal(page)
         except Exception:
             pass
 
+    async def _modal_visible(self, page) -> bool:
+        try:
+            return await page.evaluate(
+                MODAL_VISIBLE_JS, f"{MODAL_GUARD_WRAPPERS}, [role='dialog']"
+            )
+        except Exception:
+            return True  # na dúvida, deixa o close_modal tentar
+
     async def _find_login_frame(self, page):
         """
         Retorna (frame, sel_email, sel_pass). Se estiver na própria page, frame = page.
@@ -382,6 +774,9 @@ class DuokeBot:
         return None, None
 
     def _get_creds(self) -> Tuple[str, str]:
+        if not self.use_env_credentials:
+            # conta vinda do cofre: DUOKE_EMAIL/PASSWORD são de outra loja
+            return "", ""
         email = _env_or_settings("DUOKE_EMAIL", "duoke_email")
         password = _env_or_settings("DUOKE_PASSWORD", "duoke_password")
         return email, password
@@ -400,20 +795,33 @@ class DuokeBot:
             timeout=settings.goto_timeout_ms,
         )
 
-        try:
-            await page.wait_for_timeout(800)
-            await self.close_modal(page)
-        except Exception:
-            pass
+        chat_list_item = SEL.get("chat_list_item", "ul.chat_list li")
+        if self._modal_guard:
+            # modais (ex.: "Your login has expired…") somem sozinhos na página;
+            # basta esperar o chat ou o formulário de login aparecer
+            try:
+                await page.wait_for_selector(
+                    f"{chat_list_item}, ul.message_main, input[type='password']",
+                    timeout=30000,
+                )
+            except Exception:
+                pass
+            await self._try_close_modal(page)
+        else:
+            try:
+                await page.wait_for_timeout(800)
+                await self.close_modal(page)
+            except Exception:
+                pass
 
-        # Aguarda rede “assentar”
-        try:
-            await page.wait_for_load_state("networkidle", timeout=30000)
-        except Exception:
-            pass
+            # Aguarda rede “assentar”
+            try:
+                await page.wait_for_load_state("networkidle", timeout=30000)
+            except Exception:
+                pass
 
-        # Fecha modal “Your login has expired…”
-        await self._try_close_modal(page)
+            # Fecha modal “Your login has expired…”
+            await self._try_close_modal(page)
 
         # Já está logado?
         if await self._is_logged_ui(page):
@@ -538,8 +946,6 @@ class DuokeBot:
     # ---------- filtros/UX ----------
 
     async def apply_needs_reply_filter(self, page):
-        if not getattr(settings, "apply_needs_reply_filter", False):
-            return
         try:
             sel = SEL.get("filter_needs_reply", "")
             if not sel:
@@ -547,7 +953,7 @@ class DuokeBot:
             locator = page.locator(sel)
             if await locator.count() > 0:
                 await locator.first.click()
-                await page.wait_for_timeout(1000)
+                await waits.stable(page, "chat_list", CHAT_ITEM_SEL, 1000, min_items=0)
         except Exception:
             pass
 
@@ -560,15 +966,58 @@ class DuokeBot:
             locator = page.locator(sel)
             if await locator.count() > 0:
                 await locator.first.click()
-                await page.wait_for_timeout(1000)
+                await waits.stable(page, "chat_list", CHAT_ITEM_SEL, 1000, min_items=0)
         except Exception:
             # Não deve interromper o fluxo se o seletor não existir ou falhar
             pass
 
+    @staticmethod
+    def _has_fast_tier() -> bool:
+        return bool(settings.apply_needs_reply_filter and SEL.get("filter_needs_reply"))
+
+    def _full_due(self) -> bool:
+        """A última varredura completa (sem foco) foi há ``full_sweep_minutes`` ou mais."""
+        last_full = self._last_sweep.get("full")
+        every = float(settings.full_sweep_minutes) * 60
+        return last_full is None or time.monotonic() - last_full >= every
+
+    def _sweep_tier(self) -> str:
+        """
+        ``fast`` (só "Precisa responder") ou ``full`` (todas, para os casos
+        pendentes): a completa roda a cada ``full_sweep_minutes``.
+        """
+        if not self._has_fast_tier() or self._full_due():
+            return "full"
+        return "fast"
+
+    async def _show_tier(self, page, tier: str) -> None:
+        """Aplica o filtro do nível na aba (só clica quando muda)."""
+        if self._filters.get(page) == tier:
+            return
+        if tier == "fast":
+            await self.apply_needs_reply_filter(page)
+        else:
+            await self.show_all_conversations(page)
+        self._filters[page] = tier
+
+    def _record_sweep(self, tier: str, started: float, rows: int) -> None:
+        """Custo e cadência de cada nível em ``metrics`` (``sweep.<nível>.*``)."""
+        elapsed = time.monotonic() - started
+        previous = self._last_sweep.get(tier)
+        self._last_sweep[tier] = started
+        metrics.incr(f"sweep.{tier}.count")
+        metrics.observe(f"sweep.{tier}", elapsed)
+        metrics.gauge(f"sweep.{tier}.rows", rows)
+        if previous is not None:
+            metrics.observe(f"sweep.{tier}.interval", started - previous)
+        label = "rápida" if tier == "fast" else "completa"
+        every = f", {started - previous:.0f}s após a anterior" if previous else ""
+        print(f"[DEBUG] varredura {label}: {rows} conversas em {elapsed:.1f}s{every}")
+
     # ---------- navegação entre conversas ----------
 
     def conversations(self, page):
-        return page.locator(SEL.get("chat_list_item", "ul.chat_list li"))
+        return page.locator(CHAT_ITEM_SEL)
 
     async def open_conversation_by_index(self, page, idx: int) -> bool:
         conv_locator = self.conversations(page)
@@ -576,68 +1025,77 @@ class DuokeBot:
         if idx >= total:
             return False
 
+        before = await waits.signature(page, MESSAGE_ITEM_SEL)
         await conv_locator.nth(idx).click()
 
-        # Aguarda painel renderizar
+        # Aguarda painel renderizar: mensagens trocadas, presentes e paradas
         try:
             if SEL.get("message_container"):
                 await page.wait_for_selector(SEL["message_container"], timeout=9000)
-            await page.wait_for_function(
-                """() => {
-                    const ul = document.querySelector('ul.message_main');
-                    return ul && ul.children && ul.children.length > 0;
-                }""",
-                timeout=9000,
-            )
         except Exception:
             pass
+        await waits.stable(page, "messages", MESSAGE_ITEM_SEL, 9000, before=before)
 
         try:
             if SEL.get("input_textarea"):
                 await page.wait_for_selector(SEL["input_textarea"], timeout=8000)
         except Exception:
             pass
-
-        await page.wait_for_timeout(
-            int(getattr(settings, "delay_between_actions", 1.0) * 1000)
-        )
         return True
 
     # ---------- leitura de mensagens ----------
 
     async def read_messages_with_roles(self, page, depth: int) -> list[tuple[str, str]]:
-        """Retorna últimos N [(role,text)], role ∈ {'buyer','seller'}."""
+        """Retorna últimos N [(role,text)], role ∈ {'buyer','seller'} (depth <= 0 = todas)."""
         out: list[tuple[str, str]] = []
         try:
-            items = page.locator("ul.message_main > li")
+            items = page.locator(MESSAGE_ITEM_SEL)
 
-            # Força mais histórico: rola ao topo algumas vezes
-            try:
-                container = page.locator(
-                    SEL.get("message_container", "ul.message_main")
-                ).first
-                for _ in range(3):
-                    await container.evaluate("(el) => { el.scrollTop = 0; }")
-                    await page.wait_for_timeout(120)
-            except Exception:
-                pass
+            # Força mais histórico: rola ao topo enquanto o histórico carrega
+            container = page.locator(
+                SEL.get("message_container", "ul.message_main")
+            ).first
+            await waits.scroll_to_top(container)
 
             texts = await items.evaluate_all(
-                """
-                (els) => els.map(li => {
-                    const cls = (li.className || '').toLowerCase();
-                    const role = cls.includes('lt') ? 'buyer' : (cls.includes('rt') ? 'seller' : 'system');
-                    const txtNode = li.querySelector('div.text_cont, .bubble .text, .record_item .content');
-                    const txt = (txtNode?.innerText || '').trim();
-                    return txt && role !== 'system' ? [role, txt] : null;
-                }).filter(Boolean)
-            """
+                "(els) => els.map(%s).filter(Boolean)" % MESSAGE_PAIR_JS
             )
-            out = texts[-depth:]
+            out = texts[-depth:] if depth > 0 else texts
         except Exception:
             pass
         return out
 
+    async def read_messages_tail(self, page, cursor: list) -> Optional[list[tuple[str, str]]]:
+        """
+        Mensagens posteriores a ``cursor`` (últimos pares já conhecidos), lidas
+        de trás para a frente sem rolar o histórico. None = cursor não está
+        no DOM (conversa mudou demais): o chamador faz a leitura completa.
+        """
+        try:
+            fresh = await page.locator(MESSAGE_ITEM_SEL).evaluate_all(
+                MESSAGE_TAIL_JS % MESSAGE_PAIR_JS, cursor
+            )
+        except Exception as e:
+            print(f"[DEBUG] falha na leitura incremental: {e}")
+            return None
+        return None if fresh is None else [tuple(p) for p in fresh]
+
+    async def _read_conversation_messages(self, page, key: str) -> list[tuple[str, str]]:
+        """Histórico da conversa: só a cauda nova quando ``key`` já foi lida antes."""
+        known = MESSAGES.get(key) if key and settings.incremental_reads else None
+        if known:
+            fresh = await self.read_messages_tail(page, MESSAGES.cursor(known))
+            if fresh is not None:
+                metrics.incr("messages.incremental")
+                metrics.observe("messages.fresh", len(fresh))
+                return MESSAGES.extend(key, fresh)
+            metrics.incr("messages.cursor_lost")
+        pairs = await self.read_messages_with_roles(page, 0)
+        metrics.incr("messages.full_read")
+        if key and pairs:
+            pairs = MESSAGES.put(key, pairs)
+        return pairs
+
     async def read_messages(self, page, depth: int = 8) -> list[str]:
         """Compat: apenas textos do comprador."""
         msgs: list[str] = []
@@ -646,12 +1104,7 @@ class DuokeBot:
             print("[DEBUG] Nenhum container de mensagens encontrado")
             return msgs
 
-        for _ in range(3):
-            try:
-                await container.evaluate("(el) => { el.scrollTop = 0; }")
-                await page.wait_for_timeout(60)
-            except Exception:
-                break
+        await waits.scroll_to_top(container)
 
         buyer_sel = SEL.get("buyer_message", "ul.message_main li.lt .text_cont")
         try:
@@ -667,11 +1120,11 @@ class DuokeBot:
 
     # ---------- painel lateral (pedido) ----------
 
-    async def read_sidebar_order_info(self, page) -> dict:
+    async def read_sidebar_order_info(self, page) -> OrderInfo:
         """Extrai status, orderId, título, variação, SKU, nome do comprador e campos rotulados do painel de pedido."""
         info = await page.evaluate(
             """
-        () => {
+        (labels) => {
           const norm = (s) => (s || '').replace(/\\s+/g, ' ').trim();
 
           const panels = Array.from(document.querySelectorAll('div,section,article'));
@@ -723,6 +1176,8 @@ class DuokeBot:
           const sMatch = cardText.match(/\\bSKU\\s*:\\s*([A-Za-z0-9\\-\\._]+)/i);
           const sku = norm((sMatch && sMatch[1]) || '');
 
+          // só os rótulos usados (FIELD_LABELS), não um mapa de todo o painel
+          const wanted = new Set(labels);
           const fields = {};
           (right.querySelectorAll('*') || []).forEach(el => {
             const t = norm(el.textContent);
@@ -730,23 +1185,24 @@ class DuokeBot:
             if (m) {
               const key = norm(m[1]);
               const val = norm(m[2]);
-              if (key && val && key.length <= 64) fields[key] = val;
+              if (val && wanted.has(key)) fields[key] = val;
             }
           });
 
           return { status, orderId, title, variation, sku, fields };
         }
-        """
+        """,
+            list(FIELD_LABELS),
         )
         buyer_name = await DuokeBot._text_or_empty(
             page.locator(SEL.get("buyer_name", ""))
         )
         info["buyer_name"] = buyer_name
-        return info
+        return OrderInfo.from_scrape(info)
 
     # ---------- envio de resposta ----------
 
-    async def send_reply(self, page, text: str):
+    async def _find_input_box(self, page):
         candidates = [
             s.strip() for s in SEL.get("input_textarea", "").split(",") if s.strip()
         ]
@@ -774,13 +1230,9 @@ class DuokeBot:
                 raise RuntimeError(
                     "Campo de mensagem não encontrado (todos candidatos estavam ocultos)."
                 )
+        return box
 
-        await box.click()
-        try:
-            await box.fill(text)
-        except Exception:
-            await box.type(text, delay=4)
-
+    async def _press_send(self, page):
         await page.keyboard.press("Enter")
 
         try:
@@ -792,21 +1244,69 @@ class DuokeBot:
         except Exception:
             pass
 
+    async def send_reply(self, page, text: str):
+        box = await self._find_input_box(page)
+
+        await box.click()
+        try:
+            await box.fill(text)
+        except Exception:
+            await box.type(text, delay=4)
+
+        await self._press_send(page)
+
+    async def send_reply_stream(self, page, stream, finalize=None) -> str:
+        """
+        Digita a resposta enquanto o Gemini gera (``ReplyStream``) e envia ao final.
+
+        ``finalize(texto)`` pode ajustar o texto final ou devolver "" para abortar
+        (ex.: duplicata). Se o texto final for skip/vazio, a caixa é limpa e nada
+        é enviado. Retorna o texto enviado ("" = não enviou).
+        """
+        box = await self._find_input_box(page)
+        await box.click()
+
+        first = True
+        async for delta in stream.deltas():
+            if first:
+                metrics.observe(
+                    "stream.first_keystroke", time.perf_counter() - stream.started_at
+                )
+                first = False
+            # insert_text não gera um evento por tecla: rápido em textarea e contenteditable
+            await page.keyboard.insert_text(delta)
+
+        final = stream.text
+        if final and finalize:
+            final = finalize(final) or ""
+
+        if not final:
+            if stream.typed:
+                try:
+                    await box.fill("")
+                except Exception:
+                    await page.keyboard.press("Control+A")
+                    await page.keyboard.press("Backspace")
+            metrics.incr("stream.abortado")
+            return ""
+
+        if final != stream.typed:
+            # higienização/refino mudou o texto: substitui o que já foi digitado
+            try:
+                await box.fill(final)
+            except Exception:
+                await page.keyboard.press("Control+A")
+                await page.keyboard.insert_text(final)
+
+        await self._press_send(page)
+        return final
+
     # ---------- ações manuais de login/2FA ----------
 
     async def close_modal(self, page, retries: int = 3):
         """Fecha modais, tooltips ou anúncios tentando várias abordagens."""
         frames = [page] + list(page.frames)
-        wrappers = [
-            ".el-message-box__wrapper",
-            ".el-dialog__wrapper",
-            ".ant-modal-root",
-            ".modal",
-            "[role='dialog']",
-            "[role='alert']",
-            "[class*='tooltip']",
-            "[class*='announcement']",
-        ]
+        wrappers = MODAL_WRAPPERS
 
         for _ in range(retries):
             for fr in frames:
@@ -984,225 +1484,555 @@ class DuokeBot:
         conversa.
         """
 
-        recents = pairs[-max_depth:]
-        lines: list[str] = []
-        for role, text in recents:
-            prefix = "Comprador" if role == "buyer" else "Vendedor"
-            lines.append(f"{prefix}: {text.strip()}")
-        return "\n\n".join(lines)
+        return format_turns(pairs[-max_depth:])
+
+    def _history_for(self, snap: ConversationSnapshot) -> str:
+        if settings.summary_enabled and snap.conv_id:
+            return SUMMARIES.build_history(
+                self._ns(snap.conv_id),
+                snap.all_pairs,
+                recent=settings.summary_recent_turns,
+                refresh_turns=settings.summary_refresh_turns,
+            )
+        return self.build_history_from_pairs(snap.pairs, max_depth=snap.depth * 2)
 
-    async def _cycle(self, page, decide_reply_fn):
-        """Executa um ciclo sobre as conversas visíveis."""
+    async def _cycle(self, page, decide_reply_fn, focus: Optional[set] = None):
+        """
+        Executa um ciclo sobre as conversas visíveis (dividido entre as abas abertas).
+        ``focus``: nomes das linhas avisadas pela página; só elas são abertas.
+        """
         # Se estiver aguardando 2FA, não tenta responder
         if self.awaiting_2fa:
             print("[DEBUG] Aguardando 2FA, ciclo pausado.")
             await asyncio.sleep(1)
             return
 
-        # Garante que conversas cujo último envio foi do vendedor também apareçam
-        await self.show_all_conversations(page)
+        pages = [page, *self.extra_pages]
+        if focus and self._full_due():
+            # completa vencida: vira a passada completa (as linhas avisadas estão
+            # nela); senão, numa caixa movimentada, todo ciclo seria dirigido
+            focus = None
+        if focus:
+            # dirigida: as linhas avisadas têm mensagem nova, estão na rápida
+            tier = "fast" if self._has_fast_tier() else "full"
+        else:
+            tier = self._sweep_tier()
+        sweep_started = time.monotonic()
+
+        # Rápida: só "Precisa responder". Completa: todas (conversas cujo último
+        # envio foi do vendedor também aparecem, para os casos pendentes)
+        await asyncio.gather(*(self._show_tier(pg, tier) for pg in pages))
 
         conv_locator = self.conversations(page)
-        await page.wait_for_timeout(300)
-        total = await conv_locator.count()
-        print(f"[DEBUG] conversas visíveis: {total}")
-
-        max_convs = int(getattr(settings, "max_conversations", 0) or 0)
-        if max_convs > 0:
-            total = min(total, max_convs)
-
-        for i in range(total):
-            await self.pause_event.wait()
-            try:
-                ok = await self.open_conversation_by_index(page, i)
-                if not ok:
-                    continue
-            except Exception as e:
-                print(f"[DEBUG] falha ao abrir conversa {i}: {e}")
-                continue
-
+        await waits.stable(page, "chat_list", CHAT_ITEM_SEL, 1000, min_items=0)
+        rows = await self.priority.scan(
+            conv_locator,
+            SEL.get("chat_list_unread", "[class*='unread']"),
+            SEL.get("chat_list_time", "[class*='time']"),
+        )
+        print(f"[DEBUG] conversas visíveis: {len(rows)}")
+
+        max_convs = self.max_conversations
+        if max_convs is None:
+            max_convs = int(getattr(settings, "max_conversations", 0) or 0)
+
+        if focus:
+            targeted = [r for r in rows if r.key in focus]
+            if targeted:
+                print(f"[DEBUG] varredura dirigida: {len(targeted)} conversas avisadas")
+                rows = targeted
+                metrics.incr("wakeups.targeted")
+
+        # Checkpoint: varredura interrompida (erro/reinício) continua de onde
+        # parou; linhas já atendidas só voltam com mensagem nova. A dirigida só
+        # respeita o checkpoint, sem abrir/fechar um.
+        resumable = not focus
+        if resumable:
+            cp = self.state.begin_sweep(self._scope, tier)
+        else:
+            cp = self.state.checkpoint(self._scope, tier)
+        done = set(cp["done"]) if cp else set()
+        if done:
+            print(f"[DEBUG] retomando varredura: {len(done)} conversas já atendidas")
+            metrics.incr("sweep.resumed")
+        rows = [
+            r
+            for r in rows
+            if not (r.key in done and not r.unread)
+            and not self.state.quarantined(self._scope, r.key)
+        ]
+        metrics.gauge("sweep.quarantine", len(self.state.quarantine_list(self._scope)))
+
+        # Maior prioridade primeiro (não lidas, espera x SLA, urgência, estágio),
+        # até o que cabe no prazo da varredura pela latência medida
+        limit = self.budget.limit(max_convs, len(pages))
+        order = self.priority.plan(rows, limit, ranked=settings.priority_queue)
+        total = len(order)
+        deadline = self.budget.deadline(sweep_started)
+
+        # Fila compartilhada: cada aba pega a próxima linha livre ao terminar a sua
+        queue = iter(order)
+        started = time.monotonic()
+        workers = [
+            asyncio.ensure_future(
+                self._tab_worker(str(n), pg, queue, decide_reply_fn, deadline)
+            )
+            for n, pg in enumerate(pages)
+        ]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+
+        # Prazo esgotado: o que sobrou sobe na próxima varredura (lista relida)
+        left = list(queue)
+        if left:
+            if not self.stop_event.is_set():
+                print(f"[DEBUG] prazo da varredura esgotado; {len(left)} conversas ficam para a próxima")
+                metrics.incr("sweep.deadline_hit")
+            self.priority.carry(left)
+            total -= len(left)
+
+        elapsed = time.monotonic() - started
+        metrics.observe("tabs.sweep", elapsed)
+        if len(pages) > 1:
+            print(f"[DEBUG] varredura em {len(pages)} abas: {total} conversas em {elapsed:.1f}s")
+        for stats in self.tab_stats.values():
+            line = stats.publish()
+            if len(pages) > 1:
+                print(f"[DEBUG] {line}")
+        if not focus:
+            # a dirigida não conta como varredura do nível (nem adia a completa)
+            self._record_sweep(tier, sweep_started, total)
+        if resumable and not self.stop_event.is_set():
+            self.state.end_sweep(self._scope)
+
+        # grava o estado das conversas se o intervalo de snapshot passou
+        self.state.snapshot()
+
+    async def _tab_worker(
+        self, owner: str, page, queue, decide_reply_fn, deadline: Optional[float] = None
+    ) -> None:
+        stats = self.tab_stats.setdefault(owner, TabStats(owner, self.session_user_id))
+        while True:
             await self.pause_event.wait()
-
-            # ----- Order info (extração precisa com seletores) -----
-            order_info = {}
+            if self.stop_event.is_set():
+                break
+            # não começa conversa nova depois do prazo (a atual termina)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            row = next(queue, None)
+            if row is None:
+                break
+            t0 = time.monotonic()
             try:
-                order_info = await extract_order_details_with_selectors(page, SEL)
+                outcome = await self._handle_conversation(
+                    page, row.index, decide_reply_fn, owner, row.key
+                )
             except Exception as e:
-                print(f"[DEBUG] falha ao extrair detalhes do pedido com seletores: {e}")
-                try:
-                    order_info = await extract_order_from_dom(page, SEL)
-                except Exception as e_dom:
-                    print(
-                        f"[DEBUG] falha total na extração de dados do pedido: {e_dom}"
-                    )
+                # só erro da própria conversa conta; navegador/contexto caindo
+                # derrubaria todas as linhas em andamento
+                if not self._is_teardown(page, e):
+                    self.state.record_failure(self._scope, row.key)
+                raise
+            finally:
+                self.leases.release_owner(owner)
+            if outcome == "falha":
+                self.state.record_failure(self._scope, row.key)
+            elif outcome not in ("ocupada", "sumiu"):
+                self.state.clear_failures(self._scope, row.key)
+                self.state.mark_done(self._scope, row.key)
+                self.priority.done(row.key, outcome == "respondida")
+            spent = time.monotonic() - t0
+            if outcome not in ("ocupada", "sumiu"):
+                # desfechos sem abrir a conversa puxariam a média para baixo
+                self.budget.observe(spent)
+            stats.record(outcome, spent)
+
+    @property
+    def _scope(self) -> str:
+        """Dono do checkpoint de varredura (uma loja/sessão)."""
+        return self.session_user_id or "local"
 
-            print("[DEBUG] Order info:", order_info)
+    @staticmethod
+    def _is_teardown(page, error: Exception) -> bool:
+        """Erro do Playwright por aba/contexto/navegador fechado (não da conversa)."""
+        if not isinstance(error, PwError):
+            return False
+        try:
+            if page.is_closed():
+                return True
+        except Exception:
+            return True
+        msg = str(error).lower()
+        return any(m in msg for m in TEARDOWN_ERRORS)
 
-            # ----- Mensagens + history -----
-            depth = int(getattr(settings, "history_depth", 8) or 8)
-            pairs = await self.read_messages_with_roles(page, depth * 2)
-            print(f"[DEBUG] conversa {i}: {len(pairs)} msgs (com role)")
-            if not pairs:
-                continue
+    def _ns(self, key: str) -> str:
+        """
+        Chave nos stores compartilhados (estado, mensagens, resumos): no pool de
+        lojas o mesmo comprador/pedido pode aparecer em lojas diferentes.
+        """
+        return f"{self.session_user_id}/{key}" if key and self.session_user_id else key
 
-            buyer_only = [t for r, t in pairs if r == "buyer"][-depth:]
-            problema = infer_problema(buyer_only)
-            wants_parts = bool(buyer_only) and buyer_wants_missing_parts(buyer_only[-1])
-
-            # Se a última mensagem do vendedor foi o texto de "quebra_com_foto"
-            # e o cliente respondeu em seguida, apenas registramos a conversa
-            # e pulamos sem reprocessar.
-            if len(pairs) >= 2:
-                last_role, last_txt = pairs[-1]
-                prev_role, prev_txt = pairs[-2]
-                prev_lower = (prev_txt or "").lower()
-                if (
-                    last_role == "buyer"
-                    and prev_role == "seller"
-                    and "podemos resolver de 3 formas" in prev_lower
-                    and "reembolso parcial" in prev_lower
-                    and "devolu" in prev_lower
-                    and "envio de nova peça" in prev_lower
-                ):
-                    try:
-                        log_case(order_info, buyer_only)
-                    except Exception as e:
-                        print(f"[DEBUG] falha ao registrar atendimento: {e}")
-                    print(
-                        "[DEBUG] conversa registrada (cliente respondeu à mensagem de quebra_com_foto)"
+    async def _row_index(self, page, key: str, hint: int) -> int:
+        """Posição atual da linha ``key`` (a lista reordena/encolhe durante a varredura)."""
+        try:
+            keys = await self.conversations(page).evaluate_all(ROW_KEYS_JS)
+        except Exception:
+            return hint
+        if hint < len(keys) and keys[hint] == key:
+            return hint
+        return keys.index(key) if key in keys else -1
+
+    async def _handle_conversation(
+        self, page, i: int, decide_reply_fn, owner: str = "0", row_key: str = ""
+    ) -> str:
+        """
+        Abre a conversa ``i`` nesta aba, decide e responde. Retorna o desfecho.
+        Com ``row_key`` a linha é procurada pelo nome antes (``i`` é só o palpite).
+        """
+        if row_key:
+            i = await self._row_index(page, row_key, i)
+            if i < 0:
+                return "sumiu"
+        capture = self._captures.get(page)
+        mark = capture.mark() if capture else 0
+        try:
+            ok = await self.open_conversation_by_index(page, i)
+            if not ok:
+                return "falha"
+        except Exception as e:
+            print(f"[DEBUG] falha ao abrir conversa {i}: {e}")
+            return "falha"
+
+        await self.pause_event.wait()
+
+        # ----- JSON do próprio app (capturado ao abrir a conversa) -----
+        # só vale payload que cita o comprador da linha clicada (ou o pedido
+        # dele); sem essa confirmação os dados saem do DOM
+        raw_order, api_pairs = None, None
+        if capture and row_key:
+            wait = settings.net_capture_wait_ms / 1000
+            expect = {ident(row_key)}
+            with metrics.timer("extract.capture"):
+                raw_order, api_pairs = await asyncio.gather(
+                    capture.order(mark, wait, expect), capture.messages(mark, wait, expect)
+                )
+                if raw_order and not api_pairs:
+                    # mensagens que citam só o número do pedido já confirmado
+                    api_pairs = await capture.messages(
+                        mark, 0, {ident(raw_order.get("orderId"))}
                     )
-                    continue
-
-            # Últimas mensagens de comprador e vendedor para contexto
-            history_block = self.build_history_from_pairs(pairs, max_depth=depth * 2)
-            order_info["history_block"] = history_block
 
-            # ----- dedupe por conversa e rate-limit -----
-            conv_key = order_info.get("orderId") or "|".join(buyer_only[-2:]) or str(i)
-            now = time.time()
-            last = self.last_replied_at.get(conv_key)
-            if last and now - last < 180:
-                print(
-                    f"[DEBUG] pulando conversa já respondida recentemente: {conv_key}"
+        # ----- Order info (extração precisa com seletores, se a rede não trouxe) -----
+        if not raw_order:
+            raw_order = {}
+            with metrics.timer("extract.order_dom"):
+                try:
+                    raw_order = await extract_order_details_with_selectors(page, SEL)
+                except Exception as e:
+                    print(f"[DEBUG] falha ao extrair detalhes do pedido com seletores: {e}")
+                    try:
+                        raw_order = await extract_order_from_dom(page, SEL)
+                    except Exception as e_dom:
+                        print(
+                            f"[DEBUG] falha total na extração de dados do pedido: {e_dom}"
+                        )
+        # Um único objeto por conversa, repassado por referência até o registro
+        order_info = OrderInfo.from_scrape(raw_order)
+        self.priority.note_stage(row_key, order_info.stage)
+
+        print("[DEBUG] Order info:", order_info)
+
+        # ----- Mensagens + history -----
+        depth = int(getattr(settings, "history_depth", 8) or 8)
+        if not api_pairs:
+            with metrics.timer("extract.messages_dom"):
+                api_pairs = await self._read_conversation_messages(
+                    page, self._ns(order_info.order_id or order_info.buyer_name)
                 )
-                continue
-
-            if problema in {"reembolso parcial", "enviar peça faltante", "enviar nova peça"} or wants_parts:
+        snap = ConversationSnapshot(i, order_info, api_pairs, depth)
+        pairs = snap.pairs
+        print(f"[DEBUG] conversa {i}: {len(pairs)} msgs (com role)")
+        if not pairs:
+            return "vazia"
+
+        buyer_only = snap.buyer_only
+        problema = infer_problema(buyer_only)
+        wants_parts = bool(buyer_only) and buyer_wants_missing_parts(buyer_only[-1])
+
+        # Se a última mensagem do vendedor foi o texto de "quebra_com_foto"
+        # e o cliente respondeu em seguida, apenas registramos a conversa
+        # e pulamos sem reprocessar.
+        if len(pairs) >= 2:
+            last_role, last_txt = pairs[-1]
+            prev_role, prev_txt = pairs[-2]
+            prev_f = fold(prev_txt)
+            if (
+                last_role == "buyer"
+                and prev_role == "seller"
+                and "podemos resolver de 3 formas" in prev_f
+                and "reembolso parcial" in prev_f
+                and "devolu" in prev_f
+                and "envio de nova peca" in prev_f
+            ):
                 try:
                     log_case(order_info, buyer_only)
                 except Exception as e:
                     print(f"[DEBUG] falha ao registrar atendimento: {e}")
-                try:
-                    log_label(order_info, buyer_only)
-                except Exception as e:
-                    print(f"[DEBUG] falha ao registrar pedido: {e}")
-                print("[DEBUG] conversa registrada (pendência manual)")
-                continue
+                print(
+                    "[DEBUG] conversa registrada (cliente respondeu à mensagem de quebra_com_foto)"
+                )
+                return "registrada"
+
+        # Últimas mensagens de comprador e vendedor para contexto
+        # Com resumo ativo, turnos antigos viram um resumo cacheado por conversa.
+        # Montado só se a decisão for ao LLM (templates/skip não precisam).
+        snap.set_history(lambda snap=snap: self._history_for(snap))
+
+        # ----- dedupe por conversa e rate-limit -----
+        conv_key = self._ns(conversation_key(order_info.order_id, buyer_only, i))
+        if not self.leases.claim(conv_key, owner):
+            print(f"[DEBUG] conversa {conv_key} em atendimento em outra aba")
+            return "ocupada"
+        now = time.time()
+        last = self.state.last_replied_at(conv_key)
+        if last and now - last < 180:
+            print(
+                f"[DEBUG] pulando conversa já respondida recentemente: {conv_key}"
+            )
+            return "recente"
 
-            # ----- classificador / decisão -----
-            should = False
-            reply = ""
+        if problema in {"reembolso parcial", "enviar peça faltante", "enviar nova peça"} or wants_parts:
             try:
-                params = inspect.signature(decide_reply_fn).parameters
-                if len(params) >= 3:
-                    result = decide_reply_fn(pairs, buyer_only, order_info)
-                elif len(params) >= 2:
-                    result = decide_reply_fn(buyer_only, order_info)
-                else:
-                    result = decide_reply_fn(buyer_only)
-                if inspect.isawaitable(result):
-                    result = await result
-                should, reply = result
+                log_case(order_info, buyer_only)
             except Exception as e:
-                print(f"[DEBUG] erro no hook/classificador: {e}")
-                should, reply = True, RESP_FALLBACK_CURTO
-
-            print(f"[DEBUG] decide: should={should} | Resposta: {reply}")
-            decision_txt = (reply or "").strip().lower()
-            if (not should) or decision_txt == "ação: skip (pular)".lower():
-                try:
-                    log_case(order_info, buyer_only)
-                except Exception as e:
-                    print(f"[DEBUG] falha ao registrar atendimento: {e}")
-                try:
-                    log_label(order_info, buyer_only)
-                except Exception as e:
-                    print(f"[DEBUG] falha ao registrar pedido: {e}")
-                print("[DEBUG] conversa registrada (skip)")
-                continue
-
-            if order_info.get("orderId") and "{ORDER_ID}" in reply:
-                reply = reply.replace("{ORDER_ID}", order_info["orderId"])
+                print(f"[DEBUG] falha ao registrar atendimento: {e}")
+            try:
+                log_label(order_info, buyer_only)
+            except Exception as e:
+                print(f"[DEBUG] falha ao registrar pedido: {e}")
+            print("[DEBUG] conversa registrada (pendência manual)")
+            return "pendente"
+
+        # ----- classificador / decisão -----
+        self.last_context = (buyer_only, order_info)
+        should = False
+        reply = ""
+        try:
+            params = inspect.signature(decide_reply_fn).parameters
+            # respostas aprovadas no índice de templates valem só para a loja
+            scope = {"scope": self.session_user_id} if "scope" in params else {}
+            if len(params) >= 3:
+                args = (pairs, buyer_only, order_info)
+            elif len(params) >= 2:
+                args = (buyer_only, order_info)
+            else:
+                args = (buyer_only,)
+            if inspect.iscoroutinefunction(decide_reply_fn):
+                result = decide_reply_fn(*args, **scope)
+            else:
+                # Gemini (resposta, resumo, crítico) bloqueia: roda numa thread
+                # para as outras abas/lojas seguirem no laço enquanto isso
+                result = await asyncio.to_thread(decide_reply_fn, *args, **scope)
+            if inspect.isawaitable(result):
+                result = await result
+            should, reply = result
+        except Exception as e:
+            print(f"[DEBUG] erro no hook/classificador: {e}")
+            should, reply = True, RESP_FALLBACK_CURTO
+
+        print(f"[DEBUG] decide: should={should} | Resposta: {reply}")
+
+        streamed = False
+        if isinstance(reply, ReplyStream):
+            # Digita enquanto o Gemini gera; envia ou aborta ao fim do stream
+            stream = reply
+            duplicate = False
+
+            def _finalize_stream(text: str) -> str:
+                nonlocal duplicate
+                if order_info.get("orderId") and "{ORDER_ID}" in text:
+                    text = text.replace("{ORDER_ID}", order_info["orderId"])
+                if self.state.was_sent(conv_key, text):
+                    duplicate = True
+                    return ""
+                return text
 
-            conv_sent = self.sent_replies.setdefault(conv_key, set())
-            norm_reply = re.sub(r"\s+", " ", (reply or "").strip().lower())
-            if norm_reply in conv_sent:
+            reply = ""
+            if should:
+                reply = await self.send_reply_stream(page, stream, _finalize_stream)
+            if duplicate:
                 print("[DEBUG] resposta já enviada anteriormente nesta conversa; pulando.")
-                continue
+                return "duplicada"
+            should = streamed = bool(reply)
+            print(f"[DEBUG] stream concluído: should={should} | Resposta: {reply}")
 
-            await self.send_reply(page, reply)
-            conv_sent.add(norm_reply)
-            self.last_replied_at[conv_key] = now
-            await page.wait_for_timeout(
-                int(getattr(settings, "delay_between_actions", 1.0) * 1000)
-            )
-
-            # registra o atendimento no CSV
+        if (not should) or fold(reply or "") == "acao: skip (pular)":
             try:
                 log_case(order_info, buyer_only)
             except Exception as e:
                 print(f"[DEBUG] falha ao registrar atendimento: {e}")
+            try:
+                log_label(order_info, buyer_only)
+            except Exception as e:
+                print(f"[DEBUG] falha ao registrar pedido: {e}")
+            print("[DEBUG] conversa registrada (skip)")
+            return "skip"
+
+        if order_info.get("orderId") and "{ORDER_ID}" in reply:
+            reply = reply.replace("{ORDER_ID}", order_info["orderId"])
+
+        if not streamed:
+            if self.state.was_sent(conv_key, reply):
+                print("[DEBUG] resposta já enviada anteriormente nesta conversa; pulando.")
+                return "duplicada"
+            await self.send_reply(page, reply)
+        self.state.record_reply(conv_key, reply, now)
+        # segue quando a bolha enviada aparece; delay_between_actions vira só o
+        # ritmo mínimo entre envios
+        sent_at = time.monotonic()
+        await waits.sent(page, SELLER_TEXT_SEL, reply)
+        pace = float(getattr(settings, "delay_between_actions", 0) or 0)
+        await self._sleep_until(sent_at + pace)
+
+        # registra o atendimento no CSV
+        try:
+            log_case(order_info, buyer_only)
+        except Exception as e:
+            print(f"[DEBUG] falha ao registrar atendimento: {e}")
+        return "respondida"
+
+    def remember_reply(self, buyer_only: List[str], reply: str, order_info) -> None:
+        """
+        Indexa uma resposta aprovada pelo operador (com {ORDER_ID} de volta).
+        Só o envio manual da UI chama isto: respostas do próprio bot não viram
+        template, senão um erro dele passaria a ser repetido sem o LLM.
+        """
+        if not settings.template_index or not buyer_only or reply == RESP_FALLBACK_CURTO:
+            return
+        oid = order_info.get("orderId") or ""
+        if oid:
+            reply = reply.replace(oid, "{ORDER_ID}")
+        try:
+            TEMPLATE_INDEX.remember(
+                buyer_only[-1], reply, order_stage(order_info), scope=self.session_user_id
+            )
+        except Exception as e:
+            print(f"[DEBUG] falha ao indexar resposta enviada: {e}")
+
+    def request_stop(self) -> None:
+        """Pede o encerramento: a conversa em andamento termina e o laço sai."""
+        self.stop_event.set()
+        self.pause_event.set()  # não fica preso numa pausa da UI
+
+    async def _sleep_until(self, deadline: float) -> None:
+        """Dorme até ``deadline`` (monotonic), acordando antes se pedirem parada."""
+        delay = deadline - time.monotonic()
+        if delay <= 0:
+            return
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
 
-    async def run_once(self, decide_reply_fn):
-        """Modo pontual (mantido por compat)."""
+    async def run_once(self, decide_reply_fn, hold_seconds: float = 0.0):
+        """Uma varredura. ``hold_seconds`` mantém o navegador aberto ao final (inspeção manual)."""
         async with async_playwright() as p:
             ctx = await self._new_context(p)
-            page = await self._get_page(ctx)
-            await self.ensure_login(page)
-            await self._cycle(page, decide_reply_fn)
-            print("[DEBUG] Execução concluída. Mantendo o navegador aberto por ~60s...")
-            await asyncio.sleep(60)
             try:
-                await ctx.close()
+                page = await self._get_page(ctx)
+                await self.ensure_login(page)
+                await self._open_tabs(ctx)
+                with metrics.timer("cycle.duration"):
+                    await self._cycle(page, decide_reply_fn)
+                self.state.snapshot(force=True)
+                MESSAGES.snapshot(force=True)
+                if hold_seconds > 0:
+                    print(
+                        f"[DEBUG] Execução concluída. Mantendo o navegador aberto por ~{hold_seconds:.0f}s..."
+                    )
+                    await self._sleep_until(time.monotonic() + hold_seconds)
             finally:
-                self.current_page = None
+                try:
+                    await self._close_context(ctx)
+                finally:
+                    self.current_page = None
+                    self.extra_pages = []
+                    await self._close_shared_browser()
 
     async def run_forever(self, decide_reply_fn, idle_seconds: float = 3.0):
         """
-        Loop infinito, com auto-recuperação.
-        Use este método a partir do app_ui (start/stop via task).
+        Loop infinito sobre um único navegador, com auto-recuperação.
+
+        O contexto e o login são feitos uma vez. Com ``event_wakeups`` o
+        próximo ciclo começa assim que a página avisa de uma conversa não lida
+        (só as avisadas são abertas) e, sem avisos, uma varredura completa
+        roda a cada ``safety_poll_seconds``; sem eventos, cada ciclo começa
+        ``idle_seconds`` após o início do anterior. O contexto é recriado após
+        erro, com backoff até 60s, e, no modo compartilhado, a cada
+        ``context_recycle_minutes`` (sessão regravada). ``request_stop()``
+        encerra ao fim da conversa em andamento.
+        Usado pelo app_ui (start/stop via task) e por ``src.run_loop``.
         """
+        self.stop_event.clear()
+        backoff = 2.0
+        # só o contexto efêmero (modo compartilhado) é reciclado por tempo; o
+        # perfil persistente é a sessão longa e só cai por erro ou memória
+        recycle_after = (
+            float(settings.context_recycle_minutes) * 60
+            if shared_mode(self.browser_mode)
+            else 0.0
+        )
         async with async_playwright() as p:
-            while True:
+            while not self.stop_event.is_set():
                 ctx = None
+                recycled = False
                 try:
                     ctx = await self._new_context(p)
                     page = await self._get_page(ctx)
                     await self.ensure_login(page)
-
-                    while True:
-                        await self._cycle(page, decide_reply_fn)
-                        await asyncio.sleep(idle_seconds)
+                    await self._open_tabs(ctx)
+                    backoff = 2.0
+                    opened = time.monotonic()
+
+                    focus = None
+                    while not self.stop_event.is_set():
+                        started = time.monotonic()
+                        with metrics.timer("cycle.duration"):
+                            await self._cycle(page, decide_reply_fn, focus)
+                        metrics.incr("cycle.count")
+                        if recycle_after > 0 and time.monotonic() - opened >= recycle_after:
+                            print("[DEBUG] reciclando contexto do navegador")
+                            metrics.incr("browser.context_recycled")
+                            recycled = True
+                            break
+                        if await self._watchdog_point(page):
+                            print("[DEBUG] reciclando contexto do navegador (memória)")
+                            metrics.incr("browser.context_recycled")
+                            recycled = True
+                            break
+                        woke = await self._wait_for_work(started, idle_seconds)
+                        focus = self.take_changed_rows() if woke else None
 
                 except asyncio.CancelledError:
-                    try:
-                        if ctx:
-                            await ctx.close()
-                    finally:
-                        self.current_page = None
                     break
                 except PwError as e:
-                    print(f"[ERROR] Playwright: {e}. Reiniciando em 2s...")
-                    await asyncio.sleep(2)
-                    continue
+                    print(f"[ERROR] Playwright: {e}. Reiniciando em {backoff:.0f}s...")
                 except Exception as e:
-                    print(f"[ERROR] run_forever: {e}. Tentando novamente em 2s...")
-                    await asyncio.sleep(2)
-                    continue
+                    print(f"[ERROR] run_forever: {e}. Tentando novamente em {backoff:.0f}s...")
                 finally:
-                    try:
-                        if ctx:
-                            await ctx.close()
-                    except Exception:
-                        pass
+                    self.state.snapshot(force=True)
+                    MESSAGES.snapshot(force=True)
+                    await self._close_context(ctx)
                     self.current_page = None
+                    self.extra_pages = []
+
+                if not self.stop_event.is_set() and not recycled:
+                    await self._sleep_until(time.monotonic() + backoff)
+                    backoff = min(backoff * 2, 60.0)
+            await self._close_shared_browser()
+        print("[DEBUG] run_forever encerrado.")
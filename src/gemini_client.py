@@ -1,23 +1,41 @@
 # gemini_client.py
+from functools import lru_cache
+
 import google.generativeai as genai
+from . import metrics
 from .config import settings
+from .conversation import as_order_info
 from .firebase_client import get_product_by_sku
+from .prompt_sections import select_prompt, strip_tags
 
 
-def get_gemini():
+def get_gemini(model_name: str | None = None):
     if not settings.gemini_api_key:
         raise RuntimeError("GEMINI_API_KEY ausente. Configure no .env")
+    return _model(model_name or settings.gemini_model)
+
+
+@lru_cache(maxsize=4)
+def _model(model_name: str):
+    # um GenerativeModel por nome, reaproveitado entre chamadas
     genai.configure(api_key=settings.gemini_api_key)
     return genai.GenerativeModel(
-        model_name="gemini-1.5-flash",
+        model_name=model_name,
         generation_config={
-            "temperature": 0.2,
-            "top_p": 0.9,
+            "temperature": settings.gemini_temperature,
+            "top_p": settings.gemini_top_p,
         },
     )
 
 
-def _order_stage_context(order_info: dict | None) -> str:
+def order_stage(order_info) -> str:
+    """Estágio do pedido: pre_venda | pos_venda | enviado | entregue | desconhecido."""
+    if not order_info:
+        return "desconhecido"
+    return as_order_info(order_info).stage
+
+
+def _order_stage_context(order_info) -> str:
     """Gera um pequeno resumo do estágio do pedido para orientar o modelo (NÃO exibir ao cliente)."""
     # Default (sem info)
     if not order_info:
@@ -31,94 +49,121 @@ def _order_stage_context(order_info: dict | None) -> str:
             "completed_time:\n"
         )
 
-    st_raw = (
-        order_info.get("status") or order_info.get("status_consolidado") or ""
-    ).strip()
-    st = st_raw.lower()
-
-    fields = order_info.get("fields") or {}
-    order_id = order_info.get("orderId") or ""
-
-    payment_time = fields.get("Payment Time", "") or fields.get("Hora do pagamento", "")
-    completed_time = fields.get("Completed Time", "") or fields.get(
-        "Hora de conclusão", ""
-    )
-    logistics_status = fields.get("Logistics Status", "") or fields.get(
-        "Status logístico", ""
-    )
-    latest_desc = order_info.get("logistics_latest_desc", "") or fields.get(
-        "Latest Logistics Description", ""
+    o = as_order_info(order_info)
+    return (
+        f"estado_pedido: {o.stage}\n"
+        f"order_id: {o.order_id}\n"
+        f"status: {o.status or o.logistics_status}\n"
+        f"payment_time: {o.payment_time}\n"
+        f"logistics_status: {o.logistics_status}\n"
+        f"latest_logistics_description: {o.latest_desc}\n"
+        f"completed_time: {o.completed_time}\n"
     )
 
-    # Heurística de estágio
-    shipped_tokens = (
-        "shipped",
-        "enviado",
-        "a caminho",
-        "in transit",
-        "out for delivery",
-        "despachado",
-    )
-    delivered_tokens = ("delivered", "entregue", "completed", "finalizado", "concluído")
 
-    if completed_time or any(tok in st for tok in delivered_tokens):
-        fase = "entregue"
-    elif (
-        any(tok in st for tok in shipped_tokens)
-        or "pedido entregue" in latest_desc.lower()
-    ):
-        fase = "enviado"
-    elif (
-        order_id
-        or payment_time
-        or any(tok in st for tok in ("to ship", "ready to ship"))
-    ):
-        fase = "pos_venda"
-    else:
-        fase = "pre_venda"
+def summarize_turns(previous_summary: str, turns: str) -> str:
+    """Condensa turnos antigos da conversa num resumo curto (uso interno, não vai ao cliente)."""
+    if not settings.gemini_api_key or not turns.strip():
+        return ""
+    try:
+        model = get_gemini()
+        prompt = f"""Resuma a conversa de atendimento abaixo em até 5 linhas objetivas.
+Mantenha: problema relatado, pedidos/produtos citados, o que já foi oferecido ou combinado
+e o que ainda está pendente. Não invente fatos. Devolva apenas o resumo.
 
-    return (
-        f"estado_pedido: {fase}\n"
-        f"order_id: {order_id}\n"
-        f"status: {st_raw}\n"
-        f"payment_time: {payment_time}\n"
-        f"logistics_status: {logistics_status}\n"
-        f"latest_logistics_description: {latest_desc}\n"
-        f"completed_time: {completed_time}\n"
-    )
+[Resumo anterior]
+{previous_summary or "(nenhum)"}
 
+[Novos turnos]
+{turns}
+""".strip()
+        resp = model.generate_content(prompt)
+        return (getattr(resp, "text", "") or "").strip()
+    except Exception:
+        return ""
 
-def generate_reply(history: str, order_info: dict | None = None) -> str:
-    """Gera resposta direta com base nas últimas mensagens + contexto do pedido.
 
-    Também garante que, se houver um SKU disponível, os dados do produto
-    correspondente sejam recuperados do sistema de produtos e enviados como
-    contexto ao Gemini."""
+def critique_reply(
+    draft: str,
+    issues: list,
+    buyer_text: str,
+    stage: str,
+    model_name: str | None = None,
+) -> str:
+    """Segunda etapa (crítico): corrige só os problemas apontados, com prompt curto."""
     if not settings.gemini_api_key:
         return ""
     try:
-        if order_info and not order_info.get("product_info"):
-            sku = order_info.get("sku")
-            if sku:
-                prod = get_product_by_sku(sku)
-                if prod:
-                    order_info = dict(order_info)
-                    order_info["product_info"] = prod
+        model = get_gemini(model_name)
+        problemas = "\n".join(f"- {i}" for i in issues)
+        prompt = f"""Você revisa respostas de atendimento de uma loja na Shopee.
+Corrija o rascunho abaixo resolvendo APENAS os problemas listados.
+Regras: 1–2 frases, tom educado, sem rastreio/status/rótulos internos, sem prometer data.
+Se o caso for de PIX/comprovante/reembolso que não caiu, devolva exatamente: Ação: skip (pular)
+Devolva apenas a mensagem final ao cliente.
+
+estado_pedido: {stage}
+
+[Problemas]
+{problemas}
+
+[Mensagens do comprador]
+{buyer_text[-800:]}
+
+[Rascunho]
+{draft}
+""".strip()
+        resp = model.generate_content(prompt)
+        return (getattr(resp, "text", "") or "").strip()
+    except Exception:
+        return ""
+
+
+def _base_prompt(order_info, hints, buyer_text: str) -> str:
+    """Prompt base: só as seções relevantes quando ``prompt_sections`` está ativo."""
+    if not settings.prompt_sections:
+        return strip_tags(settings.base_prompt)
+    prefix, names = select_prompt(
+        settings.base_prompt,
+        stage=order_stage(order_info),
+        hints=tuple(sorted(hints or ())),
+        buyer_text=buyer_text,
+    )
+    print(
+        f"[DEBUG] prompt base: {len(prefix)}/{len(settings.base_prompt)} chars, seções={len(names)}"
+    )
+    return prefix
 
-        model = get_gemini()
-        contexto = _order_stage_context(order_info)
-        prod = order_info.get("product_info") if order_info else None
-        prod_context = ""
-        if prod:
-            prod_context = (
-                "[Dados do Produto]\n"
-                f"nome: {prod.get('nome','')}\n"
-                f"sku: {prod.get('sku','')}\n"
-                f"descricao: {prod.get('descricao','')}\n"
-                f"medidas: {prod.get('medidas','')}\n\n"
-            )
-
-        prompt = f"""{settings.base_prompt}
+
+def _build_prompt(
+    history: str,
+    order_info,
+    hints,
+    buyer_text: str,
+) -> str:
+    """Monta o prompt completo (seções do prompt base + produto + pedido + conversa)."""
+    if order_info and not order_info.get("product_info"):
+        sku = order_info.get("sku")
+        if sku:
+            prod = get_product_by_sku(sku)
+            if prod:
+                # mesmo objeto do ciclo: o produto fica disponível para as próximas etapas
+                order_info["product_info"] = prod
+
+    contexto = _order_stage_context(order_info)
+    prod = order_info.get("product_info") if order_info else None
+    prod_context = ""
+    if prod:
+        prod_context = (
+            "[Dados do Produto]\n"
+            f"nome: {prod.get('nome','')}\n"
+            f"sku: {prod.get('sku','')}\n"
+            f"descricao: {prod.get('descricao','')}\n"
+            f"medidas: {prod.get('medidas','')}\n\n"
+        )
+
+    base_prompt = _base_prompt(order_info, hints, buyer_text or history)
+    return f"""{base_prompt}
 
 INSTRUÇÕES ADICIONAIS (NÃO MOSTRAR AO CLIENTE):
 - Use o contexto do pedido abaixo para entender se é pré-venda, pós-venda, enviado ou entregue.
@@ -133,20 +178,92 @@ INSTRUÇÕES ADICIONAIS (NÃO MOSTRAR AO CLIENTE):
 {history}
 """.strip()
 
-        resp = model.generate_content(prompt)
-        text = (getattr(resp, "text", "") or "").strip()
 
-        # Higienização: remover aspas externas e evitar "Ação:" indevida
-        if (text.startswith('"') and text.endswith('"')) or (
-            text.startswith("'") and text.endswith("'")
-        ):
-            text = text[1:-1].strip()
+def clean_model_text(text: str) -> str:
+    """Higienização: remover aspas externas e evitar "Ação:" indevida."""
+    text = (text or "").strip()
+    if (text.startswith('"') and text.endswith('"')) or (
+        text.startswith("'") and text.endswith("'")
+    ):
+        text = text[1:-1].strip()
+
+    low = text.lower()
+    if low.startswith("ação:") and "skip" not in low:
+        # Não permitir outras "ações" além de skip
+        text = text.replace("Ação:", "").strip()
+
+    return text
 
-        low = text.lower()
-        if low.startswith("ação:") and "skip" not in low:
-            # Não permitir outras "ações" além de skip
-            text = text.replace("Ação:", "").strip()
 
-        return text
+def generate_reply(
+    history: str,
+    order_info=None,
+    hints=None,
+    buyer_text: str = "",
+    model_name: str | None = None,
+) -> str:
+    """Gera resposta direta com base nas últimas mensagens + contexto do pedido.
+
+    ``hints`` são IDs de intenção (classificador/regras) e ``buyer_text`` o texto
+    do comprador; ambos escolhem quais seções do prompt base são enviadas.
+    ``model_name`` vem do roteador de tiers (padrão: ``settings.gemini_model``);
+    se esse modelo falhar, a chamada é repetida uma vez com o modelo forte.
+
+    Também garante que, se houver um SKU disponível, os dados do produto
+    correspondente sejam recuperados do sistema de produtos e enviados como
+    contexto ao Gemini."""
+    if not settings.gemini_api_key:
+        return ""
+    try:
+        prompt = _build_prompt(history, order_info, hints, buyer_text)
+        try:
+            resp = get_gemini(model_name).generate_content(prompt)
+        except Exception as e:
+            strong = _fallback_model(model_name, e)
+            if not strong:
+                raise
+            resp = get_gemini(strong).generate_content(prompt)
+        return clean_model_text(getattr(resp, "text", "") or "")
     except Exception:
         return ""
+
+
+def _fallback_model(model_name: str | None, error: Exception) -> str:
+    """Modelo forte para repetir a chamada quando o tier leve falha ("" = sem fallback)."""
+    strong = settings.gemini_model
+    if not model_name or model_name == strong:
+        return ""
+    print(f"[DEBUG] modelo {model_name} falhou ({error}); repetindo com {strong}")
+    metrics.incr("router.fallback")
+    return strong
+
+
+async def stream_reply(
+    history: str,
+    order_info=None,
+    hints=None,
+    buyer_text: str = "",
+    model_name: str | None = None,
+):
+    """Versão em streaming de ``generate_reply``: gera os pedaços de texto crus conforme chegam."""
+    if not settings.gemini_api_key:
+        return
+    try:
+        prompt = _build_prompt(history, order_info, hints, buyer_text)
+        try:
+            resp = await get_gemini(model_name).generate_content_async(prompt, stream=True)
+        except Exception as e:
+            strong = _fallback_model(model_name, e)
+            if not strong:
+                raise
+            resp = await get_gemini(strong).generate_content_async(prompt, stream=True)
+        async for chunk in resp:
+            try:
+                piece = chunk.text
+            except Exception:
+                # pedaço sem texto (ex.: bloqueio de segurança); ignora
+                continue
+            if piece:
+                yield piece
+    except Exception as e:
+        print(f"[DEBUG] stream_reply interrompido: {e}")
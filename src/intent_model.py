@@ -0,0 +1,299 @@
+# src/intent_model.py
+"""
+Classificador de intenção treinável (regressão logística multinomial em NumPy).
+
+Treino offline a partir do registro de atendimentos (``problema`` +
+``ultimas_7_msgs_comprador`` em data/atendimentos.csv), reforçado pelas
+"Intenções de Correspondência" do catálogo do prompt::
+
+    python -m src.intent_model train            # grava models/intent_vN.npz
+    python -m src.intent_model eval "veio faltando uma peça"
+
+O modelo mais recente é carregado uma vez na importação (``INTENT_MODEL``).
+Sem arquivo de modelo, ``predict_intents`` cai nas regexes de
+``classifier.intent_from_text``.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import re
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+from .textnorm import fold
+from .vectorize import fit_idf, l2_normalize, tf_matrix, vectorize
+
+MODELS_DIR = Path("models")
+CASES_CSV = Path("data") / "atendimentos.csv"
+# formato do arquivo .npz; muda se as features mudarem
+MODEL_FORMAT = 2
+MODEL_DIM = 1 << 12
+FALLBACK = "fallback"
+MODEL_FILE_RE = re.compile(r"^intent_v(\d+)\.npz$")
+
+# rótulos de ``problema`` (cases.TRIGGERS) -> IDs usados por regras/catálogo/roteador
+PROBLEMA_INTENTS = {
+    "reembolso parcial": "reembolso_parcial",
+    "enviar nova peça": "nova_peca",
+    "enviar peça faltante": "faltando_peca",
+}
+
+
+def label_from_problema(problema: str) -> str:
+    """Converte o ``problema`` registrado num ID de intenção."""
+    p = (problema or "").strip().lower()
+    if not p:
+        return FALLBACK
+    if p in PROBLEMA_INTENTS:
+        return PROBLEMA_INTENTS[p]
+    return re.sub(r"\W+", "_", fold(p)).strip("_") or FALLBACK
+
+
+class IntentModel:
+    def __init__(self, W, b, idf, labels, dim: int, version: int = 0):
+        self.W = W.astype(np.float32)
+        self.b = b.astype(np.float32)
+        self.idf = idf.astype(np.float32)
+        self.labels = [str(x) for x in labels]
+        self.dim = int(dim)
+        self.version = version
+
+    # ---------- persistência ----------
+
+    @classmethod
+    def load(cls, path: Path) -> "IntentModel":
+        with np.load(path, allow_pickle=False) as z:
+            fmt = int(z["format"])
+            if fmt != MODEL_FORMAT:
+                raise ValueError(f"formato {fmt} != {MODEL_FORMAT}")
+            m = MODEL_FILE_RE.match(Path(path).name)
+            return cls(
+                z["W"], z["b"], z["idf"], z["labels"], int(z["dim"]),
+                int(m.group(1)) if m else 0,
+            )
+
+    def save(self, path: Path, n_samples: int) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            format=np.int32(MODEL_FORMAT),
+            dim=np.int32(self.dim),
+            W=self.W,
+            b=self.b,
+            idf=self.idf,
+            labels=np.array(self.labels),
+            n_samples=np.int32(n_samples),
+            trained_at=np.int64(time.time()),
+        )
+
+    # ---------- inferência ----------
+
+    def proba(self, texts: List[str]) -> np.ndarray:
+        """Probabilidades (n_textos × n_intenções) num único produto matricial."""
+        X = vectorize(texts, self.idf, self.dim)
+        Z = X @ self.W + self.b
+        Z -= Z.max(axis=1, keepdims=True)
+        P = np.exp(Z)
+        return P / P.sum(axis=1, keepdims=True)
+
+    def predict_batch(
+        self, texts: List[str], min_prob: float = 0.0
+    ) -> List[Tuple[str, float]]:
+        """(intenção, prob) por texto; abaixo de ``min_prob`` vira ``fallback``."""
+        if not texts:
+            return []
+        P = self.proba(texts)
+        idx = P.argmax(axis=1)
+        out = []
+        for row, j in enumerate(idx):
+            p = float(P[row, j])
+            out.append((self.labels[j] if p >= min_prob else FALLBACK, p))
+        return out
+
+
+def latest_model_path() -> Optional[Path]:
+    """Caminho configurado (INTENT_MODEL_PATH) ou o intent_vN.npz de maior N."""
+    configured = (getattr(settings, "intent_model_path", "") or "").strip()
+    if configured:
+        p = Path(configured)
+        return p if p.exists() else None
+    best: Tuple[int, Optional[Path]] = (-1, None)
+    for p in MODELS_DIR.glob("intent_v*.npz"):
+        m = MODEL_FILE_RE.match(p.name)
+        if m and int(m.group(1)) > best[0]:
+            best = (int(m.group(1)), p)
+    return best[1]
+
+
+def load_intent_model() -> Optional[IntentModel]:
+    path = latest_model_path()
+    if not path:
+        print("[DEBUG] modelo de intenção não encontrado; usando regexes")
+        return None
+    try:
+        model = IntentModel.load(path)
+        print(f"[DEBUG] modelo de intenção v{model.version}: {len(model.labels)} intenções")
+        return model
+    except Exception as e:
+        print(f"[DEBUG] falha ao carregar {path}: {e}")
+        return None
+
+
+# Carregado uma vez ao importar
+INTENT_MODEL = load_intent_model()
+
+
+def predict_intents(texts: List[str]) -> List[Tuple[str, float]]:
+    """Intenção por texto (lote). Sem modelo, usa as regexes do classificador."""
+    if INTENT_MODEL is None:
+        from .classifier import intent_from_text
+
+        return [(intent_from_text(t), 1.0) for t in texts]
+    return INTENT_MODEL.predict_batch(texts, settings.intent_min_prob)
+
+
+# ---------- treino ----------
+
+
+def load_training_data(
+    csv_path: Path = CASES_CSV, with_catalog: bool = True
+) -> Tuple[List[str], List[str]]:
+    texts: List[str] = []
+    labels: List[str] = []
+    if csv_path.exists():
+        with csv_path.open("r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                msgs = (row.get("ultimas_7_msgs_comprador") or "").replace(" | ", "\n")
+                if msgs.strip():
+                    texts.append(msgs)
+                    labels.append(label_from_problema(row.get("problema", "")))
+    if with_catalog:
+        from .prompt_sections import parse_sections
+        from .rules import load_rules
+
+        for sec in parse_sections(settings.base_prompt):
+            for kw in sec.keywords:
+                texts.append(kw)
+                labels.append(sec.name)
+        for rule in load_rules():
+            if rule.get("active", True) and rule.get("id"):
+                for kw in (rule.get("match") or {}).get("any_contains") or []:
+                    texts.append(kw.lower())
+                    labels.append(rule["id"])
+    return texts, labels
+
+
+def train(
+    texts: List[str],
+    labels: List[str],
+    epochs: int = 500,
+    lr: float = 2.0,
+    l2: float = 1e-4,
+    dim: int = MODEL_DIM,
+) -> IntentModel:
+    """Regressão logística multinomial por gradiente em lote (classes balanceadas)."""
+    classes = sorted(set(labels))
+    if FALLBACK not in classes:
+        classes.append(FALLBACK)
+    y = np.array([classes.index(l) for l in labels])
+    n, k = len(texts), len(classes)
+
+    tf = tf_matrix(texts, dim)
+    idf = fit_idf(tf)
+    X = l2_normalize(tf * idf)
+    del tf
+    Y = np.zeros((n, k), dtype=np.float32)
+    Y[np.arange(n), y] = 1.0
+    counts = np.bincount(y, minlength=k).astype(np.float32)
+    sw = (n / (k * np.maximum(counts, 1.0)))[y][:, None] / n
+
+    W = np.zeros((dim, k), dtype=np.float32)
+    b = np.zeros(k, dtype=np.float32)
+    for _ in range(epochs):
+        Z = X @ W + b
+        Z -= Z.max(axis=1, keepdims=True)
+        P = np.exp(Z)
+        P /= P.sum(axis=1, keepdims=True)
+        G = (P - Y) * sw
+        W -= lr * (X.T @ G + l2 * W)
+        b -= lr * G.sum(axis=0)
+    return IntentModel(W, b, idf, classes, dim)
+
+
+def next_model_path() -> Path:
+    versions = [
+        int(m.group(1))
+        for p in MODELS_DIR.glob("intent_v*.npz")
+        if (m := MODEL_FILE_RE.match(p.name))
+    ]
+    return MODELS_DIR / f"intent_v{max(versions, default=0) + 1}.npz"
+
+
+def _cmd_train(args) -> None:
+    texts, labels = load_training_data(Path(args.csv), not args.sem_catalogo)
+    if len(set(labels)) < 2:
+        print("[TREINO] dados insuficientes (menos de 2 intenções)")
+        return
+    print(f"[TREINO] {len(texts)} exemplos, {len(set(labels))} intenções")
+
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(texts))
+    cut = int(len(order) * 0.8) if args.holdout else len(order)
+    tr, te = order[:cut], order[cut:]
+    t0 = time.perf_counter()
+    model = train(
+        [texts[i] for i in tr], [labels[i] for i in tr], epochs=args.epochs, lr=args.lr
+    )
+    print(f"[TREINO] ajuste em {time.perf_counter() - t0:.1f}s")
+    if len(te):
+        pred = model.predict_batch([texts[i] for i in te])
+        acc = np.mean([p == labels[i] for (p, _), i in zip(pred, te)])
+        print(f"[TREINO] acurácia holdout: {acc:.1%} ({len(te)} exemplos)")
+        model = train(texts, labels, epochs=args.epochs, lr=args.lr)
+
+    out = Path(args.out) if args.out else next_model_path()
+    model.save(out, len(texts))
+    print(f"[TREINO] modelo salvo em {out}")
+
+
+def _cmd_eval(args) -> None:
+    if INTENT_MODEL is None:
+        print("[EVAL] nenhum modelo carregado")
+        return
+    t0 = time.perf_counter()
+    preds = INTENT_MODEL.predict_batch(args.texts, settings.intent_min_prob)
+    dt = time.perf_counter() - t0
+    for text, (label, p) in zip(args.texts, preds):
+        print(f"{p:.2f} {label:<28} {text}")
+    print(f"[EVAL] {1e3 * dt:.2f} ms para {len(args.texts)} textos")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m src.intent_model")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_tr = sub.add_parser("train", help="treina e grava models/intent_vN.npz")
+    p_tr.add_argument("--csv", default=str(CASES_CSV))
+    p_tr.add_argument("--out", default="")
+    p_tr.add_argument("--epochs", type=int, default=500)
+    p_tr.add_argument("--lr", type=float, default=2.0)
+    p_tr.add_argument("--holdout", action="store_true", help="mede acurácia em 20%% separados")
+    p_tr.add_argument(
+        "--sem-catalogo", action="store_true", help="ignora catálogo do prompt e regras"
+    )
+    p_ev = sub.add_parser("eval", help="classifica textos com o modelo carregado")
+    p_ev.add_argument("texts", nargs="+")
+    args = ap.parse_args()
+
+    if args.cmd == "train":
+        _cmd_train(args)
+    elif args.cmd == "eval":
+        _cmd_eval(args)
+
+
+if __name__ == "__main__":
+    main()
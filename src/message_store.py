@@ -0,0 +1,164 @@
+# src/message_store.py
+"""
+Histórico local de mensagens por conversa, para leitura incremental.
+
+Na primeira visita a conversa é lida inteira; nas seguintes o bot procura no
+DOM o cursor (últimas ``CURSOR_LEN`` mensagens já conhecidas) de trás para a
+frente e só extrai o que veio depois dele. O resto do histórico sai daqui.
+
+- LRU em memória (``message_store_max_conversations``), até ``MAX_MESSAGES``
+  mensagens por conversa.
+- SQLite (data/mensagens.sqlite3): conversas alteradas gravadas a cada
+  ``state_snapshot_seconds``; lidas sob demanda quando saem da memória.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+
+DATA_DIR = Path("data")
+DATA_DIR.mkdir(exist_ok=True)
+MESSAGES_DB_PATH = DATA_DIR / "mensagens.sqlite3"
+
+MAX_MESSAGES = 300
+# mensagens que identificam o ponto já lido
+CURSOR_LEN = 3
+
+Pairs = List[Tuple[str, str]]
+
+
+class MessageStore:
+    def __init__(self, path: Path = MESSAGES_DB_PATH):
+        self.path = path
+        self._entries: "OrderedDict[str, Pairs]" = OrderedDict()
+        self._dirty: set[str] = set()
+        self._last_snapshot = time.monotonic()
+        self._db = self._open()
+
+    @property
+    def max_entries(self) -> int:
+        return max(1, int(settings.message_store_max_conversations))
+
+    # ---------- persistência ----------
+
+    def _open(self) -> Optional[sqlite3.Connection]:
+        try:
+            db = sqlite3.connect(self.path)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS mensagens ("
+                " chave TEXT PRIMARY KEY,"
+                " pares TEXT,"
+                " atualizado REAL)"
+            )
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"[messages] SQLite indisponível ({e}); histórico só em memória")
+            return None
+
+    def _load(self, key: str) -> Optional[Pairs]:
+        if not self._db:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT pares FROM mensagens WHERE chave = ?", (key,)
+            ).fetchone()
+        except Exception as e:
+            print(f"[messages] falha ao ler {key}: {e}")
+            return None
+        if not row:
+            return None
+        return [tuple(p) for p in json.loads(row[0])]
+
+    def snapshot(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_snapshot < settings.state_snapshot_seconds:
+            return
+        self._last_snapshot = now
+        if not self._dirty:
+            return
+        with metrics.timer("messages.snapshot"):
+            rows = {k: self._entries[k] for k in self._dirty if k in self._entries}
+            if self._write(rows, prune=True):
+                self._dirty.clear()
+
+    def _write(self, rows: dict, prune: bool = False) -> bool:
+        if not self._db:
+            return False
+        try:
+            stamp = time.time()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO mensagens VALUES (?, ?, ?)",
+                [(k, json.dumps(v, ensure_ascii=False), stamp) for k, v in rows.items()],
+            )
+            if prune:
+                self._db.execute(
+                    "DELETE FROM mensagens WHERE atualizado < ?",
+                    (stamp - float(settings.state_ttl_hours) * 3600,),
+                )
+            self._db.commit()
+            return True
+        except Exception as e:
+            print(f"[messages] falha ao gravar histórico: {e}")
+            return False
+
+    def close(self) -> None:
+        self.snapshot(force=True)
+        if self._db:
+            self._db.close()
+            self._db = None
+
+    # ---------- acesso ----------
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            key, pairs = self._entries.popitem(last=False)
+            if key in self._dirty:
+                # grava antes de soltar da memória
+                self._write({key: pairs})
+                self._dirty.discard(key)
+
+    def get(self, key: str) -> Optional[Pairs]:
+        pairs = self._entries.get(key)
+        if pairs is None:
+            pairs = self._load(key)
+            if pairs is None:
+                return None
+            self._entries[key] = pairs
+            self._evict()
+        self._entries.move_to_end(key)
+        return pairs
+
+    def put(self, key: str, pairs: Pairs) -> Pairs:
+        pairs = list(pairs)[-MAX_MESSAGES:]
+        self._entries[key] = pairs
+        self._entries.move_to_end(key)
+        self._dirty.add(key)
+        self._evict()
+        self.snapshot()
+        return pairs
+
+    def extend(self, key: str, fresh: Pairs) -> Pairs:
+        """Acrescenta as mensagens lidas depois do cursor."""
+        pairs = self.get(key) or []
+        if not fresh:
+            return pairs
+        return self.put(key, pairs + [tuple(p) for p in fresh])
+
+    @staticmethod
+    def cursor(pairs: Pairs) -> Pairs:
+        return [list(p) for p in pairs[-CURSOR_LEN:]]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Instância compartilhada
+MESSAGES = MessageStore()
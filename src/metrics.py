@@ -0,0 +1,68 @@
+# src/metrics.py
+"""Contadores e latências em memória, expostos pela UI em /metrics."""
+from __future__ import annotations
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict
+
+# quantas amostras recentes guardar por métrica de tempo
+WINDOW = 500
+
+_COUNTERS: Dict[str, float] = {}
+_TIMINGS: Dict[str, Deque[float]] = {}
+_TIMING_TOTALS: Dict[str, int] = {}
+_GAUGES: Dict[str, float] = {}
+
+
+def incr(name: str, n: float = 1) -> None:
+    _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+
+def gauge(name: str, value: float) -> None:
+    _GAUGES[name] = value
+
+
+def observe(name: str, seconds: float) -> None:
+    """Registra uma duração (em segundos) na janela da métrica ``name``."""
+    _TIMINGS.setdefault(name, deque(maxlen=WINDOW)).append(seconds)
+    _TIMING_TOTALS[name] = _TIMING_TOTALS.get(name, 0) + 1
+
+
+@contextmanager
+def timer(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0)
+
+
+def _percentile(sorted_vals, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+
+def summary(name: str) -> Dict[str, float]:
+    vals = sorted(_TIMINGS.get(name) or ())
+    if not vals:
+        return {"count": _TIMING_TOTALS.get(name, 0)}
+    return {
+        "count": _TIMING_TOTALS.get(name, 0),
+        "avg_ms": round(1000 * sum(vals) / len(vals), 2),
+        "p50_ms": round(1000 * _percentile(vals, 0.50), 2),
+        "p95_ms": round(1000 * _percentile(vals, 0.95), 2),
+        "max_ms": round(1000 * vals[-1], 2),
+    }
+
+
+def snapshot(prefix: str = "") -> Dict[str, dict]:
+    # cópias: a decisão (thread) pode criar métricas durante a leitura
+    return {
+        "counters": {k: v for k, v in list(_COUNTERS.items()) if k.startswith(prefix)},
+        "gauges": {k: v for k, v in list(_GAUGES.items()) if k.startswith(prefix)},
+        "timings": {k: summary(k) for k in list(_TIMINGS) if k.startswith(prefix)},
+    }
@@ -0,0 +1,399 @@
+# src/net_capture.py
+"""
+Leitura dos dados pelo tráfego JSON do próprio app Duoke.
+
+O app web busca lista de conversas, mensagens e pedido como JSON; aqui
+``page.on("response")`` guarda essas respostas (XHR/fetch cujas URLs casam com
+``config/network.json``) e as converte nas mesmas estruturas que a leitura
+do DOM produz:
+
+- mensagens -> ``[(role, texto)]`` com role ``buyer``/``seller``;
+- pedido -> dict no formato dos extratores (``OrderInfo.from_scrape``); se o
+  payload traz vários pedidos (ex.: lista de pedidos do comprador), só vale o
+  único pedido que cita a conversa aberta;
+- conversas -> lista de dicts brutos (só contagem/diagnóstico por enquanto).
+
+Os campos são reconhecidos por nome (várias grafias), não por classe CSS.
+Payload que não dá para interpretar com segurança é descartado e o bot cai
+na leitura do DOM. O mesmo vale para payload que não cita a conversa aberta
+(nome do comprador da linha clicada ou ID do pedido): resposta atrasada da
+conversa anterior ou polling em segundo plano não viram dados desta.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+
+CONFIG_PATH = Path(__file__).resolve().parents[1] / "config" / "network.json"
+
+# ---------- nomes de campos reconhecidos ----------
+
+TEXT_KEYS = ("content", "text", "msg", "message", "body", "msg_content")
+TIME_KEYS = ("created_at", "createdAt", "create_time", "createTime", "send_time", "timestamp", "time", "ts")
+ID_KEYS = ("msg_id", "msgId", "message_id", "messageId", "id")
+SELLER_FLAGS = ("is_self", "isSelf", "from_me", "fromMe", "is_seller", "isSeller", "send_by_self")
+SENDER_KEYS = ("from_type", "fromType", "sender_type", "senderType", "sender_role", "role", "direction")
+BUYER_VALUES = {"buyer", "customer", "user", "receive", "received", "in", "incoming"}
+SELLER_VALUES = {"seller", "shop", "merchant", "agent", "staff", "send", "sent", "out", "outgoing"}
+SYSTEM_VALUES = {"system", "notice", "notification", "bot_system"}
+
+ORDER_ID_KEYS = ("order_sn", "orderSn", "order_id", "orderId", "order_no", "orderNo")
+ORDER_FIELDS = {
+    "status": ("order_status", "orderStatus", "status_text", "statusText", "status"),
+    "buyer_name": ("buyer_username", "buyerUsername", "buyer_name", "buyerName", "buyer_user_name"),
+    "payment_time": ("pay_time", "payTime", "paid_time", "payment_time", "paymentTime"),
+    "completed_time": ("complete_time", "completeTime", "completed_time", "finish_time"),
+    "buyer_payment_amount": ("buyer_paid_amount", "total_amount", "totalAmount", "pay_amount"),
+    "payment_method": ("payment_method", "paymentMethod"),
+    "shipping_provider": ("shipping_carrier", "shippingCarrier", "logistics_channel", "shipping_provider"),
+    "tracking_number": ("tracking_number", "trackingNumber", "tracking_no", "trackingNo"),
+    "logistics_status": ("logistics_status", "logisticsStatus", "logistic_status"),
+    "latest_logistics_description": ("latest_logistics_description", "logistics_desc", "logisticsDesc"),
+    "logistics_update_time": ("logistics_update_time", "logisticsUpdateTime"),
+}
+ITEM_LIST_KEYS = ("item_list", "itemList", "items", "products", "order_items", "orderItems")
+ITEM_FIELDS = {
+    "title": ("item_name", "itemName", "product_name", "productName", "title", "name"),
+    "variation": ("model_name", "modelName", "variation_name", "variation", "sku_name"),
+    "sku": ("model_sku", "modelSku", "item_sku", "itemSku", "seller_sku", "sku"),
+}
+TIME_FIELDS = {"payment_time", "completed_time", "logistics_update_time"}
+# campos que identificam de quem/qual pedido é o payload
+NAME_KEYS = (
+    "buyer_username", "buyerUsername", "buyer_name", "buyerName", "buyer_user_name",
+    "to_name", "toName", "from_name", "fromName", "nickname", "nick_name",
+    "username", "user_name", "contact_name", "contactName",
+)
+
+# fração mínima de mensagens com papel reconhecido para aceitar o payload
+MIN_ROLE_RATIO = 0.7
+
+
+def _load_config() -> dict:
+    try:
+        return json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[capture] config/network.json indisponível: {e}")
+        return {"url_contains": [], "kinds": {}}
+
+
+NET_CONFIG = _load_config()
+
+
+def classify_url(url: str, config: dict = NET_CONFIG) -> Optional[str]:
+    """``messages`` | ``order`` | ``conversations`` ou None (URL fora do app/desconhecida)."""
+    low = url.lower()
+    hosts = config.get("url_contains") or []
+    if hosts and not any(h in low for h in hosts):
+        return None
+    path = low.split("?", 1)[0]
+    for kind, patterns in (config.get("kinds") or {}).items():
+        if any(p in path for p in patterns):
+            return kind
+    return None
+
+
+# ---------- parsing ----------
+
+
+def _first(d: dict, keys: Iterable[str]) -> Any:
+    for k in keys:
+        v = d.get(k)
+        if v not in (None, ""):
+            return v
+    return None
+
+
+def _walk(node: Any, depth: int = 0):
+    """Percorre dicts/listas aninhados (profundidade limitada)."""
+    if depth > 6:
+        return
+    yield node
+    if isinstance(node, dict):
+        for v in node.values():
+            if isinstance(v, (dict, list)):
+                yield from _walk(v, depth + 1)
+    elif isinstance(node, list):
+        for v in node[:500]:
+            if isinstance(v, (dict, list)):
+                yield from _walk(v, depth + 1)
+
+
+def _fmt_time(value: Any) -> str:
+    if isinstance(value, (int, float)) and value > 1e9:
+        secs = value / 1000 if value > 1e12 else value
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(secs))
+    return str(value or "").strip()
+
+
+def _message_text(value: Any) -> str:
+    """Texto da mensagem; conteúdo estruturado ({"text": ...}) é desembrulhado."""
+    if isinstance(value, str):
+        s = value.strip()
+        if s.startswith("{"):
+            try:
+                value = json.loads(s)
+            except ValueError:
+                return s
+        else:
+            return s
+    if isinstance(value, dict):
+        inner = _first(value, ("text", "content", "msg"))
+        return inner.strip() if isinstance(inner, str) else ""
+    return ""
+
+
+def _message_role(item: dict) -> Optional[str]:
+    for k in SELLER_FLAGS:
+        if k in item and isinstance(item[k], (bool, int)):
+            return "seller" if item[k] else "buyer"
+    v = _first(item, SENDER_KEYS)
+    if isinstance(v, str):
+        low = v.strip().lower()
+        if low in SYSTEM_VALUES:
+            return "system"
+        if low in BUYER_VALUES:
+            return "buyer"
+        if low in SELLER_VALUES:
+            return "seller"
+    return None
+
+
+def _looks_like_messages(node: Any) -> bool:
+    if not isinstance(node, list) or not node:
+        return False
+    dicts = [x for x in node if isinstance(x, dict)]
+    if len(dicts) < max(1, len(node) // 2):
+        return False
+    with_text = sum(1 for d in dicts if any(k in d for k in TEXT_KEYS))
+    return with_text >= max(1, len(dicts) // 2)
+
+
+def parse_messages(payload: Any) -> Optional[List[Tuple[str, str, Any, Any]]]:
+    """
+    ``[(role, texto, id, hora)]`` em ordem cronológica, ou None se o payload
+    não trouxer uma lista de mensagens com papéis reconhecíveis.
+    """
+    lists = [n for n in _walk(payload) if _looks_like_messages(n)]
+    if not lists:
+        return None
+    items = max(lists, key=len)
+    out = []
+    known = 0
+    for d in items:
+        if not isinstance(d, dict):
+            continue
+        role = _message_role(d)
+        if role is not None:
+            known += 1
+        text = _message_text(_first(d, TEXT_KEYS))
+        if role in ("buyer", "seller") and text:
+            out.append((role, text, _first(d, ID_KEYS), _first(d, TIME_KEYS)))
+    if known < MIN_ROLE_RATIO * len(items):
+        return None
+    if out and all(isinstance(m[3], (int, float)) for m in out):
+        out.sort(key=lambda m: m[3])
+    return out
+
+
+def _order_details(order: dict) -> Dict[str, Any]:
+    """Dict no formato de ``extract_order_details_with_selectors``."""
+    details: Dict[str, Any] = {"orderId": str(_first(order, ORDER_ID_KEYS))}
+    for field, keys in ORDER_FIELDS.items():
+        v = _first(order, keys)
+        if v is None or isinstance(v, (dict, list)):
+            continue
+        details[field] = _fmt_time(v) if field in TIME_FIELDS else str(v).strip()
+
+    products: List[Dict[str, str]] = []
+    raw_items = _first(order, ITEM_LIST_KEYS)
+    for it in raw_items if isinstance(raw_items, list) else ():
+        if isinstance(it, dict):
+            products.append(
+                {f: str(_first(it, keys) or "").strip() for f, keys in ITEM_FIELDS.items()}
+            )
+    first = products[0] if products else {"title": "", "variation": "", "sku": ""}
+    details.update(products=products, **first)
+    details.setdefault("status", "")
+    details.setdefault("buyer_name", "")
+    details["status_consolidado"] = (
+        details.get("status") or details.get("logistics_status") or "desconhecido"
+    )
+    details["logistics_latest_desc"] = details.get("latest_logistics_description", "")
+    return details
+
+
+def parse_order(payload: Any) -> Optional[List[Tuple[Dict[str, Any], frozenset]]]:
+    """
+    Pedidos do payload como ``[(detalhes, IDs do próprio pedido)]`` (um por
+    número de pedido) ou None se nenhum dict traz número de pedido.
+    """
+    orders = []
+    seen = set()
+    for node in _walk(payload):
+        if not isinstance(node, dict) or not _first(node, ORDER_ID_KEYS):
+            continue
+        oid = ident(_first(node, ORDER_ID_KEYS))
+        if oid in seen:
+            continue  # itens/sub-objetos repetindo o número do pedido
+        seen.add(oid)
+        orders.append((_order_details(node), payload_ids(node)))
+    return orders or None
+
+
+def pick_order(
+    orders: List[Tuple[Dict[str, Any], frozenset]], expect: Optional[set] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Pedido da conversa aberta. Um pedido só: é ele (o payload já citou a
+    conversa). Vários: precisa ser o único cujos próprios campos citam ``expect``.
+    """
+    if len(orders) == 1:
+        return orders[0][0]
+    if not expect:
+        return None
+    own = [details for details, ids in orders if ids & expect]
+    return own[0] if len(own) == 1 else None
+
+
+def parse_conversations(payload: Any) -> Optional[List[dict]]:
+    lists = [
+        n
+        for n in _walk(payload)
+        if isinstance(n, list) and n and all(isinstance(x, dict) for x in n[:5])
+    ]
+    return max(lists, key=len) if lists else None
+
+
+def ident(value: Any) -> str:
+    return str(value or "").strip().casefold()
+
+
+def payload_ids(payload: Any) -> frozenset:
+    """Nomes de comprador e IDs de pedido citados no payload (normalizados)."""
+    ids = set()
+    for node in _walk(payload):
+        if not isinstance(node, dict):
+            continue
+        for k in ORDER_ID_KEYS + NAME_KEYS:
+            v = node.get(k)
+            if isinstance(v, (str, int)) and ident(v):
+                ids.add(ident(v))
+    return frozenset(ids)
+
+
+PARSERS = {
+    "messages": parse_messages,
+    "order": parse_order,
+    "conversations": parse_conversations,
+}
+
+
+# ---------- captura por aba ----------
+
+
+class NetworkCapture:
+    """Respostas JSON de uma aba, numeradas para saber o que chegou após um clique."""
+
+    def __init__(self):
+        self._seq = 0
+        self._latest: Dict[str, List[Tuple[int, Any, frozenset]]] = {k: [] for k in PARSERS}
+        self._arrived = asyncio.Event()
+
+    def attach(self, page) -> None:
+        page.on("response", self._on_response)
+
+    def mark(self) -> int:
+        """Marca o momento (ex.: antes de abrir uma conversa)."""
+        return self._seq
+
+    async def _on_response(self, response) -> None:
+        try:
+            if response.request.resource_type not in ("xhr", "fetch"):
+                return
+            kind = classify_url(response.url)
+            if not kind or "json" not in (response.headers.get("content-type") or ""):
+                return
+            payload = await response.json()
+        except Exception:
+            return
+        parsed = PARSERS[kind](payload)
+        if parsed is None:
+            metrics.incr(f"capture.unparsed.{kind}")
+            return
+        self._seq += 1
+        # guarda só as respostas recentes de cada tipo
+        entry = (self._seq, parsed, payload_ids(payload))
+        self._latest[kind] = (self._latest[kind] + [entry])[-8:]
+        metrics.incr(f"capture.{kind}")
+        self._arrived.set()
+
+    def since(self, kind: str, mark: int, expect: Optional[set] = None) -> List[Any]:
+        """Respostas após ``mark``; com ``expect``, só as que citam um desses IDs."""
+        return [
+            parsed
+            for seq, parsed, ids in self._latest.get(kind, ())
+            if seq > mark and (expect is None or ids & expect)
+        ]
+
+    async def wait_for(
+        self, kind: str, mark: int, timeout: float, expect: Optional[set] = None
+    ) -> List[Any]:
+        """Respostas de ``kind`` chegadas após ``mark`` (espera até ``timeout`` s pela 1ª)."""
+        deadline = time.monotonic() + timeout
+        while not self.since(kind, mark, expect):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+        found = self.since(kind, mark, expect)
+        if not found and self.since(kind, mark):
+            # chegou, mas de outra conversa/pedido
+            metrics.incr(f"capture.mismatch.{kind}")
+        return found
+
+    async def messages(
+        self, mark: int, timeout: float, expect: Optional[set] = None
+    ) -> Optional[List[Tuple[str, str]]]:
+        """Mensagens da conversa aberta após ``mark`` (páginas juntadas, sem repetição)."""
+        batches = await self.wait_for("messages", mark, timeout, expect)
+        if not batches:
+            metrics.incr("capture.miss.messages")
+            return None
+        seen = set()
+        merged = []
+        for batch in batches:
+            for role, text, mid, ts in batch:
+                key = mid if mid is not None else (role, text, ts)
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append((role, text, ts))
+        if all(isinstance(ts, (int, float)) for _, _, ts in merged):
+            merged.sort(key=lambda m: m[2])
+        metrics.incr("capture.hit.messages")
+        return [(role, text) for role, text, _ in merged]
+
+    async def order(
+        self, mark: int, timeout: float, expect: Optional[set] = None
+    ) -> Optional[Dict[str, Any]]:
+        found = await self.wait_for("order", mark, timeout, expect)
+        for orders in reversed(found):
+            picked = pick_order(orders, expect)
+            if picked is not None:
+                metrics.incr("capture.hit.order")
+                return picked
+        if found:
+            # vários pedidos sem um que seja claramente o da conversa
+            metrics.incr("capture.ambiguous.order")
+        metrics.incr("capture.miss.order")
+        return None
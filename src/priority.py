@@ -0,0 +1,245 @@
+# src/priority.py
+"""
+Ordem de atendimento da varredura, montada a partir da lista de conversas.
+
+Uma leitura da lista (``ROW_SCAN_JS``) dá, por linha, o nome, as mensagens
+não lidas, a hora mostrada e a prévia. A pontuação soma:
+
+- não lidas (até 10);
+- espera do comprador contra o SLA (``sla_minutes``): desde a hora mostrada
+  na linha (só o elemento de hora; "há 3 h" na prévia não conta) ou desde
+  quando o bot viu a conversa não lida pela primeira vez;
+- palavras de urgência na prévia (pós-venda: quebrado, devolução...; em
+  trânsito: não chegou, atrasado...);
+- estágio do pedido visto na visita anterior (entregue/enviado pesam mais).
+
+Classes: ``urgente`` (palavra de urgência ou SLA estourado) | ``aguardando``
+(não lida) | ``normal``. O tempo até a primeira resposta do bot vai para
+``metrics`` como ``first_response.<classe>`` (p95 no resumo).
+
+Linhas que ficaram para trás numa varredura (corte por limite ou prazo
+esgotado) ganham bônus na próxima, que recomeça com uma leitura nova da lista.
+``SweepBudget`` dá o prazo de cada varredura e o limite de conversas, ajustado
+pela latência medida por conversa (EWMA).
+"""
+from __future__ import annotations
+
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from . import metrics
+from .config import settings
+from .textnorm import normalize
+
+# Por linha: nome (1ª linha), não lidas (número do selo visível; selo sem
+# número = 1), hora (elemento de hora) e o resto do texto (prévia)
+ROW_SCAN_JS = """
+(els, [unreadSel, timeSel]) => els.map((el) => {
+  const lines = (el.innerText || '').split('\\n').map((s) => s.trim()).filter(Boolean);
+  const badge = el.querySelector(unreadSel);
+  let unread = 0;
+  if (badge && badge.offsetParent !== null) {
+    const n = parseInt((badge.innerText || '').replace(/\\D+/g, ''), 10);
+    unread = Number.isNaN(n) ? 1 : n;
+  }
+  const stamp = timeSel ? el.querySelector(timeSel) : null;
+  const time = stamp ? (stamp.innerText || '').trim() : '';
+  return { key: lines[0] || '', unread, time, text: lines.slice(1).join(' ') };
+})
+"""
+
+URGENT_AFTER_SALE = (
+    "quebrad", "defeito", "estragad", "danificad", "errad", "faltando", "faltou",
+    "devolu", "reembolso", "cancel", "procon", "reclame aqui", "golpe",
+)
+URGENT_IN_TRANSIT = (
+    "nao chegou", "ainda nao recebi", "nao recebi", "atrasad", "cade", "onde esta",
+    "rastreio", "extraviad",
+)
+STAGE_WEIGHT = {"entregue": 4.0, "enviado": 3.0, "pos_venda": 2.0}
+
+CLASSES = ("urgente", "aguardando", "normal")
+
+_REL_RE = re.compile(r"\b(\d+)\s*(min|mins|minutos?|m|h|hr|hrs|horas?)\b", re.I)
+_CLOCK_RE = re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)\b")
+
+# conversas lembradas (espera/estágio) antes de descartar as mais antigas
+MAX_TRACKED = 2000
+# bônus por varredura em que a linha ficou para trás
+CARRY_BONUS = 5.0
+# peso da última medida na média móvel da latência por conversa
+EWMA_ALPHA = 0.3
+
+
+class Row:
+    __slots__ = ("index", "key", "unread", "time", "text", "score", "cls")
+
+    def __init__(
+        self, index: int, key: str, unread: int = 0, text: str = "", time: str = ""
+    ):
+        self.index = index
+        self.key = key
+        self.unread = unread
+        self.time = time
+        self.text = text
+        self.score = 0.0
+        self.cls = "normal"
+
+    def __repr__(self) -> str:
+        return f"Row({self.index}, {self.key!r}, {self.cls}, {self.score:.1f})"
+
+
+def shown_since(text: str, now: float) -> Optional[float]:
+    """Momento da última mensagem pelo texto de hora da linha ("5 min", "2 h", "14:32")."""
+    m = _REL_RE.search(text or "")
+    if m:
+        n = int(m.group(1))
+        unit = m.group(2).lower()
+        return now - n * (3600 if unit.startswith("h") else 60)
+    m = _CLOCK_RE.search(text or "")
+    if m:
+        today = datetime.fromtimestamp(now).replace(
+            hour=int(m.group(1)), minute=int(m.group(2)), second=0, microsecond=0
+        )
+        ts = today.timestamp()
+        return ts if ts <= now else None
+    return None
+
+
+def urgency(text: str) -> bool:
+    norm = normalize(text or "")
+    return norm.has_any(URGENT_AFTER_SALE) or norm.has_any(URGENT_IN_TRANSIT)
+
+
+class Prioritizer:
+    def __init__(self):
+        # key -> [espera desde (epoch), classe mais grave vista]
+        self._waiting: "OrderedDict[str, list]" = OrderedDict()
+        self._stages: "OrderedDict[str, str]" = OrderedDict()
+        # key -> varreduras seguidas em que ficou para trás
+        self._carried: Dict[str, int] = {}
+        self._previous: Dict[str, int] = {}
+
+    @staticmethod
+    def _remember(table: OrderedDict, key: str, value) -> None:
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > MAX_TRACKED:
+            table.popitem(last=False)
+
+    async def scan(self, locator, unread_sel: str, time_sel: str = "") -> List[Row]:
+        """Linhas visíveis da lista de conversas (uma ida à página)."""
+        try:
+            raw = await locator.evaluate_all(ROW_SCAN_JS, [unread_sel, time_sel])
+        except Exception as e:
+            print(f"[DEBUG] falha ao ler a lista de conversas: {e}")
+            return []
+        return [
+            Row(
+                i,
+                r.get("key") or "",
+                int(r.get("unread") or 0),
+                r.get("text") or "",
+                r.get("time") or "",
+            )
+            for i, r in enumerate(raw)
+        ]
+
+    def note_stage(self, key: str, stage: str) -> None:
+        if key and stage:
+            self._remember(self._stages, key, stage)
+
+    def _score(self, row: Row, now: float) -> None:
+        sla = max(1.0, float(settings.sla_minutes)) * 60
+        waiting = self._waiting.get(row.key)
+        if row.unread and row.key:
+            since = shown_since(row.time, now) or now
+            if waiting is None:
+                waiting = [since, "aguardando"]
+            else:
+                waiting[0] = min(waiting[0], since)
+            self._remember(self._waiting, row.key, waiting)
+        waited = now - waiting[0] if waiting else 0.0
+        urgent = urgency(row.text)
+
+        score = min(row.unread, 10) + 10 * waited / sla
+        if waited >= sla:
+            score += 20
+        if urgent:
+            score += 15
+        score += STAGE_WEIGHT.get(self._stages.get(row.key, ""), 0.0)
+        score += CARRY_BONUS * self._carried.get(row.key, 0)
+        row.score = score
+
+        if urgent or waited >= sla:
+            row.cls = "urgente"
+        elif waiting:
+            row.cls = "aguardando"
+        if waiting and CLASSES.index(row.cls) < CLASSES.index(waiting[1]):
+            waiting[1] = row.cls
+
+    def plan(self, rows: List[Row], limit: int = 0, ranked: bool = True) -> List[Row]:
+        """Linhas na ordem de atendimento (maior pontuação primeiro), até ``limit``."""
+        now = time.time()
+        for row in rows:
+            self._score(row, now)
+        if ranked:
+            rows = sorted(rows, key=lambda r: (-r.score, r.index))
+        # varredura focada planeja só as linhas avisadas: as demais mantêm o bônus
+        planned = {r.key for r in rows}
+        self._previous = self._carried
+        self._carried = {k: n for k, n in self._previous.items() if k not in planned}
+        while len(self._carried) > MAX_TRACKED:
+            self._carried.pop(next(iter(self._carried)))
+        if limit > 0:
+            self.carry(rows[limit:])
+            rows = rows[:limit]
+        for cls in CLASSES:
+            metrics.gauge(f"priority.{cls}", sum(1 for r in rows if r.cls == cls))
+        return rows
+
+    def carry(self, rows: List[Row]) -> None:
+        """Linhas não atendidas nesta varredura: sobem na próxima."""
+        for row in rows:
+            if row.key:
+                self._carried[row.key] = self._previous.get(row.key, 0) + 1
+        metrics.gauge("sweep.carried", len(self._carried))
+
+    def done(self, key: str, replied: bool) -> None:
+        """Conversa atendida: registra o tempo até a 1ª resposta e esquece a espera."""
+        waiting = self._waiting.pop(key, None)
+        if waiting and replied:
+            metrics.observe(f"first_response.{waiting[1]}", time.time() - waiting[0])
+
+
+class SweepBudget:
+    """Prazo da varredura e limite de conversas pela latência medida (EWMA)."""
+
+    def __init__(self):
+        self.per_conversation: Optional[float] = None
+
+    @property
+    def seconds(self) -> float:
+        return max(0.0, float(settings.sweep_budget_seconds))
+
+    def deadline(self, started: float) -> Optional[float]:
+        return started + self.seconds if self.seconds else None
+
+    def observe(self, seconds: float) -> None:
+        if self.per_conversation is None:
+            self.per_conversation = seconds
+        else:
+            self.per_conversation += EWMA_ALPHA * (seconds - self.per_conversation)
+        metrics.gauge("sweep.conversation_s", round(self.per_conversation, 3))
+
+    def limit(self, static: int, tabs: int) -> int:
+        """Conversas que cabem no prazo com ``tabs`` abas (0 = sem limite)."""
+        if not self.seconds or not self.per_conversation:
+            return static
+        fits = max(1, int(self.seconds * max(1, tabs) / self.per_conversation))
+        limit = min(static, fits) if static > 0 else fits
+        metrics.gauge("sweep.limit", limit)
+        return limit
@@ -0,0 +1,148 @@
+# src/prompt_sections.py
+"""
+Seleção de seções do prompt base (config/prompt.txt).
+
+O arquivo é dividido por linhas de marcação::
+
+    ### secao: tempo_envio | estagios: pre_venda, pos_venda
+    ### secao: pix_pendente | sempre
+
+Seções ``sempre`` entram em toda chamada. As demais (entradas do catálogo)
+entram quando o ID foi sugerido pelo classificador/regras ou quando alguma das
+"Intenções de Correspondência" aparece nas mensagens do comprador, desde que o
+estágio do pedido seja compatível. Seções sugeridas entram em qualquer estágio.
+Prompts sem marcação são enviados inteiros.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Tuple
+
+from .textnorm import fold
+
+TAG_RE = re.compile(r"^###\s*secao:\s*(.+?)\s*$", re.I | re.M)
+MATCH_RE = re.compile(r"(?im)^Inten[çc][õo]es de Correspond[êe]ncia:\s*(.+)$")
+EXCLUDE_RE = re.compile(r"(?im)^Exclus[õo]es:\s*(.+)$")
+REPLY_RE = re.compile(r'(?im)^Resposta:\s*"(.+)"\s*$')
+QUOTED_RE = re.compile(r'"([^"]+)"')
+
+# Estágio sem informação do pedido: não filtra o catálogo
+UNKNOWN_STAGE = "desconhecido"
+
+
+@dataclass(frozen=True)
+class Section:
+    name: str
+    body: str
+    always: bool = False
+    stages: frozenset = frozenset()
+    keywords: Tuple[str, ...] = ()
+    exclusions: Tuple[str, ...] = ()
+    # texto de "Resposta:" da entrada do catálogo (quebras \n já expandidas)
+    reply: str = ""
+
+    def allowed_in(self, stage: str) -> bool:
+        return not self.stages or stage == UNKNOWN_STAGE or stage in self.stages
+
+
+def _quoted(regex: re.Pattern, body: str) -> Tuple[str, ...]:
+    m = regex.search(body)
+    if not m:
+        return ()
+    return tuple(q.strip().lower() for q in QUOTED_RE.findall(m.group(1)) if q.strip())
+
+
+def _reply(body: str) -> str:
+    m = REPLY_RE.search(body)
+    return m.group(1).replace("\\n", "\n").strip() if m else ""
+
+
+@lru_cache(maxsize=8)
+def parse_sections(text: str) -> Tuple[Section, ...]:
+    """Quebra o prompt nas seções marcadas. Sem marcação, devolve uma seção única ``sempre``."""
+    tags = list(TAG_RE.finditer(text or ""))
+    if not tags:
+        return (Section(name="prompt", body=(text or "").strip(), always=True),)
+
+    sections: list[Section] = []
+    head = text[: tags[0].start()].strip()
+    if head:
+        sections.append(Section(name="_inicio", body=head, always=True))
+
+    for i, tag in enumerate(tags):
+        end = tags[i + 1].start() if i + 1 < len(tags) else len(text)
+        body = text[tag.end() : end].strip()
+        parts = [p.strip() for p in tag.group(1).split("|")]
+        name = parts[0]
+        always = False
+        stages: frozenset = frozenset()
+        for attr in parts[1:]:
+            key, _, value = attr.partition(":")
+            key = key.strip().lower()
+            if key == "sempre":
+                always = True
+            elif key == "estagios":
+                stages = frozenset(s.strip() for s in value.split(",") if s.strip())
+        sections.append(
+            Section(
+                name=name,
+                body=body,
+                always=always,
+                stages=stages,
+                keywords=_quoted(MATCH_RE, body),
+                exclusions=_quoted(EXCLUDE_RE, body),
+                reply=_reply(body),
+            )
+        )
+    return tuple(sections)
+
+
+def strip_tags(text: str) -> str:
+    """Prompt completo sem as linhas de marcação (modo sem seleção)."""
+    return TAG_RE.sub("", text or "").replace("\n\n\n", "\n\n").strip()
+
+
+@lru_cache(maxsize=256)
+def _assemble(text: str, names: Tuple[str, ...]) -> str:
+    wanted = set(names)
+    return "\n\n".join(s.body for s in parse_sections(text) if s.name in wanted)
+
+
+def select_prompt(
+    text: str,
+    stage: str = UNKNOWN_STAGE,
+    hints: Iterable[str] = (),
+    buyer_text: str = "",
+) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Retorna (prefixo, nomes_das_seções) relevantes para a conversa.
+
+    O prefixo montado é cacheado por combinação de seções.
+    """
+    sections = parse_sections(text)
+    hints = {h for h in hints if h}
+    low = fold(buyer_text)
+
+    # o estágio é só um indício (cai em pre_venda quando a leitura do pedido
+    # falha): seção sugerida por regra/classificador entra mesmo fora dele
+    allowed = [s for s in sections if s.always or s.allowed_in(stage)]
+    picked = [s for s in sections if not s.always and s.name in hints]
+    for s in allowed:
+        if s.always:
+            picked.append(s)
+        elif s in picked:
+            continue
+        elif any(fold(k) in low for k in s.keywords) and not any(
+            fold(x) in low for x in s.exclusions
+        ):
+            picked.append(s)
+
+    # Nada específico casou: mantém todo o catálogo compatível com o estágio
+    if all(s.always for s in picked):
+        picked = allowed
+
+    order = {s.name: i for i, s in enumerate(sections)}
+    names = tuple(sorted({s.name for s in picked}, key=order.__getitem__))
+    return _assemble(text, names), names
@@ -0,0 +1,111 @@
+# src/refine.py
+"""
+Refino ``manager_critic``: o rascunho do Gemini passa por checagens locais
+baratas e só vai para uma segunda chamada (crítico) quando alguma falha.
+No caso comum (rascunho limpo) o custo é o de uma única chamada.
+"""
+from __future__ import annotations
+
+import re
+from typing import List
+
+from . import metrics
+from .config import settings
+from .gemini_client import critique_reply
+from .prompt_sections import parse_sections
+from .textnorm import fold
+
+# limite de segurança quando refine_max_chars = 0
+DEFAULT_MAX_CHARS = 700
+
+BANNED_RE = re.compile(
+    r"(\bID:|\bResposta:|estado_pedido|order_id|logistics_|payment_time|"
+    r"Inten[çc][õo]es de Correspond|\[Contexto|\[Conversa|\[Dados do Produto)",
+    re.I,
+)
+TRACKING_RE = re.compile(r"\b[A-Z]{2}\d{8,}[A-Z0-9]*\b")
+# número de pedido da Shopee: data (AAMMDD) + sufixo alfanumérico
+ORDER_ID_RE = re.compile(r"\b\d{6}[0-9A-Z]{6,10}\b")
+# variáveis de template que vazaram sem preencher: {nome}, [nome do cliente], XXXX
+PLACEHOLDER_RE = re.compile(
+    r"(\{\{?\s*\w+\s*\}?\}|\[(?:nome|pedido|produto|cliente|data|prazo|valor)[^\]]*\]|\bX{3,}\b)",
+    re.I,
+)
+SKIP_MARK_RE = re.compile(r"(\bskip\b|\(pular\)|\bação:)", re.I)
+WORD_RE = re.compile(r"\w{3,}", re.U)
+
+
+def _words(text: str) -> set:
+    return set(WORD_RE.findall(fold(text)))
+
+
+def _stage_mismatch(draft: str, stage: str) -> str:
+    """ID do catálogo cujo texto o rascunho reproduz, mas que não vale neste estágio."""
+    words = _words(draft)
+    if not words:
+        return ""
+    for sec in parse_sections(settings.base_prompt):
+        if not sec.stages or sec.allowed_in(stage):
+            continue
+        ref = _words(sec.reply)
+        if ref and len(words & ref) / len(words | ref) >= 0.5:
+            return sec.name
+    return ""
+
+
+def local_issues(draft: str, stage: str = "desconhecido", order_id: str = "") -> List[str]:
+    """Checagens locais (sem IA). Lista vazia = rascunho pode ir direto."""
+    issues: List[str] = []
+    limit = settings.refine_max_chars or DEFAULT_MAX_CHARS
+    if len(draft) > limit:
+        issues.append(f"texto com {len(draft)} caracteres; o limite é {limit}")
+    if BANNED_RE.search(draft):
+        issues.append("contém rótulos internos (ID/Resposta/contexto do pedido)")
+    if TRACKING_RE.search(draft):
+        issues.append("contém código de rastreio")
+    if SKIP_MARK_RE.search(draft):
+        issues.append("mistura marcador de skip com mensagem ao cliente")
+    if PLACEHOLDER_RE.search(draft):
+        issues.append("contém variável de template sem preencher")
+    order_id = (order_id or "").strip().upper()
+    other = {o for o in ORDER_ID_RE.findall(draft) if o != order_id}
+    if order_id and other:
+        issues.append(f"cita o pedido {sorted(other)[0]}, mas a conversa é do pedido {order_id}")
+    mismatch = _stage_mismatch(draft, stage)
+    if mismatch:
+        issues.append(f"usa o template '{mismatch}', que não vale para estado_pedido={stage}")
+    return issues
+
+
+def _cut(text: str) -> str:
+    """Corte final em fim de frase quando ``refine_max_chars`` está definido."""
+    limit = settings.refine_max_chars
+    if not limit or len(text) <= limit:
+        return text
+    head = text[:limit]
+    end = max(head.rfind(". "), head.rfind("! "), head.rfind("? "))
+    return (head[: end + 1] if end > 0 else head).strip()
+
+
+def refine_reply(
+    draft: str,
+    stage: str = "desconhecido",
+    buyer_text: str = "",
+    model_name: str | None = None,
+    order_id: str = "",
+) -> str:
+    """Aplica o modo de refino configurado ao rascunho já higienizado."""
+    if not draft or (settings.refine_mode or "").lower() != "manager_critic":
+        return _cut(draft)
+
+    with metrics.timer("refine.checks"):
+        issues = local_issues(draft, stage, order_id)
+    if not issues:
+        metrics.incr("refine.direto")
+        return _cut(draft)
+
+    metrics.incr("refine.critico")
+    print(f"[DEBUG] refine: crítico acionado ({'; '.join(issues)})")
+    with metrics.timer("refine.critico.latency"):
+        fixed = critique_reply(draft, issues, buyer_text, stage, model_name=model_name)
+    return _cut(fixed or draft)
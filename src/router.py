@@ -0,0 +1,122 @@
+# src/router.py
+"""
+Roteamento de modelo por complexidade da conversa.
+
+Agradecimentos e dúvidas de status vão para o modelo leve; disputas
+(quebra, devolução, reembolso, peça faltando) e conversas longas ou ambíguas
+vão para o modelo forte. Latência e volume por tier ficam em ``metrics``.
+"""
+from __future__ import annotations
+
+from typing import Iterable, List, NamedTuple, Tuple
+
+from . import metrics
+from .config import settings
+
+TIER_LIGHT = "leve"
+TIER_STRONG = "forte"
+
+# Intenções (IDs do catálogo/regras) que indicam disputa ou pós-venda delicado
+DISPUTE_INTENTS = {
+    "quebra_sem_foto",
+    "quebra_com_foto",
+    "faltando_peca",
+    "reembolso_parcial",
+    "devolucao_total",
+    "nova_peca",
+    "pedido_cancelado",
+    "pedido_parado",
+    "pos_envio_urgencia_atraso",
+    "prazo_entrega_data_especifica",
+}
+# Intenções simples: confirmação, agradecimento, prazo padrão
+SIMPLE_INTENTS = {
+    "agradecimento_curto",
+    "saudacao_expectativa_positiva",
+    "tempo_envio",
+    "embalagem_segura_precompra",
+    "solicita_etiqueta_fragil",
+}
+
+
+class Route(NamedTuple):
+    tier: str
+    model: str
+    score: float
+    reasons: Tuple[str, ...]
+
+
+def score_complexity(
+    pairs: List[Tuple[str, str]],
+    buyer_msgs: List[str],
+    intents: Iterable[str] = (),
+    stage: str = "desconhecido",
+    near_misses: Iterable[str] = (),
+) -> Tuple[float, Tuple[str, ...]]:
+    """Pontua a conversa; quanto maior, mais difícil. Retorna (score, motivos)."""
+    intents = set(intents or ())
+    score = 0.0
+    reasons: list[str] = []
+
+    n = len(buyer_msgs)
+    if n > 12:
+        score += 2
+        reasons.append(f"msgs={n}")
+    elif n > 6:
+        score += 1
+        reasons.append(f"msgs={n}")
+
+    disputes = intents & DISPUTE_INTENTS
+    if disputes:
+        score += 3
+        reasons.append("disputa:" + ",".join(sorted(disputes)))
+    elif intents and intents <= (SIMPLE_INTENTS | {"fallback"}) and intents - {"fallback"}:
+        score -= 1
+        reasons.append("simples")
+
+    if stage in {"enviado", "entregue"}:
+        score += 1
+        reasons.append(f"estagio={stage}")
+
+    near = list(near_misses or ())
+    if near:
+        score += 0.5 * min(len(near), 4)
+        reasons.append(f"quase={len(near)}")
+
+    seller_lens = [len(t) for r, t in pairs if r == "seller"]
+    if seller_lens and sum(seller_lens) / len(seller_lens) > 280:
+        score += 1
+        reasons.append("respostas_longas")
+
+    if buyer_msgs and len(buyer_msgs[-1]) > 200:
+        score += 1
+        reasons.append("msg_longa")
+
+    return score, tuple(reasons)
+
+
+def choose_route(
+    pairs: List[Tuple[str, str]],
+    buyer_msgs: List[str],
+    intents: Iterable[str] = (),
+    stage: str = "desconhecido",
+    near_misses: Iterable[str] = (),
+) -> Route:
+    """Escolhe o tier/modelo. Com roteamento desligado, sempre o modelo forte."""
+    score, reasons = score_complexity(pairs, buyer_msgs, intents, stage, near_misses)
+    light = settings.gemini_model_light
+    if (
+        not settings.model_routing
+        or not light
+        or score >= settings.router_threshold
+    ):
+        route = Route(TIER_STRONG, settings.gemini_model, score, reasons)
+    else:
+        route = Route(TIER_LIGHT, light, score, reasons)
+    metrics.incr(f"router.{route.tier}")
+    return route
+
+
+def tier_stats() -> dict:
+    """Volume e latência por tier (para a UI / logs)."""
+    return metrics.snapshot("router.")
@@ -4,7 +4,9 @@ from __future__ import annotations
 import json
 import re
 from pathlib import Path
-from typing import Optional, Tuple, List, Dict
+from typing import Optional, Tuple, List, Dict, Iterable
+
+from .textnorm import fold, normalize
 
 # Caminho do rules.json na raiz do projeto
 RULES_PATH = Path(__file__).resolve().parents[1] / "rules.json"
@@ -74,19 +76,29 @@ def _text_matches(
     any_contains: List[str] | None = None,
     all_contains: List[str] | None = None,
     any_regex: List[str] | None = None,
+    none_contains: List[str] | None = None,
 ) -> bool:
-    """Verifica se o contexto bate com as condições declarativas da regra."""
-    # normaliza tudo para lowercase
-    texts_l = [t.lower() for t in texts]
+    """Verifica se o contexto bate com as condições declarativas da regra.
+
+    Termos são comparados sem acento/caixa; ``any_regex`` roda sobre o texto
+    minúsculo com acentos preservados.
+    """
+    norm = [normalize(t) for t in texts]
+    texts_f = [n.folded for n in norm]
 
     if any_contains:
-        needles = [n.lower() for n in any_contains]
-        if not any(any(n in t for n in needles) for t in texts_l):
+        needles = [fold(n) for n in any_contains]
+        if not any(any(n in t for n in needles) for t in texts_f):
             return False
 
     if all_contains:
-        needles = [n.lower() for n in all_contains]
-        if not all(any(n in t for t in texts_l) for n in needles):
+        needles = [fold(n) for n in all_contains]
+        if not all(any(n in t for t in texts_f) for n in needles):
+            return False
+
+    if none_contains:
+        needles = [fold(n) for n in none_contains]
+        if any(n in t for n in needles for t in texts_f):
             return False
 
     if any_regex:
@@ -95,13 +107,29 @@ def _text_matches(
         except re.error as e:
             print(f"[rules] regex inválida em any_regex: {e}")
             return False
-        if not any(p.search(t) for p in patterns for t in texts_l):
+        if not any(p.search(n.lower) for p in patterns for n in norm):
             return False
 
     return True
 
 
-def apply_rules(messages: List[str]) -> Tuple[bool, Optional[str], Optional[str]]:
+def _rule_matches(cond: Dict, texts: List[str], intents: set) -> bool:
+    """Condições de texto + ``intents`` (intenção prevista pelo classificador)."""
+    wanted = cond.get("intents")
+    if wanted and not intents & set(wanted):
+        return False
+    return _text_matches(
+        texts=texts,
+        any_contains=cond.get("any_contains"),
+        all_contains=cond.get("all_contains"),
+        any_regex=cond.get("any_regex"),
+        none_contains=cond.get("none_contains"),
+    )
+
+
+def apply_rules(
+    messages: List[str], intents: Iterable[str] = ()
+) -> Tuple[bool, Optional[str], Optional[str]]:
     """
     Aplica regras ao contexto curto (últimas 10 mensagens).
     Retorna (decide, reply, action):
@@ -112,6 +140,7 @@ def apply_rules(messages: List[str]) -> Tuple[bool, Optional[str], Optional[str]
     rules = load_rules()
     if not messages:
         return False, None, None
+    intents = set(intents or ())
 
     last_user_texts = messages[-10:]  # contexto curto
 
@@ -120,12 +149,7 @@ def apply_rules(messages: List[str]) -> Tuple[bool, Optional[str], Optional[str]
             continue
 
         cond = rule.get("match", {}) or {}
-        if not _text_matches(
-            texts=last_user_texts,
-            any_contains=cond.get("any_contains"),
-            all_contains=cond.get("all_contains"),
-            any_regex=cond.get("any_regex"),
-        ):
+        if not _rule_matches(cond, last_user_texts, intents):
             continue
 
         action = (rule.get("action") or "").strip().lower()
@@ -141,3 +165,32 @@ def apply_rules(messages: List[str]) -> Tuple[bool, Optional[str], Optional[str]
 
     # Nenhuma regra casou
     return False, None, None
+
+
+def rule_match_report(
+    messages: List[str], intents: Iterable[str] = ()
+) -> Tuple[List[str], List[str]]:
+    """
+    Retorna (ids_que_casam, ids_quase) para as regras ativas.
+
+    "Quase" = algum termo de ``any_contains`` aparece, mas a regra foi barrada
+    por ``none_contains``/``all_contains``/``any_regex``/``intents`` (conversa ambígua).
+    """
+    if not messages:
+        return [], []
+    intents = set(intents or ())
+    last_user_texts = messages[-10:]
+    texts_f = [fold(t) for t in last_user_texts]
+    matched: List[str] = []
+    near: List[str] = []
+    for rule in load_rules():
+        if not rule.get("active", True) or not rule.get("id"):
+            continue
+        cond = rule.get("match", {}) or {}
+        if _rule_matches(cond, last_user_texts, intents):
+            matched.append(rule["id"])
+            continue
+        needles = [fold(n) for n in (cond.get("any_contains") or [])]
+        if any(n in t for n in needles for t in texts_f):
+            near.append(rule["id"])
+    return matched, near
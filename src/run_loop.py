@@ -1,46 +1,57 @@
 # src/run_loop.py
 import os
 import asyncio
-from pathlib import Path
+import signal
 from .duoke import DuokeBot
 from .classifier import decide_reply
 from .cases import export_to_excel
+from .config import settings
+from .session_vault import has_session
 
 DEFAULT_INTERVAL = float(os.getenv("LOOP_INTERVAL_SECONDS", "5"))
-STATE_FILE = Path(__file__).resolve().parents[1] / "storage_state.json"
+
+
+def _install_signal_handlers(bot: DuokeBot) -> list:
+    """1º CTRL+C/SIGTERM: termina a conversa atual e sai; 2º: cancela na hora."""
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+
+    def _on_signal() -> None:
+        if bot.stop_event.is_set():
+            print("\n[LOOP] Saída forçada.")
+            task.cancel()
+            return
+        print("\n[LOOP] Encerrando após a conversa atual (CTRL+C de novo força a saída)...")
+        bot.request_stop()
+
+    installed = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, _on_signal)
+            installed.append(sig)
+        except (NotImplementedError, RuntimeError):
+            # Windows: fica o KeyboardInterrupt padrão
+            pass
+    return installed
 
 
 async def run_forever(interval: float = DEFAULT_INTERVAL) -> None:
     """
-    Executa ciclos do bot indefinidamente.
-    Em caso de erro, faz backoff exponencial até 60s e continua tentando.
-    CTRL+C (KeyboardInterrupt) encerra com segurança.
+    Executa ciclos do bot indefinidamente sobre um único navegador.
+    Um ciclo começa a cada ``interval`` segundos; erros recriam o contexto com
+    backoff até 60s (ver ``DuokeBot.run_forever``).
+    CTRL+C/SIGTERM encerra com segurança após a conversa em andamento.
     """
     bot = DuokeBot()
-    backoff = interval
-
+    installed = _install_signal_handlers(bot)
     try:
-        while True:
-            try:
-                await bot.run_once(decide_reply)
-                # ciclo OK: reseta backoff e espera intervalo normal
-                backoff = interval
-                await asyncio.sleep(interval)
-            except asyncio.CancelledError:
-                # encerramento gracioso (quando cancelado por algum orchestrator)
-                break
-            except KeyboardInterrupt:
-                # permite sair com CTRL+C quando rodando standalone
-                print("\n[LOOP] Encerrado pelo usuário (CTRL+C).")
-                break
-            except Exception as e:
-                print(f"[LOOP] erro: {e!r}")
-                # aguarda com backoff antes de tentar de novo
-                wait = min(max(2.0, backoff), 60.0)
-                print(f"[LOOP] aguardando {wait:.1f}s antes de tentar novamente...")
-                await asyncio.sleep(wait)
-                backoff = min(wait * 2, 60.0)
+        await bot.run_forever(decide_reply, idle_seconds=interval)
+    except asyncio.CancelledError:
+        pass
     finally:
+        loop = asyncio.get_running_loop()
+        for sig in installed:
+            loop.remove_signal_handler(sig)
         # Exporta os dados registrados ao encerrar o processo
         try:
             export_to_excel()
@@ -49,7 +60,7 @@ async def run_forever(interval: float = DEFAULT_INTERVAL) -> None:
 
 
 async def main() -> None:
-    if not STATE_FILE.exists():
+    if not has_session(settings.session_user_id):
         print(
             "[LOOP] Sessão não encontrada. Execute `python -m src.login` para fazer login antes de iniciar o bot."
         )
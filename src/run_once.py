@@ -1,15 +1,15 @@
 # src/run_once.py
+import argparse
 import asyncio
-from pathlib import Path
 from .duoke import DuokeBot
 from .classifier import decide_reply
 from .cases import export_to_excel
+from .config import settings
+from .session_vault import has_session
 
-STATE_FILE = Path(__file__).resolve().parents[1] / "storage_state.json"
 
-
-async def main():
-    if not STATE_FILE.exists():
+async def main(hold_seconds: float = 0.0):
+    if not has_session(settings.session_user_id):
         print(
             "[RUN_ONCE] Sessão não encontrada. Execute `python -m src.login` para fazer login antes de iniciar o bot."
         )
@@ -17,15 +17,15 @@ async def main():
     bot = DuokeBot()
 
     # Função síncrona (NÃO async) para evitar "coroutine was never awaited"
-    def debug_reply(pairs, buyer_only, order_info=None) -> tuple[bool, str]:
+    def debug_reply(pairs, buyer_only, order_info=None, scope="") -> tuple[bool, str]:
         print("[DEBUG] Mensagens recebidas para classificação:")
         for role, msg in pairs:
             print(f"- {role}: {msg}")
-        should, reply = decide_reply(pairs, buyer_only, order_info)
+        should, reply = decide_reply(pairs, buyer_only, order_info, scope)
         print(f"[DEBUG] Deve responder? {should} | Resposta: {reply}")
         return should, reply
 
-    await bot.run_once(debug_reply)
+    await bot.run_once(debug_reply, hold_seconds=hold_seconds)
     try:
         export_to_excel()
     except Exception as e:
@@ -33,4 +33,11 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    ap = argparse.ArgumentParser(prog="python -m src.run_once")
+    ap.add_argument(
+        "--hold",
+        type=float,
+        default=0.0,
+        help="segundos com o navegador aberto após a varredura (ex.: 60 para inspecionar)",
+    )
+    asyncio.run(main(ap.parse_args().hold))
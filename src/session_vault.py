@@ -0,0 +1,123 @@
+# src/session_vault.py
+"""
+Sessões do Playwright (storage_state) cifradas por usuário.
+
+``sessions/<user_id>.bin`` = sal + IV + AES-GCM(storage_state JSON), chave
+derivada de SESSION_ENC_SECRET via PBKDF2. Também lê o storage_state.json
+gerado por ``python -m src.login`` quando não há sessão cifrada.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+SESS_DIR = Path("sessions")  # Diretório para armazenar os arquivos de sessão
+SESS_DIR.mkdir(exist_ok=True)
+SECRET = os.getenv(
+    "SESSION_ENC_SECRET", "troque-isto-no-render"
+)  # Chave secreta para criptografia
+STORAGE_STATE_PATH = Path(__file__).resolve().parents[1] / "storage_state.json"
+
+# storage_state já decifrado por user_id, válido enquanto o .bin não mudar
+_cache: Dict[str, Tuple[float, dict]] = {}
+
+
+def _derive_key(secret: str, salt: bytes) -> bytes:
+    """Deriva uma chave segura a partir de uma senha e um sal usando PBKDF2."""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(), length=32, salt=salt, iterations=100_000
+    )
+    return kdf.derive(secret.encode("utf-8"))
+
+
+def encrypt_bytes(data: bytes, secret: str) -> bytes:
+    """Criptografa dados usando AES-GCM. Retorna o sal, IV e o texto cifrado."""
+    salt = os.urandom(16)
+    key = _derive_key(secret, salt)
+    aes = AESGCM(key)
+    iv = os.urandom(12)
+    ct = aes.encrypt(iv, data, None)
+    return salt + iv + ct
+
+
+def decrypt_bytes(packed: bytes, secret: str) -> bytes:
+    """Descriptografa dados empacotados pelo `encrypt_bytes`."""
+    salt, iv, ct = packed[:16], packed[16:28], packed[28:]
+    key = _derive_key(secret, salt)
+    aes = AESGCM(key)
+    return aes.decrypt(iv, ct, None)
+
+
+def session_path(user_id: str) -> Path:
+    """Gera o caminho do arquivo de sessão para um dado user_id."""
+    return SESS_DIR / f"{user_id}.bin"
+
+
+def list_users() -> List[str]:
+    """user_ids com sessão cifrada salva."""
+    return sorted(p.stem for p in SESS_DIR.glob("*.bin"))
+
+
+def has_session(user_id: str = "") -> bool:
+    """Há sessão para iniciar o bot: storage_state.json local ou a cifrada do ``user_id``."""
+    if STORAGE_STATE_PATH.exists():
+        return True
+    return bool(user_id) and session_path(user_id).exists()
+
+
+def save_session(user_id: str, state: dict) -> None:
+    """Cifra e grava o storage_state do usuário (sem arquivo temporário em claro)."""
+    data = json.dumps(state, ensure_ascii=False).encode("utf-8")
+    path = session_path(user_id)
+    path.write_bytes(encrypt_bytes(data, SECRET))
+    _cache[user_id] = (path.stat().st_mtime, state)
+
+
+def delete_session(user_id: str) -> None:
+    session_path(user_id).unlink(missing_ok=True)
+    _cache.pop(user_id, None)
+
+
+def load_storage_state(user_id: str = "") -> Optional[dict]:
+    """
+    storage_state para ``new_context``: sessão cifrada do ``user_id`` ou, sem
+    ela, o storage_state.json local. ``None`` se não houver sessão.
+    """
+    if user_id:
+        path = session_path(user_id)
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        hit = _cache.get(user_id)
+        if hit and hit[0] == mtime:
+            return hit[1]
+        try:
+            state = json.loads(decrypt_bytes(path.read_bytes(), SECRET))
+        except Exception as e:
+            print(f"[vault] falha ao abrir sessão de {user_id}: {e}")
+            return None
+        _cache[user_id] = (mtime, state)
+        return state
+
+    try:
+        return json.loads(STORAGE_STATE_PATH.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[vault] storage_state.json inválido: {e}")
+        return None
+
+
+def store_storage_state(user_id: str, state: dict) -> None:
+    """Atualiza a sessão de onde ela veio (cookies renovados ao fechar o contexto)."""
+    if user_id:
+        save_session(user_id, state)
+        return
+    STORAGE_STATE_PATH.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
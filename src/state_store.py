@@ -0,0 +1,338 @@
+# src/state_store.py
+"""
+Estado por conversa (última resposta + respostas já enviadas) com limite de
+memória e persistência.
+
+- LRU com TTL: no máximo ``state_max_conversations`` conversas em memória;
+  as que ficam ``state_ttl_hours`` sem atividade são descartadas.
+- Respostas enviadas guardadas como impressões digitais de 8 bytes
+  (blake2b do texto normalizado), não o texto inteiro.
+- Snapshot periódico em SQLite (data/estado.sqlite3): só as conversas
+  alteradas são gravadas; ao reiniciar, o estado volta do disco.
+- Checkpoint da varredura em andamento (linhas já atendidas) por sessão, para
+  retomar depois de erro/reinício em vez de recomeçar da primeira conversa.
+- Quarentena: linha que falha ``quarantine_failures`` vezes seguidas fica
+  ``quarantine_minutes`` fora das varreduras daquela sessão (loja).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+from .textnorm import fold
+
+DATA_DIR = Path("data")
+DATA_DIR.mkdir(exist_ok=True)
+STATE_DB_PATH = DATA_DIR / "estado.sqlite3"
+
+# impressões digitais guardadas por conversa (as mais recentes)
+MAX_FINGERPRINTS = 32
+# checkpoint mais velho que isso é ignorado (a lista já mudou demais)
+CHECKPOINT_MAX_AGE = 30 * 60
+
+
+def fingerprint(text: str) -> int:
+    """Impressão digital de 64 bits do texto normalizado."""
+    digest = hashlib.blake2b(fold(text).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _pack(fps: Iterable[int]) -> bytes:
+    return b"".join(fp.to_bytes(8, "big") for fp in fps)
+
+
+def _unpack(blob: Optional[bytes]) -> Tuple[int, ...]:
+    blob = blob or b""
+    return tuple(int.from_bytes(blob[i : i + 8], "big") for i in range(0, len(blob), 8))
+
+
+class ConversationState:
+    __slots__ = ("last_replied_at", "fingerprints", "touched_at")
+
+    def __init__(
+        self,
+        last_replied_at: float = 0.0,
+        fingerprints: Tuple[int, ...] = (),
+        touched_at: float = 0.0,
+    ):
+        self.last_replied_at = last_replied_at
+        self.fingerprints = fingerprints
+        self.touched_at = touched_at or time.time()
+
+
+class StateStore:
+    def __init__(self, path: Path = STATE_DB_PATH):
+        self.path = path
+        self._entries: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._dirty: set[str] = set()
+        self._dropped: set[str] = set()
+        self._last_snapshot = time.monotonic()
+        # sessão -> {"tier", "started", "done": [linhas]}; linha -> [falhas, até]
+        self._checkpoints: Dict[str, dict] = {}
+        # (sessão, linha) -> [falhas seguidas, em quarentena até]
+        self._failures: Dict[Tuple[str, str], list] = {}
+        self._sweep_dirty = False
+        self._db = self._open()
+        self._load()
+
+    # ---------- limites ----------
+
+    @property
+    def max_entries(self) -> int:
+        return max(1, int(settings.state_max_conversations))
+
+    @property
+    def ttl(self) -> float:
+        return float(settings.state_ttl_hours) * 3600
+
+    # ---------- persistência ----------
+
+    def _open(self) -> Optional[sqlite3.Connection]:
+        try:
+            db = sqlite3.connect(self.path)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS conversas ("
+                " chave TEXT PRIMARY KEY,"
+                " ultima_resposta REAL,"
+                " impressoes BLOB,"
+                " atualizado REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS varredura ("
+                " sessao TEXT PRIMARY KEY,"
+                " dados TEXT)"
+            )
+            cols = [r[1] for r in db.execute("PRAGMA table_info(quarentena)")]
+            if cols and "sessao" not in cols:
+                # formato antigo, sem a loja: a quarentena é transitória, recomeça
+                db.execute("DROP TABLE quarentena")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS quarentena ("
+                " sessao TEXT,"
+                " linha TEXT,"
+                " falhas INTEGER,"
+                " ate REAL,"
+                " PRIMARY KEY (sessao, linha))"
+            )
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"[state] SQLite indisponível ({e}); estado só em memória")
+            return None
+
+    def _load(self) -> None:
+        if not self._db:
+            return
+        cutoff = time.time() - self.ttl
+        try:
+            rows = self._db.execute(
+                "SELECT chave, ultima_resposta, impressoes, atualizado FROM conversas"
+                " WHERE atualizado >= ? ORDER BY atualizado DESC LIMIT ?",
+                (cutoff, self.max_entries),
+            ).fetchall()
+        except Exception as e:
+            print(f"[state] falha ao ler {self.path.name}: {e}")
+            return
+        for key, last, blob, touched in reversed(rows):
+            self._entries[key] = ConversationState(last or 0.0, _unpack(blob), touched)
+        try:
+            for scope, data in self._db.execute("SELECT sessao, dados FROM varredura"):
+                self._checkpoints[scope] = json.loads(data)
+            for scope, row, count, until in self._db.execute(
+                "SELECT sessao, linha, falhas, ate FROM quarentena"
+            ):
+                self._failures[(scope, row)] = [count, until or 0.0]
+        except Exception as e:
+            print(f"[state] falha ao ler checkpoints: {e}")
+        print(f"[DEBUG] estado restaurado: {len(self._entries)} conversas")
+
+    def snapshot(self, force: bool = False) -> None:
+        """Grava as conversas alteradas (a cada ``state_snapshot_seconds`` ou se ``force``)."""
+        now = time.monotonic()
+        if not force and now - self._last_snapshot < settings.state_snapshot_seconds:
+            return
+        self._last_snapshot = now
+        if not self._db or not (self._dirty or self._dropped or self._sweep_dirty):
+            return
+        with metrics.timer("state.snapshot"):
+            try:
+                rows = [
+                    (k, st.last_replied_at, _pack(st.fingerprints), st.touched_at)
+                    for k in self._dirty
+                    if (st := self._entries.get(k)) is not None
+                ]
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO conversas VALUES (?, ?, ?, ?)", rows
+                )
+                self._db.executemany(
+                    "DELETE FROM conversas WHERE chave = ?", [(k,) for k in self._dropped]
+                )
+                self._db.execute(
+                    "DELETE FROM conversas WHERE atualizado < ?", (time.time() - self.ttl,)
+                )
+                if self._sweep_dirty:
+                    self._db.execute("DELETE FROM varredura")
+                    self._db.executemany(
+                        "INSERT INTO varredura VALUES (?, ?)",
+                        [(k, json.dumps(v)) for k, v in self._checkpoints.items()],
+                    )
+                    self._db.execute("DELETE FROM quarentena")
+                    self._db.executemany(
+                        "INSERT INTO quarentena VALUES (?, ?, ?, ?)",
+                        [(sc, row, c, u) for (sc, row), (c, u) in self._failures.items()],
+                    )
+                self._db.commit()
+                self._dirty.clear()
+                self._dropped.clear()
+                self._sweep_dirty = False
+            except Exception as e:
+                print(f"[state] falha ao gravar snapshot: {e}")
+
+    def close(self) -> None:
+        self.snapshot(force=True)
+        if self._db:
+            self._db.close()
+            self._db = None
+
+    # ---------- acesso ----------
+
+    def _drop(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._dirty.discard(key)
+        self._dropped.add(key)
+        metrics.incr("state.evicted")
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.ttl
+        # as mais antigas ficam no começo do OrderedDict
+        while self._entries:
+            key, st = next(iter(self._entries.items()))
+            if len(self._entries) > self.max_entries or st.touched_at < cutoff:
+                self._drop(key)
+            else:
+                break
+        metrics.gauge("state.conversations", len(self._entries))
+
+    def get(self, key: str) -> Optional[ConversationState]:
+        st = self._entries.get(key)
+        if st is None:
+            return None
+        if st.touched_at < time.time() - self.ttl:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return st
+
+    def last_replied_at(self, key: str) -> float:
+        st = self.get(key)
+        return st.last_replied_at if st else 0.0
+
+    def was_sent(self, key: str, text: str) -> bool:
+        st = self.get(key)
+        return bool(st) and fingerprint(text) in st.fingerprints
+
+    def record_reply(self, key: str, text: str, at: Optional[float] = None) -> None:
+        now = at or time.time()
+        st = self.get(key) or ConversationState()
+        fp = fingerprint(text)
+        if fp not in st.fingerprints:
+            st.fingerprints = (st.fingerprints + (fp,))[-MAX_FINGERPRINTS:]
+        st.last_replied_at = now
+        st.touched_at = now
+        self._entries[key] = st
+        self._entries.move_to_end(key)
+        self._dirty.add(key)
+        self._dropped.discard(key)
+        self._evict()
+        self.snapshot()
+
+    # ---------- checkpoint da varredura ----------
+
+    def checkpoint(self, scope: str, tier: str) -> Optional[dict]:
+        """Varredura interrompida de ``scope`` no mesmo nível, se recente."""
+        cp = self._checkpoints.get(scope)
+        if not cp or cp.get("tier") != tier:
+            return None
+        if time.time() - cp.get("started", 0) > CHECKPOINT_MAX_AGE:
+            return None
+        return cp
+
+    def begin_sweep(self, scope: str, tier: str) -> dict:
+        """Retoma o checkpoint de ``scope`` ou abre um novo."""
+        cp = self.checkpoint(scope, tier)
+        if cp is None:
+            cp = {"tier": tier, "started": time.time(), "done": []}
+            self._checkpoints[scope] = cp
+            self._sweep_dirty = True
+        return cp
+
+    def mark_done(self, scope: str, row: str) -> None:
+        cp = self._checkpoints.get(scope)
+        if cp is not None and row and row not in cp["done"]:
+            cp["done"].append(row)
+            self._sweep_dirty = True
+
+    def end_sweep(self, scope: str) -> None:
+        if self._checkpoints.pop(scope, None) is not None:
+            self._sweep_dirty = True
+
+    # ---------- quarentena ----------
+
+    def record_failure(self, scope: str, row: str) -> int:
+        """Conta uma falha seguida da linha; na N-ésima ela entra em quarentena."""
+        if not row:
+            return 0
+        count, _ = self._failures.get((scope, row), [0, 0.0])
+        count += 1
+        until = 0.0
+        if count >= max(1, int(settings.quarantine_failures)):
+            until = time.time() + float(settings.quarantine_minutes) * 60
+            print(f"[DEBUG] conversa '{row}' ({scope}) em quarentena após {count} falhas")
+            metrics.incr("state.quarantined")
+        self._failures[(scope, row)] = [count, until]
+        self._sweep_dirty = True
+        return count
+
+    def clear_failures(self, scope: str, row: str) -> None:
+        if self._failures.pop((scope, row), None) is not None:
+            self._sweep_dirty = True
+
+    def quarantined(self, scope: str, row: str) -> bool:
+        entry = self._failures.get((scope, row))
+        if not entry or not entry[1]:
+            return False
+        if entry[1] > time.time():
+            return True
+        # quarentena cumprida: volta com uma chance antes de entrar de novo
+        entry[:] = [max(0, int(settings.quarantine_failures) - 1), 0.0]
+        self._sweep_dirty = True
+        return False
+
+    def quarantine_list(self, scope: str) -> List[str]:
+        now = time.time()
+        return [
+            row for (sc, row), (_, until) in self._failures.items() if sc == scope and until > now
+        ]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def conversation_key(order_id: str, buyer_only: list, index: int) -> str:
+    """Chave estável e curta: ID do pedido ou hash das últimas mensagens do comprador."""
+    if order_id:
+        return order_id
+    if buyer_only:
+        return f"msg:{fingerprint('|'.join(buyer_only[-2:])):016x}"
+    return str(index)
+
+
+# Instância compartilhada (restaurada do disco ao importar)
+STATE = StateStore()
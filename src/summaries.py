@@ -0,0 +1,140 @@
+# src/summaries.py
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .gemini_client import summarize_turns
+
+DATA_DIR = Path("data")
+DATA_DIR.mkdir(exist_ok=True)
+SUMMARY_PATH = DATA_DIR / "resumos.json"
+
+# resumo que falhou (IA indisponível/erro) não é tentado de novo por este tempo
+FAILURE_BACKOFF_SECONDS = 300.0
+# hashes dos últimos turnos resumidos guardados para achar a sobreposição
+OVERLAP_HASHES = 20
+
+
+def format_turns(pairs: List[Tuple[str, str]]) -> str:
+    """Formata [(role, text)] como ``Comprador:``/``Vendedor:`` separados por linha em branco."""
+    lines: list[str] = []
+    for role, text in pairs:
+        prefix = "Comprador" if role == "buyer" else "Vendedor"
+        lines.append(f"{prefix}: {text.strip()}")
+    return "\n\n".join(lines)
+
+
+def _turn_hash(role: str, text: str) -> str:
+    raw = f"{role}\x1f{(text or '').strip()}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+class SummaryCache:
+    """
+    Resumo incremental por conversa.
+
+    Os turnos antigos (fora da janela recente) são condensados uma única vez
+    pelo Gemini e guardados por ID de conversa junto com o hash do último turno
+    resumido. Nas visitas seguintes só os turnos novos entram no prompt; quando
+    acumulam ``refresh_turns`` turnos fora da janela, o resumo é atualizado.
+    Se o último turno resumido sumiu (texto lido diferente, histórico cortado),
+    vale o mais recente dos últimos turnos resumidos que ainda aparece; falha
+    do Gemini fica em espera por ``FAILURE_BACKOFF_SECONDS`` por conversa.
+    """
+
+    def __init__(self, path: Path = SUMMARY_PATH):
+        self.path = path
+        self._data: Dict[str, dict] = self._load()
+        # a decisão roda em threads (uma por aba/loja); o Gemini fica fora do lock
+        self._lock = threading.Lock()
+        # conv_id -> monotonic da última falha (só em memória)
+        self._failed: Dict[str, float] = {}
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def _save(self) -> None:
+        try:
+            self.path.write_text(
+                json.dumps(self._data, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+        except Exception as e:
+            print(f"[summaries] falha ao salvar {self.path.name}: {e}")
+
+    def get(self, conv_id: str) -> str:
+        return (self._data.get(conv_id) or {}).get("summary", "")
+
+    def build_history(
+        self,
+        conv_id: str,
+        pairs: List[Tuple[str, str]],
+        recent: int,
+        refresh_turns: int,
+    ) -> str:
+        """Monta o bloco de histórico: resumo + turnos ainda não resumidos + janela recente."""
+        recent = max(1, recent)
+        recent_turns = pairs[-recent:]
+        older = pairs[:-recent] if len(pairs) > recent else []
+        if not conv_id or not older:
+            return format_turns(recent_turns)
+
+        entry = self._data.get(conv_id) or {}
+        summary = entry.get("summary", "")
+        last_hash = entry.get("last_hash", "")
+        # entradas antigas só têm o último hash
+        known = set(entry.get("hashes") or ([last_hash] if last_hash else []))
+
+        hashes = [_turn_hash(r, t) for r, t in older]
+        pending = older
+        if known:
+            # turno resumido mais recente ainda visível: só o que vem depois é novo
+            pos = next((j for j in range(len(hashes) - 1, -1, -1) if hashes[j] in known), None)
+            if pos is not None:
+                pending = older[pos + 1 :]
+            elif summary:
+                # nada em comum com o resumo: não re-resume o histórico inteiro
+                pending = older[-max(1, refresh_turns) :]
+
+        failed_at = self._failed.get(conv_id)
+        backoff = failed_at is not None and time.monotonic() - failed_at < FAILURE_BACKOFF_SECONDS
+        if len(pending) >= max(1, refresh_turns) and not backoff:
+            new_summary = summarize_turns(summary, format_turns(pending))
+            if new_summary:
+                summary = new_summary
+                self._failed.pop(conv_id, None)
+                with self._lock:
+                    self._data[conv_id] = {
+                        "summary": summary,
+                        "last_hash": hashes[-1],
+                        "hashes": hashes[-OVERLAP_HASHES:],
+                        "turns": int(entry.get("turns", 0)) + len(pending),
+                        "updated_at": int(time.time()),
+                    }
+                    self._save()
+                pending = []
+            else:
+                self._failed[conv_id] = time.monotonic()
+        if pending and len(pending) > refresh_turns:
+            # sem resumo (IA indisponível ou em espera): mantém o prompt limitado
+            pending = pending[-max(1, refresh_turns) :]
+
+        parts: list[str] = []
+        if summary:
+            parts.append(f"[Resumo da conversa anterior]\n{summary}")
+        if pending:
+            parts.append(format_turns(pending))
+        parts.append(format_turns(recent_turns))
+        return "\n\n".join(parts)
+
+
+# Instância compartilhada (carregada ao importar)
+SUMMARIES = SummaryCache()
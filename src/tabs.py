@@ -0,0 +1,106 @@
+# src/tabs.py
+"""
+Apoio às abas paralelas do ``DuokeBot``.
+
+- ``LeaseTable``: reserva de conversa por aba (com validade), para duas abas
+  nunca atenderem a mesma conversa mesmo se a lista reordenar no meio da
+  varredura.
+- ``TabStats``: vazão por aba, exportada em ``metrics`` (``tab.<n>.*``, ou
+  ``tab.<loja>.<n>.*`` no pool de lojas).
+- ``tab_budget``: quantas abas cabem na memória disponível.
+"""
+from __future__ import annotations
+
+import time
+from typing import Dict, Optional, Tuple
+
+from . import metrics
+from .config import settings
+
+
+class LeaseTable:
+    def __init__(self, ttl: Optional[float] = None):
+        self._ttl = ttl
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    @property
+    def ttl(self) -> float:
+        return float(self._ttl if self._ttl is not None else settings.tab_lease_seconds)
+
+    def claim(self, key: str, owner: str) -> bool:
+        """Reserva ``key`` para ``owner``; falha se outra aba tem reserva válida."""
+        now = time.monotonic()
+        held = self._leases.get(key)
+        if held and held[0] != owner and held[1] > now:
+            metrics.incr("tabs.lease_conflict")
+            return False
+        self._leases[key] = (owner, now + self.ttl)
+        return True
+
+    def release_owner(self, owner: str) -> None:
+        for key in [k for k, (o, _) in self._leases.items() if o == owner]:
+            del self._leases[key]
+
+    def __len__(self) -> int:
+        now = time.monotonic()
+        return sum(1 for _, exp in self._leases.values() if exp > now)
+
+
+class TabStats:
+    __slots__ = ("name", "metric", "handled", "replied", "busy", "started")
+
+    def __init__(self, name: str, scope: str = ""):
+        self.name = name
+        self.metric = f"tab.{scope}.{name}" if scope else f"tab.{name}"
+        self.handled = 0
+        self.replied = 0
+        self.busy = 0.0
+        self.started = time.monotonic()
+
+    def record(self, outcome: str, seconds: float) -> None:
+        self.handled += 1
+        self.busy += seconds
+        if outcome == "respondida":
+            self.replied += 1
+        metrics.incr(f"{self.metric}.handled")
+        metrics.observe(f"{self.metric}.conversation", seconds)
+
+    def publish(self) -> str:
+        # vazão enquanto a aba trabalha (sem contar a espera entre ciclos)
+        per_min = 60 * self.handled / max(1e-6, self.busy)
+        elapsed = max(1e-6, time.monotonic() - self.started)
+        metrics.gauge(f"{self.metric}.conv_per_min", round(per_min, 2))
+        metrics.gauge(f"{self.metric}.busy_ratio", round(self.busy / elapsed, 3))
+        return (
+            f"aba {self.name}: {self.handled} conversas ({self.replied} respondidas), "
+            f"{per_min:.1f}/min"
+        )
+
+
+def available_memory_mb() -> Optional[float]:
+    """MemAvailable do /proc/meminfo (Linux); None quando não dá para saber."""
+    try:
+        with open("/proc/meminfo", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def tab_budget(requested: int) -> int:
+    """Abas pedidas limitadas pela memória livre (``tab_memory_mb`` por aba)."""
+    requested = max(1, int(requested))
+    per_tab = float(settings.tab_memory_mb)
+    avail = available_memory_mb()
+    if requested == 1 or per_tab <= 0 or avail is None:
+        return requested
+    fits = int((avail - settings.tab_memory_reserve_mb) // per_tab)
+    allowed = max(1, min(requested, fits))
+    if allowed < requested:
+        print(
+            f"[DEBUG] memória livre {avail:.0f} MB: usando {allowed} de {requested} abas"
+        )
+    metrics.gauge("tabs.allowed", allowed)
+    return allowed
@@ -0,0 +1,306 @@
+# src/template_index.py
+"""
+Índice vetorial em memória para responder perguntas comuns sem o LLM.
+
+Documentos indexados (cada um = frase de consulta -> resposta):
+- textos de templates.json, pelas frases de "Intenções de Correspondência"
+  da seção do catálogo com o mesmo ID que têm ao menos ``MIN_QUERY_TOKENS``
+  palavras (palavra solta como "obrigada" não vira documento);
+- respostas aprovadas manualmente na UI, indexadas pela mensagem do comprador
+  (uma por mensagem, as ``template_max_approved`` mais recentes) e válidas só
+  para a loja (``scope``) em que foram aprovadas.
+
+As mensagens recentes do comprador são comparadas com todos os documentos num
+único produto matricial (cosseno sobre TF-IDF de n-gramas com hashing). O
+índice é reconstruído incrementalmente: só frases novas são vetorizadas. Um
+acerto também precisa de sobreposição real de palavras com a última mensagem
+(``DOC_COVERAGE``/``QUERY_COVERAGE``): o cosseno contra uma frase curta sozinho
+não basta.
+"""
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+from .config import settings
+from .prompt_sections import parse_sections
+from .templates import TEMPLATES_PATH, load_templates
+from .textnorm import fold
+from .vectorize import fit_idf, l2_normalize, tf_matrix, vectorize
+
+DATA_DIR = Path("data")
+DATA_DIR.mkdir(exist_ok=True)
+APPROVED_PATH = DATA_DIR / "respostas_aprovadas.jsonl"
+
+INDEX_DIM = 1 << 12
+# reforço para documentos cuja chave é a intenção prevista pelo classificador
+INTENT_BONUS = 0.05
+# placeholders que não sabemos preencher sem o LLM (ex.: {ORDER_TOTAL})
+PLACEHOLDER_RE = re.compile(r"\{(?!ORDER_ID\})[A-Z_]+\}")
+# palavras (3+ letras, sem acento) que contam para a sobreposição
+WORD_RE = re.compile(r"\w{3,}", re.U)
+# frase de consulta com menos palavras que isto não é indexada
+MIN_QUERY_TOKENS = 2
+# fração das palavras do documento presentes na mensagem, e da mensagem
+# explicadas pelo documento, para um acerto valer
+DOC_COVERAGE = 0.8
+QUERY_COVERAGE = 0.5
+
+
+class Doc(NamedTuple):
+    key: str
+    query: str
+    reply: str
+    stages: frozenset
+    exclusions: Tuple[str, ...]
+    scope: Optional[str] = None  # None = catálogo (todas as lojas)
+
+
+class Hit(NamedTuple):
+    key: str
+    reply: str
+    score: float
+    query: str
+
+
+def _mtime(p: Path) -> float:
+    try:
+        return p.stat().st_mtime
+    except Exception:
+        return 0.0
+
+
+@lru_cache(maxsize=4096)
+def _tokens(text: str) -> frozenset:
+    return frozenset(WORD_RE.findall(fold(text)))
+
+
+def _overlaps(query: str, message: str) -> bool:
+    """A mensagem cobre a frase do documento e é, na maior parte, explicada por ela."""
+    doc, msg = _tokens(query), _tokens(message)
+    common = len(doc & msg)
+    if not doc or not msg or common < min(MIN_QUERY_TOKENS, len(doc)):
+        return False
+    return common / len(doc) >= DOC_COVERAGE and common / len(msg) >= QUERY_COVERAGE
+
+
+class TemplateIndex:
+    def __init__(self, dim: int = INDEX_DIM):
+        self.dim = dim
+        self._signature: tuple = ()
+        self._docs: List[Doc] = []
+        self._keys: Optional[np.ndarray] = None
+        self._scopes: Optional[np.ndarray] = None
+        self._rows: Dict[str, np.ndarray] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._idf: Optional[np.ndarray] = None
+        self._approved: List[dict] = self._dedupe(self._load_approved())
+        self._approved_version = 0
+        # consultas vêm das threads de decisão (abas/lojas); reconstrução e
+        # consulta não podem se misturar
+        self._lock = threading.RLock()
+
+    # ---------- documentos ----------
+
+    @staticmethod
+    def _load_approved() -> List[dict]:
+        out: List[dict] = []
+        try:
+            with APPROVED_PATH.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        out.append(json.loads(line))
+                    except Exception:
+                        continue
+        except FileNotFoundError:
+            pass
+        return out
+
+    @staticmethod
+    def _dedupe(items: List[dict]) -> List[dict]:
+        """Uma aprovação por mensagem do comprador (a mais recente), até o limite."""
+        latest: Dict[tuple, dict] = {}
+        for item in items:
+            key = (item.get("scope", ""), fold(item.get("buyer", "")))
+            latest.pop(key, None)
+            latest[key] = item
+        keep = int(getattr(settings, "template_max_approved", 500) or 0)
+        out = list(latest.values())
+        return out[-keep:] if keep else []
+
+    def _save_approved(self) -> None:
+        tmp = APPROVED_PATH.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for item in self._approved:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        tmp.replace(APPROVED_PATH)
+
+    def _build_docs(self) -> List[Doc]:
+        templates = load_templates()
+        sections = {s.name: s for s in parse_sections(settings.base_prompt)}
+        docs: List[Doc] = []
+
+        def add(key, phrases, reply, stages, exclusions=(), scope=None):
+            if not (reply or "").strip() or PLACEHOLDER_RE.search(reply):
+                return
+            for q in phrases:
+                q = (q or "").strip().lower()
+                if len(_tokens(q)) >= MIN_QUERY_TOKENS:
+                    docs.append(Doc(key, q, reply, stages, tuple(exclusions), scope))
+
+        # só textos de templates.json; regras e "Resposta:" do catálogo vão pelo LLM
+        for key, reply in templates.items():
+            sec = sections.get(key)
+            if sec and sec.keywords and isinstance(reply, str):
+                add(key, sec.keywords, reply, sec.stages, sec.exclusions)
+
+        for item in self._approved:
+            stage = item.get("stage") or ""
+            add(
+                "aprovada",
+                [item.get("buyer", "")],
+                item.get("reply", ""),
+                frozenset({stage}) if stage and stage != "desconhecido" else frozenset(),
+                scope=item.get("scope", ""),
+            )
+
+        # remove duplicatas (mesma frase -> mesma resposta)
+        seen = set()
+        unique: List[Doc] = []
+        for d in docs:
+            k = (d.query, d.reply, d.scope)
+            if k not in seen:
+                seen.add(k)
+                unique.append(d)
+        return unique
+
+    # ---------- índice ----------
+
+    def refresh(self) -> None:
+        """Reconstrói o índice se templates/regras/prompt/aprovadas mudaram."""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self) -> None:
+        sig = (
+            _mtime(TEMPLATES_PATH),
+            hash(settings.base_prompt),
+            self._approved_version,
+        )
+        if sig == self._signature:
+            return
+        t0 = time.perf_counter()
+        docs = self._build_docs()
+        missing = [d.query for d in docs if d.query not in self._rows]
+        if missing:
+            for q, row in zip(missing, tf_matrix(missing, self.dim)):
+                self._rows[q] = row
+        wanted = {d.query for d in docs}
+        self._rows = {q: r for q, r in self._rows.items() if q in wanted}
+
+        if docs:
+            tf = np.stack([self._rows[d.query] for d in docs])
+            self._idf = fit_idf(tf)
+            self._matrix = l2_normalize(tf * self._idf)
+        else:
+            self._idf = None
+            self._matrix = None
+        self._docs = docs
+        self._keys = np.array([d.key for d in docs])
+        # None (catálogo) vale para todas as lojas
+        self._scopes = np.array([d.scope for d in docs], dtype=object)
+        self._signature = sig
+        metrics.observe("templates.rebuild", time.perf_counter() - t0)
+        metrics.gauge("templates.docs", len(docs))
+        print(
+            f"[DEBUG] índice de templates: {len(docs)} docs ({len(missing)} novos vetorizados)"
+        )
+
+    def lookup(
+        self, messages: List[str], stage: str = "desconhecido", intents=(), scope: str = ""
+    ) -> Optional[Hit]:
+        """Melhor documento para as últimas mensagens do comprador (ou None)."""
+        with self._lock:
+            return self._lookup(messages, stage, intents, scope)
+
+    def _lookup(self, messages: List[str], stage: str, intents, scope: str) -> Optional[Hit]:
+        self._refresh()
+        msgs = [m for m in (messages or []) if m and m.strip()][-3:]
+        if self._matrix is None or not msgs:
+            return None
+
+        t0 = time.perf_counter()
+        q = vectorize(msgs, self._idf, self.dim)
+        scores = q @ self._matrix.T  # (mensagens × docs)
+        # a última mensagem decide; as anteriores só reforçam um acerto parcial
+        best = scores[-1]
+        if len(msgs) > 1:
+            best = np.maximum(best, 0.6 * best + 0.4 * scores[:-1].max(axis=0))
+        if intents:
+            best = best + INTENT_BONUS * np.isin(self._keys, list(intents))
+        # aprovadas de outras lojas ficam fora
+        own = np.array([sc is None or sc == scope for sc in self._scopes])
+        best = np.where(own, best, -1.0)
+
+        low = fold(" ".join(msgs))
+        for j in np.argsort(-best)[:10]:
+            d = self._docs[int(j)]
+            if not own[j]:
+                break
+            if d.stages and stage != "desconhecido" and stage not in d.stages:
+                continue
+            if any(fold(x) in low for x in d.exclusions):
+                continue
+            if not _overlaps(d.query, msgs[-1]):
+                continue
+            hit = Hit(d.key, d.reply, float(best[j]), d.query)
+            break
+        else:
+            hit = None
+        metrics.observe("templates.lookup", time.perf_counter() - t0)
+        return hit
+
+    def match(
+        self, messages: List[str], stage: str = "desconhecido", intents=(), scope: str = ""
+    ) -> Optional[Hit]:
+        """Como ``lookup``, mas só devolve acertos acima de ``template_min_score``."""
+        hit = self.lookup(messages, stage, intents, scope)
+        ok = bool(hit) and hit.score >= settings.template_min_score
+        metrics.incr("templates.hit" if ok else "templates.miss")
+        hits = metrics.snapshot("templates.")["counters"]
+        total = hits.get("templates.hit", 0) + hits.get("templates.miss", 0)
+        metrics.gauge("templates.hit_rate", round(hits.get("templates.hit", 0) / total, 4))
+        return hit if ok else None
+
+    def remember(self, buyer_text: str, reply: str, stage: str = "", scope: str = "") -> None:
+        """Guarda uma resposta aprovada na UI (substitui a anterior da mesma mensagem)."""
+        buyer_text = (buyer_text or "").strip()
+        reply = (reply or "").strip()
+        if not buyer_text or not reply:
+            return
+        item = {
+            "buyer": buyer_text,
+            "reply": reply,
+            "stage": stage,
+            "scope": scope,
+            "ts": int(time.time()),
+        }
+        with self._lock:
+            self._approved = self._dedupe(self._approved + [item])
+            self._approved_version += 1
+            try:
+                self._save_approved()
+            except Exception as e:
+                print(f"[templates] falha ao salvar resposta aprovada: {e}")
+
+
+# Instância compartilhada (o índice é montado na primeira consulta)
+TEMPLATE_INDEX = TemplateIndex()
@@ -1,10 +1,11 @@
 import json, os
 from pathlib import Path
 
+TEMPLATES_PATH = Path(__file__).resolve().parents[1] / "templates" / "templates.json"
+
 
 def load_templates() -> dict:
-    p = Path(__file__).resolve().parents[1] / "templates" / "templates.json"
-    with open(p, "r", encoding="utf-8") as f:
+    with open(TEMPLATES_PATH, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
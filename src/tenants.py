@@ -0,0 +1,375 @@
+# src/tenants.py
+"""
+Várias lojas Duoke num único processo.
+
+Cada ``user_id`` com sessão em ``sessions/<id>.bin`` (login feito pelo
+main.py) vira um ``Tenant``: um ``DuokeBot`` próprio num contexto efêmero do
+navegador do pool. O ``TenantPool``:
+
+- escolhe sempre as lojas vencidas atendidas há mais tempo (rodízio justo),
+  com no máximo ``tenant_max_concurrent`` varrendo ao mesmo tempo;
+- limita cada loja a uma varredura por vez, ``tenant_max_conversations`` por
+  varredura e uma a cada ``tenant_interval_seconds``;
+- mantém até ``tenant_max_contexts`` contextos abertos (o menos usado é
+  fechado para abrir outro) e fecha os de lojas sem respostas há
+  ``tenant_idle_minutes``, que passam a ser varridas com menos frequência;
+- pausa a loja cuja sessão expirou até o arquivo de sessão mudar;
+- com a RSS do navegador acima de ``watchdog_rss_mb``, fecha o contexto menos
+  usado (uma vez por ``MEMORY_CHECK_SECONDS``); cada loja só recarrega/recria
+  pelas próprias abas (heap/nós do DOM).
+
+A decisão (Gemini) de cada conversa roda numa thread (``asyncio.to_thread``
+no ``DuokeBot``); o executor padrão do laço é dimensionado para todas as abas
+das lojas em varredura, assim uma loja esperando o modelo não trava as outras,
+os avisos da página nem o despachante.
+
+    python -m src.tenants
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from playwright.async_api import async_playwright
+
+from . import metrics
+from .browser import SharedBrowser
+from .config import settings
+from .duoke import DuokeBot
+from .message_store import MESSAGES
+from .session_vault import list_users, session_path
+from .state_store import STATE
+from .watchdog import rss_over_limit
+
+# lojas sem movimento são varridas com intervalo multiplicado por isto
+QUIET_FACTOR = 4
+MAX_BACKOFF = 300.0
+# intervalo entre as leituras de RSS do navegador compartilhado
+MEMORY_CHECK_SECONDS = 30.0
+
+# executor das decisões, criado na primeira execução do pool (a UI reinicia o pool)
+_EXECUTOR: tuple | None = None  # (laço, threads, executor)
+
+
+def _session_mtime(user_id: str) -> float:
+    try:
+        return session_path(user_id).stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+class Tenant:
+    __slots__ = (
+        "user_id",
+        "bot",
+        "ctx",
+        "page",
+        "busy",
+        "next_due",
+        "last_served",
+        "last_used",
+        "last_reply",
+        "cycles",
+        "errors",
+        "blocked_mtime",
+    )
+
+    def __init__(self, user_id: str, browser: SharedBrowser):
+        now = time.monotonic()
+        self.user_id = user_id
+        self.bot = DuokeBot(
+            session_user_id=user_id,
+            browser_mode="compartilhado",
+            use_env_credentials=False,
+            shared_browser=browser,
+        )
+        self.bot.max_conversations = settings.tenant_max_conversations
+        # a RSS do navegador compartilhado é do pool, não da loja
+        self.bot.watchdog.rss = False
+        self.ctx = None
+        self.page = None
+        self.busy = False
+        self.next_due = now
+        self.last_served = 0.0
+        self.last_used = now
+        self.last_reply = now
+        self.cycles = 0
+        self.errors = 0
+        # mtime da sessão quando a loja foi pausada por login expirado (0 = ativa)
+        self.blocked_mtime = 0.0
+
+    @property
+    def replied(self) -> int:
+        return sum(st.replied for st in self.bot.tab_stats.values())
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        return {
+            "user_id": self.user_id,
+            "aberto": self.ctx is not None,
+            "ocupado": self.busy,
+            "bloqueado": bool(self.blocked_mtime),
+            "varreduras": self.cycles,
+            "respondidas": self.replied,
+            "erros": self.errors,
+            "proxima_em_s": round(max(0.0, self.next_due - now), 1),
+        }
+
+
+class TenantPool:
+    def __init__(self, decide_reply_fn):
+        self.decide_reply_fn = decide_reply_fn
+        # navegador próprio: o bot único da UI fecha o dele sem derrubar as lojas
+        self.browser = SharedBrowser()
+        self.tenants: Dict[str, Tenant] = {}
+        self.stop_event = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._tasks: set = set()
+        self._memory_checked = time.monotonic()
+
+    # ---------- limites ----------
+
+    @property
+    def max_contexts(self) -> int:
+        return max(1, int(settings.tenant_max_contexts))
+
+    @property
+    def max_concurrent(self) -> int:
+        # cada varredura precisa de um contexto aberto
+        return max(1, min(int(settings.tenant_max_concurrent), self.max_contexts))
+
+    @property
+    def decision_threads(self) -> int:
+        # cada aba de cada loja em varredura pode estar esperando o Gemini
+        return self.max_concurrent * max(1, int(settings.tabs))
+
+    @property
+    def idle_seconds(self) -> float:
+        return float(settings.tenant_idle_minutes) * 60
+
+    # ---------- controle ----------
+
+    def request_stop(self) -> None:
+        """Termina as varreduras em andamento (conversa atual) e sai do laço."""
+        self.stop_event.set()
+        self._wake.set()
+        for t in self.tenants.values():
+            t.bot.request_stop()
+
+    def status(self) -> List[dict]:
+        return [t.status() for t in self.tenants.values()]
+
+    # ---------- lojas ----------
+
+    def _sync_tenants(self) -> None:
+        """Acompanha o cofre: lojas novas entram, removidas saem, re-login desbloqueia."""
+        users = set(list_users())
+        for uid in sorted(users - self.tenants.keys()):
+            self.tenants[uid] = Tenant(uid, self.browser)
+            print(f"[TENANTS] loja adicionada: {uid}")
+        for uid, t in list(self.tenants.items()):
+            if uid not in users and not t.busy and t.ctx is None:
+                del self.tenants[uid]
+                print(f"[TENANTS] loja removida: {uid}")
+            elif t.blocked_mtime and _session_mtime(uid) != t.blocked_mtime:
+                t.blocked_mtime = 0.0
+                t.next_due = time.monotonic()
+                print(f"[TENANTS] sessão renovada: {uid}")
+        metrics.gauge("tenants.total", len(self.tenants))
+
+    def _open_count(self) -> int:
+        return sum(1 for t in self.tenants.values() if t.ctx is not None)
+
+    async def _close(self, t: Tenant, reason: str) -> None:
+        ctx, t.ctx = t.ctx, None
+        if ctx is None:
+            return
+        t.bot.current_page = t.page
+        await t.bot._close_context(ctx)
+        t.bot.current_page = t.page = None
+        metrics.incr(f"tenants.closed.{reason}")
+        metrics.gauge("tenants.contexts", self._open_count())
+
+    async def _make_room(self) -> None:
+        """Fecha os contextos ociosos menos usados até caber o que está abrindo."""
+        # lojas ocupadas sem contexto (inclusive a atual) estão abrindo um
+        while (
+            sum(1 for t in self.tenants.values() if t.ctx is not None or t.busy)
+            > self.max_contexts
+        ):
+            idle = [t for t in self.tenants.values() if t.ctx is not None and not t.busy]
+            if not idle:
+                return
+            await self._close(min(idle, key=lambda t: t.last_used), "lru")
+
+    async def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        for t in list(self.tenants.values()):
+            if t.ctx is not None and not t.busy and t.last_used < cutoff:
+                print(f"[TENANTS] fechando contexto ocioso: {t.user_id}")
+                await self._close(t, "ocioso")
+
+    async def _memory_point(self) -> None:
+        """RSS do navegador acima do limite: fecha o contexto ocioso menos usado."""
+        now = time.monotonic()
+        if not settings.watchdog or now - self._memory_checked < MEMORY_CHECK_SECONDS:
+            return
+        self._memory_checked = now
+        if not rss_over_limit():
+            return
+        idle = [t for t in self.tenants.values() if t.ctx is not None and not t.busy]
+        if idle:
+            victim = min(idle, key=lambda t: t.last_used)
+            print(f"[TENANTS] memória do navegador alta; fechando contexto: {victim.user_id}")
+            await self._close(victim, "memoria")
+
+    async def _open(self, p, t: Tenant) -> bool:
+        await self._make_room()
+        t.ctx = await t.bot._new_context(p)
+        t.page = await t.bot._get_page(t.ctx)
+        metrics.gauge("tenants.contexts", self._open_count())
+        try:
+            await t.bot.ensure_login(t.page)
+            logged = not t.bot.awaiting_2fa and await t.bot._is_logged_ui(t.page)
+        except RuntimeError:
+            # caiu na tela de login e a loja não tem credenciais no ambiente
+            logged = False
+        if not logged:
+            # sessão expirada: espera um novo login pelo main.py
+            print(f"[TENANTS] sessão expirada, loja pausada: {t.user_id}")
+            t.blocked_mtime = _session_mtime(t.user_id) or -1.0
+            await self._close(t, "login")
+            return False
+        return True
+
+    async def _serve(self, p, t: Tenant) -> None:
+        """Uma varredura da loja ``t`` (abrindo o contexto se preciso)."""
+        interval = float(settings.tenant_interval_seconds)
+        try:
+            if t.ctx is None and not await self._open(p, t):
+                return
+            before = t.replied
+            focus = t.bot.take_changed_rows() if t.bot.wake_event.is_set() else None
+            with metrics.timer("tenants.cycle"):
+                await t.bot._cycle(t.page, self.decide_reply_fn, focus)
+            if await t.bot._watchdog_point(t.page):
+                # contexto pesado demais: reaberto na próxima varredura
+                await self._close(t, "memoria")
+            now = time.monotonic()
+            t.cycles += 1
+            t.errors = 0
+            if t.replied > before:
+                t.last_reply = now
+            quiet = now - t.last_reply > self.idle_seconds
+            t.next_due = now + interval * (QUIET_FACTOR if quiet else 1)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            t.errors += 1
+            delay = min(MAX_BACKOFF, 2.0 * 2**t.errors)
+            t.next_due = time.monotonic() + delay
+            metrics.incr("tenants.errors")
+            print(f"[TENANTS] {t.user_id}: {e}. Nova tentativa em {delay:.0f}s")
+            await self._close(t, "erro")
+        finally:
+            t.busy = False
+            t.last_used = time.monotonic()
+            self._wake.set()
+
+    def _is_due(self, t: Tenant, now: float) -> bool:
+        if t.busy or t.blocked_mtime:
+            return False
+        # aviso da página adianta a varredura, respeitando o intervalo mínimo
+        woke = t.bot.wake_event.is_set() and (
+            now - t.last_served >= settings.wake_min_gap_seconds
+        )
+        return woke or t.next_due <= now
+
+    def _dispatch(self, p) -> None:
+        now = time.monotonic()
+        due = sorted(
+            (t for t in self.tenants.values() if self._is_due(t, now)),
+            key=lambda t: t.last_served,
+        )
+        for t in due:
+            if len(self._tasks) >= self.max_concurrent:
+                break
+            t.busy = True
+            t.last_served = now
+            task = asyncio.ensure_future(self._serve(p, t))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        metrics.gauge("tenants.in_flight", len(self._tasks))
+
+    def _size_executor(self) -> None:
+        """Garante threads de decisão para todas as varreduras simultâneas."""
+        global _EXECUTOR
+        loop = asyncio.get_running_loop()
+        # padrão do asyncio: min(32, CPUs + 4)
+        wanted = max(self.decision_threads + 4, min(32, (os.cpu_count() or 1) + 4))
+        # o asyncio.run encerra o executor padrão junto com o laço
+        if _EXECUTOR is None or _EXECUTOR[0] is not loop or _EXECUTOR[1] < wanted:
+            if _EXECUTOR is not None and _EXECUTOR[0] is loop:
+                _EXECUTOR[2].shutdown(wait=False)  # decisões em curso terminam
+            pool = ThreadPoolExecutor(max_workers=wanted, thread_name_prefix="decisao")
+            loop.set_default_executor(pool)
+            _EXECUTOR = (loop, wanted, pool)
+        metrics.gauge("tenants.decision_threads", _EXECUTOR[1])
+
+    async def run_forever(self, tick: float = 1.0) -> None:
+        self.stop_event.clear()
+        self._size_executor()
+        async with async_playwright() as p:
+            try:
+                while not self.stop_event.is_set():
+                    self._sync_tenants()
+                    self._dispatch(p)
+                    await self._evict_idle()
+                    await self._memory_point()
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=tick)
+                    except asyncio.TimeoutError:
+                        pass
+                if self._tasks:
+                    await asyncio.gather(*self._tasks, return_exceptions=True)
+            finally:
+                for task in list(self._tasks):
+                    task.cancel()
+                if self._tasks:
+                    await asyncio.gather(*self._tasks, return_exceptions=True)
+                for t in self.tenants.values():
+                    await self._close(t, "fim")
+                STATE.snapshot(force=True)
+                MESSAGES.snapshot(force=True)
+                await self.browser.close()
+        print("[TENANTS] pool encerrado.")
+
+
+async def main() -> None:
+    from .classifier import decide_reply
+    from .run_loop import _install_signal_handlers
+
+    if not list_users():
+        print("[TENANTS] nenhuma sessão em sessions/. Conecte as lojas pelo main.py.")
+        return
+    pool = TenantPool(decide_reply)
+    installed = _install_signal_handlers(pool)
+    try:
+        await pool.run_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        loop = asyncio.get_running_loop()
+        for sig in installed:
+            loop.remove_signal_handler(sig)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n[TENANTS] Encerrado pelo usuário.")
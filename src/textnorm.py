@@ -0,0 +1,49 @@
+# src/textnorm.py
+"""
+Normalização de texto compartilhada pelos matchers (regras, gatilhos de
+problema, intenção, higienização e dedupe de respostas).
+
+``normalize`` é cacheada por string: cada mensagem é normalizada uma vez e o
+mesmo ``NormalizedText`` é reaproveitado por todos os matchers do ciclo.
+Palavras-chave também passam por ``fold``; por isso as listas só precisam da
+grafia sem acento ("peca" casa "peça", "peca" e "PEÇA").
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+_WS_RE = re.compile(r"\s+")
+
+
+class NormalizedText(NamedTuple):
+    raw: str
+    # minúsculo + espaços colapsados (acentos preservados; p/ regex de usuário)
+    lower: str
+    # ``lower`` sem acentos: base de todas as comparações por substring
+    folded: str
+
+    def has(self, needle: str) -> bool:
+        return fold(needle) in self.folded
+
+    def has_any(self, needles: Iterable[str]) -> bool:
+        return any(fold(n) in self.folded for n in needles)
+
+
+def _strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+@lru_cache(maxsize=8192)
+def normalize(text: str) -> NormalizedText:
+    raw = text or ""
+    lower = _WS_RE.sub(" ", raw.lower()).strip()
+    return NormalizedText(raw, lower, _strip_accents(lower))
+
+
+def fold(text: str) -> str:
+    """Forma canônica (minúsculo, sem acento, espaços colapsados)."""
+    return normalize(text).folded
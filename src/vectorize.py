@@ -0,0 +1,73 @@
+# src/vectorize.py
+"""
+Vetorização de texto por n-gramas com hashing (sem vocabulário).
+
+Usada pelo índice de templates e pelo classificador de intenção: n-gramas de
+caracteres (3–5) + palavras sobre o texto normalizado (sem acento), hash
+estável (crc32) em ``dim`` posições, TF sublinear e normalização L2.
+"""
+from __future__ import annotations
+
+import re
+import zlib
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from .textnorm import fold
+
+DEFAULT_DIM = 1 << 14
+_WORD_RE = re.compile(r"\w+", re.U)
+
+
+def ngram_counts(text: str, dim: int = DEFAULT_DIM) -> Dict[int, float]:
+    """Contagem de n-gramas já mapeados para posições do vetor."""
+    t = fold(text)
+    counts: Dict[int, float] = {}
+    if not t:
+        return counts
+    padded = f" {t} "
+    for n in (3, 4, 5):
+        for i in range(len(padded) - n + 1):
+            h = zlib.crc32(padded[i : i + n].encode("utf-8")) % dim
+            counts[h] = counts.get(h, 0.0) + 1.0
+    for w in _WORD_RE.findall(t):
+        h = zlib.crc32(f"w:{w}".encode("utf-8")) % dim
+        counts[h] = counts.get(h, 0.0) + 1.0
+    return counts
+
+
+def tf_matrix(texts: Iterable[str], dim: int = DEFAULT_DIM) -> np.ndarray:
+    """Matriz (n_textos × dim) com TF sublinear (1 + log tf)."""
+    texts = list(texts)
+    mat = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        counts = ngram_counts(text, dim)
+        if counts:
+            idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            val = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            mat[row, idx] = 1.0 + np.log(val)
+    return mat
+
+
+def fit_idf(tf: np.ndarray) -> np.ndarray:
+    """IDF suavizado a partir de uma matriz TF."""
+    n = tf.shape[0]
+    df = np.count_nonzero(tf, axis=0).astype(np.float32)
+    return (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+
+
+def l2_normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def vectorize(
+    texts: List[str], idf: np.ndarray | None = None, dim: int = DEFAULT_DIM
+) -> np.ndarray:
+    """TF(-IDF) normalizado, pronto para similaridade de cosseno via produto matricial."""
+    mat = tf_matrix(texts, dim)
+    if idf is not None:
+        mat *= idf
+    return l2_normalize(mat)
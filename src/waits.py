@@ -0,0 +1,138 @@
+# src/waits.py
+"""
+Esperas por condição no lugar de pausas fixas (``wait_for_timeout``).
+
+Cada espera termina assim que o DOM fica pronto (lista preenchida e estável,
+altura de rolagem assentada, mensagem enviada na tela) e registra quanto
+durou em ``metrics`` como ``wait.<nome>`` (``wait.<nome>.timeout`` conta as
+que estouraram o limite).
+"""
+from __future__ import annotations
+
+import itertools
+
+from . import metrics
+
+# sem mudanças por este tempo = "estável"
+QUIET_MS = 150
+
+_tokens = itertools.count(1)
+
+# Assinatura de uma lista: contagem + fim do texto do último item
+SIG_JS = """
+(sel) => {
+  const els = document.querySelectorAll(sel);
+  const last = els.length ? (els[els.length - 1].innerText || '') : '';
+  return els.length + '|' + last.length + '|' + last.slice(-40);
+}
+"""
+
+# Verdadeiro quando ``sel`` tem ao menos ``min`` itens e a assinatura não muda
+# há ``quiet`` ms. Com ``before`` (assinatura anterior ao clique), espera
+# também ela mudar, por até ``grace`` ms (a lista antiga continua na tela até
+# a nova renderizar). Estado guardado na janela por seletor; ``token`` novo a
+# cada espera para não herdar a anterior.
+STABLE_JS = """
+({ sel, quiet, min, token, before, grace }) => {
+  const els = document.querySelectorAll(sel);
+  const last = els.length ? (els[els.length - 1].innerText || '') : '';
+  const sig = els.length + '|' + last.length + '|' + last.slice(-40);
+  const st = (window.__dkStable = window.__dkStable || {});
+  const now = performance.now();
+  let cur = st[sel];
+  if (!cur || cur.token !== token) cur = st[sel] = { sig: null, since: now, start: now, token };
+  if (cur.sig !== sig) { cur.sig = sig; cur.since = now; return false; }
+  if (before && sig === before && now - cur.start < grace) return false;
+  return els.length >= min && now - cur.since >= quiet;
+}
+"""
+
+# Rola ao topo enquanto o histórico cresce (carregamento preguiçoso), até
+# ``rounds`` cargas ou a altura ficar parada por ``quiet`` ms
+SCROLL_TOP_JS = """
+async (el, { rounds, quiet, timeout }) => {
+  const t0 = performance.now();
+  const tick = () => new Promise((r) => setTimeout(r, 16));
+  let height = el.scrollHeight, since = performance.now(), loads = 0;
+  el.scrollTop = 0;
+  while (performance.now() - t0 < timeout) {
+    await tick();
+    if (el.scrollHeight !== height) {
+      height = el.scrollHeight;
+      since = performance.now();
+      if (++loads >= rounds) break;
+      el.scrollTop = 0;
+    } else if (performance.now() - since >= quiet) {
+      break;
+    }
+  }
+  return loads;
+}
+"""
+
+# A última bolha do vendedor contém o começo do texto enviado
+SENT_JS = """
+({ sel, prefix }) => {
+  const els = document.querySelectorAll(sel);
+  const last = els.length ? (els[els.length - 1].innerText || '') : '';
+  return last.replace(/\\s+/g, ' ').includes(prefix);
+}
+"""
+
+
+async def _until(page, name: str, js: str, arg, timeout_ms: int) -> bool:
+    with metrics.timer(f"wait.{name}"):
+        try:
+            await page.wait_for_function(js, arg=arg, timeout=timeout_ms, polling=50)
+            return True
+        except Exception:
+            metrics.incr(f"wait.{name}.timeout")
+            return False
+
+
+async def signature(page, selector: str) -> str:
+    try:
+        return await page.evaluate(SIG_JS, selector)
+    except Exception:
+        return ""
+
+
+async def stable(
+    page,
+    name: str,
+    selector: str,
+    timeout_ms: int = 3000,
+    min_items: int = 1,
+    before: str = "",
+    grace_ms: int = 1500,
+) -> bool:
+    """Espera ``selector`` ter itens e parar de mudar (e sair de ``before``, se dado)."""
+    arg = {
+        "sel": selector,
+        "quiet": QUIET_MS,
+        "min": min_items,
+        "token": next(_tokens),
+        "before": before,
+        "grace": grace_ms,
+    }
+    return await _until(page, name, STABLE_JS, arg, timeout_ms)
+
+
+async def scroll_to_top(locator, rounds: int = 3, timeout_ms: int = 2000) -> int:
+    """Sobe o histórico numa só ida à página; retorna quantas cargas aconteceram."""
+    with metrics.timer("wait.scroll_top"):
+        try:
+            return await locator.evaluate(
+                SCROLL_TOP_JS, {"rounds": rounds, "quiet": QUIET_MS, "timeout": timeout_ms}
+            )
+        except Exception:
+            metrics.incr("wait.scroll_top.timeout")
+            return 0
+
+
+async def sent(page, selector: str, text: str, timeout_ms: int = 3000) -> bool:
+    """Espera a mensagem enviada aparecer como última bolha do vendedor."""
+    prefix = " ".join((text or "").split())[:24]
+    if not prefix:
+        return True
+    return await _until(page, "sent", SENT_JS, {"sel": selector, "prefix": prefix}, timeout_ms)
@@ -0,0 +1,193 @@
+# src/watchdog.py
+"""
+Vigia de memória do Chromium para sessões longas.
+
+A cada ciclo amostra, por aba, ``Performance.getMetrics`` via CDP
+(JSHeapUsedSize, Nodes, LayoutCount) e a RSS dos processos do navegador
+filhos deste processo (/proc). Com os limites estourados, o ponto seguro
+entre ciclos decide:
+
+- ``reload``: a aba passou de ``watchdog_heap_mb`` ou ``watchdog_nodes``
+  (recarrega a página; o login fica no contexto);
+- ``recycle``: a RSS passou de ``watchdog_rss_mb`` ou a aba continua acima do
+  limite logo depois de recarregada (contexto recriado).
+
+No pool de lojas o navegador é um só: cada loja olha só as próprias abas
+(``rss=False``) e a RSS é decidida uma vez pelo pool (``rss_over_limit``), que
+fecha o contexto menos usado.
+
+Valores e tendência (MB/h do heap) vão para ``metrics`` como ``browser.*``
+(``browser.<loja>.tab<n>.*`` por aba no pool de lojas).
+"""
+from __future__ import annotations
+
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+
+# amostras guardadas por aba para a tendência (publicada com 1 min de janela)
+TREND_SAMPLES = 30
+MIN_TREND_HOURS = 1 / 60
+
+
+def _proc_children() -> Dict[int, List[int]]:
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", encoding="ascii", errors="replace") as fh:
+                # o nome do processo (2º campo) pode ter espaços: corta no último ')'
+                ppid = int(fh.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    return children
+
+
+def browser_rss_mb() -> Optional[float]:
+    """RSS somada dos processos descendentes deste (Chromium); None fora do Linux."""
+    if not os.path.isdir("/proc"):
+        return None
+    try:
+        children = _proc_children()
+    except OSError:
+        return None
+    total_kb = 0
+    stack = list(children.get(os.getpid(), ()))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, ()))
+        try:
+            with open(f"/proc/{pid}/status", encoding="ascii", errors="replace") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except (OSError, ValueError):
+            continue
+    return total_kb / 1024
+
+
+def rss_over_limit() -> bool:
+    """Publica ``browser.rss_mb`` e diz se passou de ``watchdog_rss_mb``."""
+    rss = browser_rss_mb()
+    if rss is None:
+        return False
+    metrics.gauge("browser.rss_mb", round(rss, 1))
+    limit = float(settings.watchdog_rss_mb)
+    if limit and rss > limit:
+        print(f"[DEBUG] watchdog: RSS do navegador {rss:.0f} MB > {limit:.0f} MB")
+        return True
+    return False
+
+
+class PageSample:
+    __slots__ = ("at", "heap_mb", "nodes", "layouts")
+
+    def __init__(self, at: float, heap_mb: float, nodes: int, layouts: int):
+        self.at = at
+        self.heap_mb = heap_mb
+        self.nodes = nodes
+        self.layouts = layouts
+
+
+class MemoryWatchdog:
+    def __init__(self, scope: str = "", rss: bool = True):
+        self.prefix = f"{scope}.tab" if scope else "tab"
+        # False = navegador compartilhado; a RSS é decidida por quem o gerencia
+        self.rss = rss
+        self._sessions: Dict[Any, Any] = {}
+        self._history: Dict[Any, deque] = {}
+        # abas recarregadas na última verificação
+        self._reloaded: set = set()
+
+    def forget(self, page=None) -> None:
+        """Descarta sessões CDP/histórico (de uma aba ou de todas, ao fechar o contexto)."""
+        pages = [page] if page is not None else list(self._sessions) + list(self._history)
+        for pg in pages:
+            self._sessions.pop(pg, None)
+            self._history.pop(pg, None)
+            self._reloaded.discard(pg)
+
+    def reset_trend(self, page) -> None:
+        """Aba recarregada: a tendência recomeça (a sessão CDP continua válida)."""
+        self._history.pop(page, None)
+
+    async def _session(self, page):
+        cdp = self._sessions.get(page)
+        if cdp is None:
+            cdp = await page.context.new_cdp_session(page)
+            await cdp.send("Performance.enable")
+            self._sessions[page] = cdp
+        return cdp
+
+    async def sample(self, page) -> Optional[PageSample]:
+        try:
+            cdp = await self._session(page)
+            raw = await cdp.send("Performance.getMetrics")
+        except Exception as e:
+            # CDP só existe no Chromium; aba fechada também cai aqui
+            self._sessions.pop(page, None)
+            print(f"[DEBUG] watchdog: métricas indisponíveis ({e})")
+            return None
+        values = {m["name"]: m["value"] for m in raw.get("metrics", ())}
+        return PageSample(
+            time.monotonic(),
+            values.get("JSHeapUsedSize", 0) / (1024 * 1024),
+            int(values.get("Nodes", 0)),
+            int(values.get("LayoutCount", 0)),
+        )
+
+    def _publish(self, name: str, hist: deque) -> None:
+        last = hist[-1]
+        metrics.gauge(f"browser.{name}.js_heap_mb", round(last.heap_mb, 1))
+        metrics.gauge(f"browser.{name}.dom_nodes", last.nodes)
+        if len(hist) >= 2:
+            prev, first = hist[-2], hist[0]
+            metrics.gauge(f"browser.{name}.layouts_per_cycle", last.layouts - prev.layouts)
+            hours = (last.at - first.at) / 3600
+            if hours >= MIN_TREND_HOURS:
+                slope = (last.heap_mb - first.heap_mb) / hours
+                metrics.gauge(f"browser.{name}.js_heap_mb_per_h", round(slope, 1))
+
+    async def check(self, pages: List[Any]) -> Tuple[str, List[Any]]:
+        """
+        Amostra as abas e decide: ``("ok", [])``, ``("reload", abas)`` ou
+        ``("recycle", [])``. Chamar só entre ciclos (nenhuma conversa aberta).
+        """
+        if not settings.watchdog:
+            return "ok", []
+        heap_limit = float(settings.watchdog_heap_mb)
+        nodes_limit = int(settings.watchdog_nodes)
+        over: List[Any] = []
+        for n, page in enumerate(pages):
+            s = await self.sample(page)
+            if s is None:
+                continue
+            hist = self._history.setdefault(page, deque(maxlen=TREND_SAMPLES))
+            hist.append(s)
+            self._publish(f"{self.prefix}{n}", hist)
+            if (heap_limit and s.heap_mb > heap_limit) or (nodes_limit and s.nodes > nodes_limit):
+                over.append(page)
+
+        if self.rss and rss_over_limit():
+            return self._verdict("recycle", [])
+        if any(pg in self._reloaded for pg in over):
+            # recarregar não resolveu
+            print("[DEBUG] watchdog: aba continua acima do limite após recarregar")
+            return self._verdict("recycle", [])
+        self._reloaded = set(over)
+        if over:
+            return self._verdict("reload", over)
+        return "ok", []
+
+    def _verdict(self, action: str, pages: List[Any]) -> Tuple[str, List[Any]]:
+        metrics.incr(f"watchdog.{action}")
+        if action == "recycle":
+            self._reloaded.clear()
+        return action, pages
@@ -0,0 +1,8 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# permite `pytest` a partir da raiz sem instalar o pacote
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,184 @@
+# tests/test_router.py
+"""Roteador de tiers com o Gemini substituído por modelos falsos."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src import classifier, gemini_client
+from src.config import settings
+from src.router import TIER_LIGHT, TIER_STRONG, choose_route, score_complexity, tier_stats
+
+LIGHT = "modelo-leve"
+STRONG = "modelo-forte"
+
+
+class FakeModel:
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError(f"{self.name} indisponível")
+        return SimpleNamespace(text=f"resposta do {self.name}")
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError(f"{self.name} indisponível")
+
+        async def chunks():
+            for piece in ("resposta ", f"do {self.name}"):
+                yield SimpleNamespace(text=piece)
+
+        return chunks()
+
+
+@pytest.fixture
+def models(monkeypatch):
+    for name, value in {
+        "gemini_api_key": "teste",
+        "gemini_model": STRONG,
+        "gemini_model_light": LIGHT,
+        "model_routing": True,
+        "router_threshold": 2.0,
+        "prompt_sections": False,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    fakes = {LIGHT: FakeModel(LIGHT), STRONG: FakeModel(STRONG)}
+    monkeypatch.setattr(gemini_client, "get_gemini", lambda name=None: fakes[name or STRONG])
+    return fakes
+
+
+def _counter(name):
+    return tier_stats()["counters"].get(name, 0)
+
+
+def _latency_count(tier):
+    return tier_stats()["timings"].get(f"router.{tier}.latency", {}).get("count", 0)
+
+
+def test_acknowledgement_goes_to_light_model(models):
+    route = choose_route([], ["muito obrigado!"], intents={"agradecimento_curto"})
+    assert route.tier == TIER_LIGHT
+    assert route.model == LIGHT
+    assert "simples" in route.reasons
+
+
+def test_status_question_goes_to_light_model(models):
+    route = choose_route(
+        [("buyer", "oi"), ("seller", "olá!")],
+        ["quando vocês enviam?"],
+        intents={"tempo_envio"},
+        stage="pre_venda",
+    )
+    assert route.tier == TIER_LIGHT
+
+
+def test_dispute_goes_to_strong_model(models):
+    score, reasons = score_complexity(
+        [], ["chegou quebrado, quero devolver"], {"quebra_com_foto"}, "entregue"
+    )
+    assert score >= settings.router_threshold
+    assert any(r.startswith("disputa:") for r in reasons)
+
+    route = choose_route(
+        [], ["chegou quebrado, quero devolver"], intents={"quebra_com_foto"}, stage="entregue"
+    )
+    assert route.tier == TIER_STRONG
+    assert route.model == STRONG
+
+
+def test_long_ambiguous_conversation_goes_to_strong_model(models):
+    msgs = [f"mensagem {i}" for i in range(14)]
+    route = choose_route([], msgs, near_misses=["a", "b"])
+    assert route.tier == TIER_STRONG
+
+
+def test_routing_disabled_always_uses_strong_model(models, monkeypatch):
+    monkeypatch.setattr(settings, "model_routing", False)
+    route = choose_route([], ["obrigado"], intents={"agradecimento_curto"})
+    assert route.tier == TIER_STRONG
+
+
+def test_tier_stats_count_volume(models):
+    light, strong = _counter("router.leve"), _counter("router.forte")
+    choose_route([], ["obrigado"], intents={"agradecimento_curto"})
+    choose_route([], ["obrigado"], intents={"agradecimento_curto"})
+    choose_route([], ["veio faltando peça"], intents={"faltando_peca"}, stage="entregue")
+
+    stats = tier_stats()
+    assert stats["counters"]["router.leve"] == light + 2
+    assert stats["counters"]["router.forte"] == strong + 1
+
+
+@pytest.fixture
+def llm_only(models, monkeypatch):
+    # sem atalho de template: a decisão sempre chega ao modelo roteado
+    monkeypatch.setattr(settings, "template_index", False)
+    monkeypatch.setattr(settings, "stream_replies", False)
+    return models
+
+
+def test_decide_reply_records_tier_latency(llm_only):
+    light, strong = _latency_count(TIER_LIGHT), _latency_count(TIER_STRONG)
+
+    should, reply = classifier.decide_reply([], ["muito obrigado!"])
+
+    assert (should, reply) == (True, f"resposta do {LIGHT}")
+    assert _latency_count(TIER_LIGHT) == light + 1
+    assert _latency_count(TIER_STRONG) == strong
+
+
+def test_streamed_decide_reply_records_tier_latency(llm_only, monkeypatch):
+    monkeypatch.setattr(settings, "stream_replies", True)
+    light = _latency_count(TIER_LIGHT)
+
+    should, stream = classifier.decide_reply([], ["muito obrigado!"])
+    assert should and isinstance(stream, classifier.ReplyStream)
+    assert _latency_count(TIER_LIGHT) == light  # só conta ao fim do stream
+
+    async def consume():
+        return [d async for d in stream.deltas()]
+
+    asyncio.run(consume())
+    assert stream.text == f"resposta do {LIGHT}"
+    assert _latency_count(TIER_LIGHT) == light + 1
+
+
+def test_generate_reply_uses_routed_model(models):
+    assert gemini_client.generate_reply("obrigado", model_name=LIGHT) == f"resposta do {LIGHT}"
+    assert models[LIGHT].calls == 1
+    assert models[STRONG].calls == 0
+
+
+def test_light_model_error_falls_back_to_strong(models):
+    models[LIGHT].fail = True
+    fallbacks = _counter("router.fallback")
+
+    reply = gemini_client.generate_reply("obrigado", model_name=LIGHT)
+
+    assert reply == f"resposta do {STRONG}"
+    assert models[STRONG].calls == 1
+    assert _counter("router.fallback") == fallbacks + 1
+
+
+def test_strong_model_error_has_no_fallback(models):
+    models[STRONG].fail = True
+    fallbacks = _counter("router.fallback")
+
+    assert gemini_client.generate_reply("chegou quebrado", model_name=STRONG) == ""
+    assert models[STRONG].calls == 1
+    assert _counter("router.fallback") == fallbacks
+
+
+def test_stream_falls_back_to_strong(models):
+    models[LIGHT].fail = True
+
+    async def collect():
+        return [p async for p in gemini_client.stream_reply("obrigado", model_name=LIGHT)]
+
+    assert "".join(asyncio.run(collect())) == f"resposta do {STRONG}"